@@ -0,0 +1,69 @@
+# This script measures how long it takes to generate buildbot bridge graphs of growing size.
+# The pushlog and the builders' metadata are replaced with canned values (a pushlog query
+# costs a fixed delay) so we only measure mozci; the time per task should stay flat.
+import time
+
+from argparse import ArgumentParser
+
+from mock import Mock, patch
+
+from mozci.sources import buildbot_bridge
+from mozci.sources.tc import write_task_graph
+
+REPO_URL = 'https://hg.mozilla.org/integration/repo'
+# Seconds each pushlog query takes
+PUSHLOG_DELAY = 0.01
+
+
+def _query_push_by_revision(repo_url, revision, **kwargs):
+    time.sleep(PUSHLOG_DELAY)
+    push = Mock(user='nobody@mozilla.com')
+    push.changesets = [Mock(node='a' * 40)]
+    return push
+
+
+def builders_graph(num_tasks):
+    """Return a graph of one build per 10 tests adding up to num_tasks tasks."""
+    graph = {}
+    for i in range(0, num_tasks, 11):
+        build = 'Platform%d repo build' % i
+        graph[build] = dict(('Platform%d repo opt test suite-%d' % (i, j), None)
+                            for j in range(min(10, num_tasks - i - 1)))
+    return graph
+
+
+def run(sizes, output=None):
+    with patch('mozci.sources.buildbot_bridge.valid_builder', return_value=True), \
+            patch('mozci.sources.buildbot_bridge.get_buildername_metadata',
+                  return_value={'repo_name': 'repo', 'product': 'firefox'}), \
+            patch('mozci.sources.buildbot_bridge.query_repo_url', return_value=REPO_URL), \
+            patch('mozci.sources.tc.query_repo_url', return_value=REPO_URL), \
+            patch('mozci.sources.tc.query_push_by_revision', side_effect=_query_push_by_revision), \
+            patch('mozci.sources.buildbot_bridge.query_push_by_revision',
+                  side_effect=_query_push_by_revision):
+        print '%8s %12s %14s' % ('tasks', 'total (s)', 'per task (ms)')
+        for size in sizes:
+            start = time.time()
+            graph = buildbot_bridge.generate_builders_tc_graph(
+                repo_name='repo',
+                revision='a' * 12,
+                builders_graph=builders_graph(size))
+            if output:
+                with open(output, 'w') as f:
+                    write_task_graph(graph, f)
+            elapsed = time.time() - start
+            print '%8d %12.3f %14.3f' % (
+                len(graph['tasks']), elapsed, 1000 * elapsed / len(graph['tasks']))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000],
+                        help='Number of tasks of each graph.')
+    parser.add_argument('--pushlog-delay', type=float, default=0.01,
+                        help='Seconds each pushlog query takes.')
+    parser.add_argument('--output', type=str,
+                        help='Write the JSON of every graph to this file.')
+    options = parser.parse_args()
+    PUSHLOG_DELAY = options.pushlog_delay
+    run(options.sizes, options.output)
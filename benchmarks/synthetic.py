@@ -0,0 +1,170 @@
+# This module generates synthetic versions of the data mozci works with, at the scale
+# of the production systems:
+#
+# * allthethings.json: every repository has the same platforms; every platform has an
+#   opt and a debug build job, each triggering its own test jobs
+# * the repositories known by Treeherder
+# * the jobs of a push as returned by buildapi's self-serve (query_jobs_schedule())
+# * a day of buildjson (builds-YYYY-MM-DD.js) with the jobs of the pushes among others
+#
+# The data is generated from a seed so runs are comparable.
+import hashlib
+import random
+
+# Statuses used by buildapi's self-serve
+SUCCESS, WARNING, FAILURE = 0, 1, 2
+# Ratio of the test jobs of a push which succeeded; looking at a successful job needs a
+# lookup in buildjson (to know if it was coalesced) which is what dominates the time of
+# determine_missing_jobs(). The other jobs are failures or are pending.
+SUCCESS_RATIO = 0.05
+PENDING_RATIO = 0.05
+# Ratio of successful jobs which were coalesced into a job of another revision
+COALESCED_RATIO = 0.1
+# Seconds since the epoch of the day the jobs completed: 2016-03-01 00:00:00 UTC
+DAY_START = 1456790400
+
+
+def revision(n):
+    return hashlib.sha1(str(n)).hexdigest()
+
+
+def repo_url(repo_name):
+    return 'https://hg.mozilla.org/integration/%s' % repo_name
+
+
+def allthethings(num_builders, num_repos=20, num_platforms=25):
+    """Return allthethings data with about num_builders builders.
+
+    Every repository ('repo0', 'repo1', ...) gets the same number of builders.
+    """
+    # An opt and a debug build job per platform and repository, each with its tests
+    tests_per_build = max(num_builders // (num_repos * num_platforms * 2) - 1, 1)
+    builders = {}
+    schedulers = {}
+    for r in range(num_repos):
+        repo_name = 'repo%d' % r
+        for p in range(num_platforms):
+            platform = 'platform%d' % p
+            for build_type in ('opt', 'debug'):
+                if build_type == 'opt':
+                    build = 'Platform%d %s build' % (p, repo_name)
+                    shortname = '%s-%s' % (repo_name, platform)
+                    trigger = '%s-opt-unittest' % shortname
+                    platform_name = platform
+                else:
+                    build = 'Platform%d %s leak test build' % (p, repo_name)
+                    shortname = '%s-%s-debug' % (repo_name, platform)
+                    trigger = '%s-unittest' % shortname
+                    platform_name = '%s-debug' % platform
+
+                builders[build] = _builder(repo_name, platform_name, shortname, 'build')
+                tests = []
+                for t in range(tests_per_build):
+                    test = 'Platform%d %s %s test suite-%d' % (p, repo_name, build_type, t)
+                    builders[test] = _builder(repo_name, platform_name, shortname, 'test')
+                    tests.append(test)
+
+                schedulers['tests-%s-%s-unittest-7-3600' % (repo_name, platform_name)] = {
+                    'downstream': tests,
+                    'triggered_by': [trigger],
+                }
+
+    return {'builders': builders, 'schedulers': schedulers}
+
+
+def _builder(repo_name, platform_name, shortname, slavebuilddir):
+    return {
+        'properties': {
+            'branch': repo_name,
+            'platform': platform_name,
+            'product': 'firefox',
+            'repo_path': 'integration/%s' % repo_name,
+            'slavebuilddir': slavebuilddir,
+            'stage_platform': platform_name,
+        },
+        'shortname': shortname,
+        'slavebuilddir': slavebuilddir,
+    }
+
+
+def repositories(num_repos=20):
+    """Return the repositories as mozci.repositories.query_repositories() does."""
+    return dict(('repo%d' % r, {
+        'repo': repo_url('repo%d' % r),
+        'graph_branches': ['Repo%d' % r],
+        'repo_type': 'hg',
+    }) for r in range(num_repos))
+
+
+def push_jobs(rev, buildernames, first_request_id, seed=0):
+    """Return the self-serve jobs of a push; one job per builder.
+
+    Build jobs always succeed so their test jobs can be triggered.
+    """
+    rand = random.Random(seed)
+    jobs = []
+    for i, buildername in enumerate(buildernames):
+        request = {
+            'request_id': first_request_id + i,
+            'complete_at': DAY_START + (i * 7) % 86400,
+            'revision': rev,
+        }
+        job = {'buildername': buildername, 'requests': [request]}
+        draw = rand.random()
+        # Pending jobs have no status
+        if buildername.endswith(' build') or draw < SUCCESS_RATIO:
+            job['status'] = SUCCESS
+        elif draw < 1 - PENDING_RATIO:
+            job['status'] = rand.choice((WARNING, FAILURE))
+        if 'status' in job:
+            job['endtime'] = request['complete_at']
+        jobs.append(job)
+
+    return jobs
+
+
+def buildjson_jobs(num_jobs, pushes_jobs, buildernames, seed=0):
+    """Return num_jobs buildjson jobs containing the jobs of pushes_jobs.
+
+    The other jobs are spread among other builders and revisions.
+    """
+    rand = random.Random(seed)
+    jobs = []
+    for job in pushes_jobs:
+        if 'status' not in job:
+            continue
+        request = job['requests'][0]
+        rev = request['revision']
+        if job['status'] == SUCCESS and not job['buildername'].endswith(' build') and \
+                rand.random() < COALESCED_RATIO:
+            rev = revision(-request['request_id'])
+        jobs.append(_buildjson_job(job['buildername'], rev, request['request_id'],
+                                   request['complete_at']))
+
+    other_revisions = [revision(-n) for n in range(1, 200)]
+    request_id = max([len(jobs)] + [j['request_ids'][0] for j in jobs]) + 1
+    while len(jobs) < num_jobs:
+        jobs.append(_buildjson_job(rand.choice(buildernames), rand.choice(other_revisions),
+                                   request_id, DAY_START + rand.randint(0, 86399)))
+        request_id += 1
+
+    rand.shuffle(jobs)
+    return jobs
+
+
+def _buildjson_job(buildername, rev, request_id, endtime):
+    return {
+        'builder_id': hash(buildername) % 100000,
+        'starttime': endtime - 1800,
+        'endtime': endtime,
+        'requesttime': endtime - 2000,
+        'request_ids': [request_id],
+        'result': SUCCESS,
+        'properties': {
+            'buildername': buildername,
+            'revision': rev,
+            'request_ids': [request_id],
+            'packageUrl': 'https://queue.taskcluster.net/%s/target.tar.bz2' % rev[:12],
+            'testsUrl': 'https://queue.taskcluster.net/%s/target.tests.zip' % rev[:12],
+        },
+    }
@@ -0,0 +1,261 @@
+# This script measures the main mozci workflows against synthetic data at the scale of
+# the production systems (see synthetic.py):
+#
+#   python benchmarks/workflows.py --output results.json
+#   python benchmarks/workflows.py --compare results.json
+#
+# The data is loaded into mozci's in-memory caches (allthethings, repositories,
+# buildjson and the jobs of the pushes) and what would reach the network (pushlog,
+# reachability of the build files, buildapi credentials) is replaced with canned
+# values, so we only measure mozci. The results are emitted as JSON; --compare shows
+# how each benchmark changed against the results of a previous run.
+import json
+import platform
+import sys
+import time
+
+from argparse import ArgumentParser
+from timeit import default_timer
+
+from mock import Mock, patch
+
+import synthetic
+
+from mozci import mozci as mozci_module, platforms, repositories
+from mozci.platforms import (
+    build_tests_per_platform_graph,
+    determine_upstream_builder,
+    is_downstream,
+    list_builders,
+)
+from mozci.query_jobs import BuildApi, JOBS_CACHE
+from mozci.sources import allthethings, buildjson
+from mozci.sources.buildbot_bridge import buildbot_graph_builder, generate_builders_tc_graph
+from mozci.utils import authentication
+from mozci.utils.tzone import utc_day
+
+REPO_NAME = 'repo0'
+# Number of query_job_data() lookups we time
+LOOKUPS = 20
+# A benchmark is not repeated once it has run for this many seconds
+MAX_TIME = 30
+
+
+def _query_push_by_revision(repo_url, revision, **kwargs):
+    push = Mock(user='nobody@mozilla.com')
+    push.changesets = [Mock(node=revision)]
+    return push
+
+
+class Workload(object):
+    """The synthetic data the benchmarks run on."""
+
+    def __init__(self, num_builders, jobs_per_day, jobs_per_push, num_pushes):
+        self.allthethings = synthetic.allthethings(num_builders)
+        self.repositories = synthetic.repositories()
+        # The builders scheduled on every push of REPO_NAME; some test jobs are not
+        # scheduled on every push (e.g. because of SETA)
+        repo_builders = sorted(b for b, info in self.allthethings['builders'].iteritems()
+                               if info['properties']['branch'] == REPO_NAME)
+        self.push_builders = [b for b in repo_builders[:jobs_per_push]
+                              if not b.endswith(' suite-0')]
+        self.revisions = [synthetic.revision(n) for n in range(num_pushes)]
+        self.pushes = {}
+        for n, rev in enumerate(self.revisions):
+            self.pushes[rev] = synthetic.push_jobs(
+                rev, self.push_builders, first_request_id=1 + n * len(self.push_builders),
+                seed=n)
+        self.buildjson = synthetic.buildjson_jobs(
+            jobs_per_day, sum(self.pushes.values(), []), list(self.allthethings['builders']))
+        self.buildjson_filename = buildjson.BUILDS_DAY_FILE % utc_day(synthetic.DAY_START)
+        # A push without jobs; every build job has to be triggered
+        self.empty_revision = synthetic.revision(num_pushes)
+        # A test job which did not run but whose build job did
+        self.test_buildername = [b for b in repo_builders if b.endswith(' suite-0')][0]
+
+        self.sizes = {
+            'builders': len(self.allthethings['builders']),
+            'jobs_per_day': len(self.buildjson),
+            'jobs_per_push': len(self.push_builders),
+            'pushes': num_pushes,
+        }
+
+    def load(self):
+        """Fill mozci's caches with the synthetic data."""
+        allthethings.DATA = self.allthethings
+        repositories.REPOSITORIES = self.repositories
+        buildjson.BUILDS_CACHE.clear()
+        buildjson.BUILDS_CACHE[self.buildjson_filename] = self.buildjson
+        JOBS_CACHE.clear()
+        for rev, jobs in self.pushes.iteritems():
+            JOBS_CACHE[(REPO_NAME, rev)] = jobs
+        JOBS_CACHE[(REPO_NAME, self.empty_revision)] = []
+        self.reset()
+
+    def reset(self):
+        """Clear the caches mozci computes from the data."""
+        platforms.SHORTNAME_TO_NAME.clear()
+        platforms.BUILDERNAME_TO_TRIGGER.clear()
+        platforms.BUILD_JOBS.clear()
+        platforms.UPSTREAM_TO_DOWNSTREAM = None
+        mozci_module.VALID_BUILDERS = None
+        mozci_module.BUILD_JOBS_CACHE.clear()
+
+
+def benchmarks(workload):
+    """Return a list of (name, function) to time; each function returns the number of
+    items it handled."""
+    builders = list_builders()
+    downstream = [b for b in builders if is_downstream(b)]
+    lookups = [j['requests'][0] for j in workload.pushes[workload.revisions[0]]
+               if 'status' in j][:LOOKUPS]
+
+    def _list_builders():
+        return len(list_builders())
+
+    def _determine_upstream_builder():
+        for buildername in downstream:
+            determine_upstream_builder(buildername)
+        return len(downstream)
+
+    def _build_tests_per_platform_graph():
+        build_tests_per_platform_graph(builders)
+        return len(builders)
+
+    def _query_job_data():
+        for request in lookups:
+            buildjson.query_job_data(request['complete_at'], request['request_id'])
+        return len(lookups)
+
+    def _determine_missing_jobs():
+        for rev in workload.revisions:
+            BuildApi().determine_missing_jobs(REPO_NAME, rev)
+        return len(workload.revisions)
+
+    def _trigger_range():
+        mozci_module.trigger_range(
+            buildername=workload.test_buildername,
+            revisions=workload.revisions,
+            dry_run=True)
+        return len(workload.revisions)
+
+    def _buildbot_graph_builder():
+        buildbot_graph_builder(workload.push_builders, workload.empty_revision)
+        return len(workload.push_builders)
+
+    builders_graph = []
+
+    def _generate_builders_tc_graph():
+        if not builders_graph:
+            builders_graph.append(
+                buildbot_graph_builder(workload.push_builders, workload.empty_revision)[0])
+        task_graph = generate_builders_tc_graph(
+            repo_name=REPO_NAME,
+            revision=workload.empty_revision,
+            builders_graph=builders_graph[0])
+        return len(task_graph['tasks'])
+
+    return [
+        ('list_builders', _list_builders),
+        ('determine_upstream_builder', _determine_upstream_builder),
+        ('build_tests_per_platform_graph', _build_tests_per_platform_graph),
+        ('query_job_data', _query_job_data),
+        ('determine_missing_jobs', _determine_missing_jobs),
+        ('trigger_range_dry_run', _trigger_range),
+        ('buildbot_graph_builder', _buildbot_graph_builder),
+        ('generate_builders_tc_graph', _generate_builders_tc_graph),
+    ]
+
+
+def _time(workload, func, repeat):
+    """Return the timings of running func up to 'repeat' times; caches are cleared
+    every time."""
+    timings = []
+    while len(timings) < repeat and sum(timings) < MAX_TIME:
+        workload.reset()
+        start = default_timer()
+        items = func()
+        timings.append(default_timer() - start)
+
+    timings.sort()
+    return {
+        'items': items,
+        'repeat': len(timings),
+        'min': timings[0],
+        'median': timings[len(timings) // 2],
+        'max': timings[-1],
+        'per_item': timings[0] / items if items else None,
+    }
+
+
+def run(workload, repeat, only=None):
+    workload.load()
+    results = {}
+    with patch('mozci.mozci.valid_revision', return_value=True), \
+            patch('mozci.mozci._all_urls_reachable', return_value=True), \
+            patch('mozci.mozci._unique_build_request', return_value=True), \
+            patch('mozci.mozci.clean_directory'), \
+            patch('mozci.sources.buildbot_bridge.query_push_by_revision',
+                  side_effect=_query_push_by_revision), \
+            patch.object(authentication, 'AUTH', ('nobody', 'secret')):
+        for name, func in benchmarks(workload):
+            if only and name not in only:
+                continue
+            results[name] = _time(workload, func, repeat)
+            sys.stderr.write('%-32s %10.3f s\n' % (name, results[name]['min']))
+
+    return {
+        'date': int(time.time()),
+        'python': platform.python_version(),
+        'sizes': workload.sizes,
+        'results': results,
+    }
+
+
+def compare(old, new):
+    """Return the lines of a table comparing the best times of two runs."""
+    lines = ['%-32s %10s %10s %8s' % ('benchmark', 'old (s)', 'new (s)', 'ratio')]
+    if old['sizes'] != new['sizes']:
+        lines.append('The runs used different sizes: %s vs %s' % (old['sizes'], new['sizes']))
+    for name in sorted(new['results']):
+        if name not in old['results']:
+            continue
+        before, after = old['results'][name]['min'], new['results'][name]['min']
+        lines.append('%-32s %10.3f %10.3f %8.2f' % (
+            name, before, after, after / before if before else float('inf')))
+    return lines
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--builders', type=int, default=50000,
+                        help='Number of builders in allthethings.')
+    parser.add_argument('--jobs-per-day', type=int, default=200000,
+                        help='Number of jobs in the buildjson file of a day.')
+    parser.add_argument('--jobs-per-push', type=int, default=2000,
+                        help='Number of jobs of each push.')
+    parser.add_argument('--pushes', type=int, default=3,
+                        help='Number of pushes for determine_missing_jobs and trigger_range.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of times each benchmark runs; the best time is used.')
+    parser.add_argument('--only', type=str, nargs='+',
+                        help='Only run these benchmarks.')
+    parser.add_argument('--output', type=str,
+                        help='Write the results to this file instead of stdout.')
+    parser.add_argument('--compare', type=str,
+                        help='Compare the results with the results of a previous run.')
+    options = parser.parse_args()
+
+    workload = Workload(options.builders, options.jobs_per_day, options.jobs_per_push,
+                        options.pushes)
+    results = run(workload, options.repeat, options.only)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        print json.dumps(results, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as f:
+            sys.stderr.write('\n'.join(compare(json.load(f), results)) + '\n')
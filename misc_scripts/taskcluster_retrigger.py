@@ -7,6 +7,7 @@ import logging
 from argparse import ArgumentParser
 
 from mozci.ci_manager import TaskClusterBuildbotManager
+from mozci.sources.tc import configure_clients
 from mozci.utils.log_util import setup_logging
 
 
@@ -22,6 +23,17 @@ def main():
                         dest="dry_run",
                         help="Dry run. No real actions are taken.")
 
+    parser.add_argument("--timeout",
+                        type=int,
+                        dest="timeout",
+                        help="Seconds to wait for TaskCluster to respond.")
+
+    parser.add_argument("--workers",
+                        type=int,
+                        dest="workers",
+                        default=8,
+                        help="Number of tasks fetched (and graphs scheduled) at once.")
+
     parser.add_argument('task_ids',
                         metavar='task_id',
                         type=str,
@@ -35,11 +47,20 @@ def main():
     else:
         LOG = setup_logging()
 
+    if options.timeout:
+        configure_clients(timeout=options.timeout)
+
     sch = TaskClusterBuildbotManager()
+    results = sch.retrigger_many(uuids=options.task_ids, dry_run=options.dry_run,
+                                 workers=options.workers)
+    if results is None or options.dry_run:
+        return
+
     for t_id in options.task_ids:
-        ret_code = sch.retrigger(uuid=t_id, dry_run=options.dry_run)
-        if ret_code < 0:
+        if results[t_id] is None:
             LOG.warning("We could not retrigger task %s" % t_id)
+        else:
+            LOG.info("Task %s was retriggered as %s" % (t_id, results[t_id]))
 
 if __name__ == "__main__":
     main()
@@ -2,3 +2,29 @@
 In mozci you can find modules to deal with the various components
 that Mozilla's CI are comprised of.
 """
+import os
+
+if os.environ.get('MOZCI_FAKE_SERVICES'):
+    # Point mozci at local stand-ins of the services it uses (see fake_services.py)
+    from mozci.fake_services import enable
+    enable(os.environ['MOZCI_FAKE_SERVICES'])
+
+if os.environ.get('MOZCI_CASSETTE'):
+    # Record or replay the HTTP requests of this process (see utils/cassette.py)
+    import atexit
+
+    from mozci.utils.cassette import Cassette
+    _CASSETTE = Cassette(os.environ['MOZCI_CASSETTE'],
+                         mode=os.environ.get('MOZCI_CASSETTE_MODE', 'replay'),
+                         latency=os.environ.get('MOZCI_CASSETTE_LATENCY', 'original'))
+    _CASSETTE.start()
+    atexit.register(_CASSETTE.stop)
+
+if os.environ.get('MOZCI_METRICS'):
+    # Measure the HTTP calls of this process and write the metrics at exit (see
+    # utils/metrics.py)
+    import atexit
+
+    from mozci.utils import metrics
+    metrics.instrument_http()
+    atexit.register(metrics.REGISTRY.write, os.environ['MOZCI_METRICS'])
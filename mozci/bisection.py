@@ -0,0 +1,258 @@
+"""
+This module backfills a failing job by bisecting the revisions instead of triggering all of them.
+
+Backfilling triggers a job on every revision between a failing job and the last
+successful job. Bisecting triggers the job on the revision in the middle of the
+range, waits for its result and keeps the half of the range where the job started
+failing; we find the culprit with log2(N) jobs instead of N.
+
+The state of a bisection is stored as JSON under ~/.mozilla/mozci so it can be
+resumed by later runs (results can take hours to come); it is removed once the
+bisection is done or failed.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import re
+import time
+
+from mozci.mozci import (
+    _filter_backfill_revlist,
+    _find_build_job,
+    query_job_statuses,
+    query_repo_name_from_buildername,
+    query_repo_url_from_buildername,
+    trigger_range,
+)
+from mozci.platforms import determine_upstream_builder
+from mozci.query_jobs import (
+    EXCEPTION,
+    FAILURE,
+    PENDING,
+    RETRY,
+    RUNNING,
+    SUCCESS,
+    UNKNOWN,
+    WARNING,
+)
+from mozci.sources.pushlog import query_pushes_by_specified_revision_range
+from mozci.utils.polling import PollSchedule, poll_until_done
+from mozci.utils.transfer import path_to_file
+
+LOG = logging.getLogger('mozci')
+# States of a bisection
+SEARCHING, DONE, FAILED = 'searching', 'done', 'failed'
+# Results of a job on a revision
+GOOD, BAD, WAITING, NO_RESULT = 'good', 'bad', 'waiting', 'no result'
+# Number of times we trigger a job on a revision before giving up on the bisection
+MAX_ATTEMPTS = 3
+
+
+def _state_path(repo_name, revision, buildername):
+    name = re.sub(r'[^A-Za-z0-9]+', '_', buildername)
+    return path_to_file('bisection-%s-%s-%s.json' % (repo_name, revision[:12], name))
+
+
+def job_result(repo_name, revision, buildername):
+    """Return GOOD, BAD, WAITING or NO_RESULT for the jobs of buildername on a revision.
+
+    Any successful job is enough for the revision to be good.
+    """
+    statuses = query_job_statuses(repo_name, revision, buildername)
+    if SUCCESS in statuses:
+        return GOOD
+    if FAILURE in statuses or WARNING in statuses:
+        return BAD
+    if any(s in (PENDING, RUNNING, UNKNOWN, RETRY) for s in statuses):
+        return WAITING
+    return NO_RESULT
+
+
+def build_running(repo_name, revision, buildername):
+    """Return True if the build job buildername needs is pending or running on a revision."""
+    build_buildername = determine_upstream_builder(buildername)
+    if build_buildername == buildername:
+        return False
+
+    build_info = _find_build_job(repo_name, revision, build_buildername)
+    return bool(build_info['running_job']) and not build_info['working_job']
+
+
+class Bisection(object):
+    """Bisect 'revisions' (oldest first) between a good first and a bad last revision."""
+
+    def __init__(self, repo_name, buildername, revisions, path=None):
+        assert len(revisions) >= 2
+        self.repo_name = repo_name
+        self.buildername = buildername
+        self.revisions = revisions
+        self.path = path
+        # Indexes of the newest good revision and of the oldest bad revision
+        self.good = 0
+        self.bad = len(revisions) - 1
+        # Index of the revision we're waiting a result for
+        self.testing = None
+        # Number of times we triggered the job and its build job on that revision
+        self.attempts = 0
+        self.build_attempts = 0
+        self.state = SEARCHING
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        bisection = cls(data['repo_name'], data['buildername'], data['revisions'], path)
+        for key in ('good', 'bad', 'testing', 'attempts', 'build_attempts', 'state'):
+            setattr(bisection, key, data[key])
+        return bisection
+
+    def save(self):
+        data = dict((key, getattr(self, key)) for key in (
+            'repo_name', 'buildername', 'revisions', 'good', 'bad', 'testing', 'attempts',
+            'build_attempts', 'state'))
+        # Write and rename to not leave a truncated file behind
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, self.path)
+
+    @property
+    def culprit(self):
+        """The first bad revision once the bisection is done."""
+        return self.revisions[self.bad] if self.state == DONE else None
+
+    def step(self, dry_run=False, extra_properties=None):
+        """Move the bisection forward as far as the known job results allow.
+
+        We trigger the job on the revision being tested if it has no result; if the
+        revision has no build we trigger the build first and wait for it.
+        Returns the state of the bisection.
+        """
+        while self.state == SEARCHING:
+            if self.bad - self.good <= 1:
+                self.state = DONE
+                LOG.info("Bisection of '%s': the first bad revision is %s." %
+                         (self.buildername, self.culprit))
+                break
+
+            if self.testing is None:
+                self.testing = (self.good + self.bad) // 2
+                self.attempts = 0
+                self.build_attempts = 0
+
+            revision = self.revisions[self.testing]
+            result = job_result(self.repo_name, revision, self.buildername)
+            LOG.info("Bisection of '%s': %d revisions left; %s is %s." %
+                     (self.buildername, self.bad - self.good - 1, revision, result))
+
+            if result == GOOD:
+                self.good = self.testing
+            elif result == BAD:
+                self.bad = self.testing
+            elif result == WAITING:
+                return self.state
+            elif build_running(self.repo_name, revision, self.buildername):
+                LOG.info("Bisection of '%s': we are waiting for the build of %s." %
+                         (self.buildername, revision))
+                return self.state
+            elif self.attempts >= MAX_ATTEMPTS or self.build_attempts >= MAX_ATTEMPTS:
+                LOG.warning("We could not get a result for '%s' on %s after %d attempts. "
+                            "We stop bisecting." % (self.buildername, revision,
+                                                    self.attempts + self.build_attempts))
+                self.state = FAILED
+                break
+            else:
+                # Jobs which hit an exception would satisfy trigger_range()
+                statuses = query_job_statuses(self.repo_name, revision, self.buildername)
+                plan = trigger_range(
+                    buildername=self.buildername,
+                    revisions=[revision],
+                    times=statuses.count(EXCEPTION) + 1,
+                    dry_run=dry_run,
+                    extra_properties=extra_properties)
+                # Revisions without a build (SETA, coalescing) need one before the job
+                if not dry_run and plan.build_then_test:
+                    self.build_attempts += 1
+                elif not dry_run:
+                    self.attempts += 1
+                return self.state
+
+            self.testing = None
+
+        return self.state
+
+
+def bisect_backfill(buildername, revision, max_revisions, dry_run=False, timeout=0):
+    """Find the revision where buildername started failing by bisecting.
+
+    We look for the last successful job of buildername in the max_revisions revisions
+    before 'revision'; 'revision' is expected to have a failing job.
+    A bisection started by a previous run is resumed. We poll for job results for at
+    most timeout seconds; run it again to continue the bisection.
+
+    Returns the Bisection or None if there is nothing to bisect.
+    """
+    repo_name = query_repo_name_from_buildername(buildername)
+    path = _state_path(repo_name, revision, buildername)
+    LOG.info("BISECTION-START:%s_%s begins." % (revision[0:8], buildername))
+
+    if os.path.exists(path):
+        bisection = Bisection.load(path)
+        LOG.info("We are resuming the bisection stored in %s." % path)
+    else:
+        revlist = query_pushes_by_specified_revision_range(
+            repo_url=query_repo_url_from_buildername(buildername),
+            revision=revision,
+            before=max_revisions,
+            after=0,
+            return_revision_list=True
+        )
+        new_revlist = _filter_backfill_revlist(buildername, revlist, only_successful=True)
+        if not new_revlist:
+            # e.g. an intermittent failure which was retriggered green
+            LOG.info("BISECTION-END:%s_%s has a successful job; there is nothing to bisect." %
+                     (revision[0:8], buildername))
+            return None
+        if len(new_revlist) == len(revlist):
+            # It is likely that we are facing a long lived permanent failure
+            LOG.info("BISECTION-END:%s_%s there is no successful job to bisect from." %
+                     (revision[0:8], buildername))
+            return None
+
+        # Newest first to oldest first; the last successful revision goes first
+        bisection = Bisection(repo_name, buildername,
+                              list(reversed(revlist[:len(new_revlist) + 1])), path)
+
+    extra_properties = {
+        'mozci_request': {
+            'type': 'bisection',
+            'builders': [buildername]}
+    }
+    if dry_run:
+        bisection.step(dry_run=True, extra_properties=extra_properties)
+        return bisection
+
+    # We wait longer and longer between steps while we're waiting for a job
+    schedule = PollSchedule()
+
+    def _poll():
+        state = bisection.step(extra_properties=extra_properties)
+        bisection.save()
+        schedule.backoff(path, time.time())
+        return 1 if state == SEARCHING else 0
+
+    poll_until_done(_poll, schedule, timeout)
+
+    if bisection.state == SEARCHING:
+        LOG.info("BISECTION-END:%s_%s is waiting for %s; run it again to continue." %
+                 (revision[0:8], buildername, bisection.revisions[bisection.testing]))
+    else:
+        LOG.info("BISECTION-END:%s_%s %s: %s" %
+                 (revision[0:8], buildername, bisection.state, bisection.culprit))
+        # A later run starts a new bisection
+        os.remove(path)
+
+    return bisection
@@ -0,0 +1,277 @@
+"""
+This module triggers test jobs once the build jobs they need are done.
+
+When a test job needs a build job which does not exist yet, execute_plan() can only
+request the build job. A BuildWatcher keeps the test jobs waiting for it in a local
+queue (an sqlite database under ~/.mozilla/mozci) and polls the builds:
+
+* Every build of a revision is checked with a single query of the revision's jobs
+* Revisions whose builds are still running are polled less and less often
+* Once the files of a build are reachable we trigger the queued test jobs
+* If a build finishes without files (or takes too long) its test jobs are dropped
+* A test job stays queued until its request succeeds
+
+The queue is persistent; a later run of BuildWatcher.run() picks up where a previous
+one stopped. Many watchers can share it; each poll claims the test jobs it looks at
+so they are not triggered twice.
+"""
+from __future__ import absolute_import
+
+import functools
+import json
+import logging
+import sqlite3
+import time
+
+from mozci.mozci import (
+    _find_build_job,
+    _queue_trigger,
+    invalidate_job_caches,
+)
+from mozci.request_coalescer import RequestCoalescer
+from mozci.utils.polling import (
+    MAX_POLL_INTERVAL,
+    MIN_POLL_INTERVAL,
+    PollSchedule,
+    poll_until_done,
+)
+from mozci.utils.sqlite_store import SqliteStore
+from mozci.utils.transfer import path_to_file
+
+LOG = logging.getLogger('mozci')
+PENDING_TESTS_DB = path_to_file('pending_tests.db')
+# Seconds after which we give up on a build
+BUILD_TIMEOUT = 6 * 60 * 60
+# Seconds after which the claim of a watcher which did not finish its poll expires
+CLAIM_TTL = 10 * 60
+
+
+class PendingTestQueue(SqliteStore):
+    """Test jobs waiting for a build job on a revision."""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS pending_tests ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+        'repo_name TEXT, revision TEXT, build_buildername TEXT, '
+        'test_buildername TEXT, times INTEGER, extra_properties TEXT, '
+        'queued_at REAL, claimed_at REAL)',
+    )
+
+    def __init__(self, path=PENDING_TESTS_DB):
+        super(PendingTestQueue, self).__init__(path)
+
+    def add(self, repo_name, revision, build_buildername, test_buildername, times,
+            extra_properties=None):
+        """Queue 'times' jobs of test_buildername to trigger after build_buildername."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT INTO pending_tests (repo_name, revision, build_buildername, '
+                'test_buildername, times, extra_properties, queued_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (repo_name, revision, build_buildername, test_buildername, times,
+                 json.dumps(extra_properties), time.time()))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _entries(rows):
+        entries = []
+        for row in rows:
+            entry = dict(zip(row.keys(), row))
+            entry['extra_properties'] = json.loads(entry['extra_properties'])
+            entries.append(entry)
+        return entries
+
+    def pending(self):
+        """Return every queued test job as a dictionary."""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute('SELECT * FROM pending_tests ORDER BY id').fetchall()
+        finally:
+            conn.close()
+
+        return self._entries(rows)
+
+    def claim(self, ttl=CLAIM_TTL):
+        """Claim and return the queued test jobs no other watcher is looking at.
+
+        This is atomic across processes. Claims older than ttl seconds are taken over.
+        The caller has to remove() or release() every test job it claimed.
+        """
+        now = time.time()
+        with self.transaction(row_factory=sqlite3.Row) as conn:
+            rows = conn.execute(
+                'SELECT * FROM pending_tests WHERE claimed_at IS NULL OR claimed_at <= ? '
+                'ORDER BY id', (now - ttl,)).fetchall()
+            conn.executemany('UPDATE pending_tests SET claimed_at = ? WHERE id = ?',
+                             [(now, row['id']) for row in rows])
+
+        return self._entries(rows)
+
+    def release(self, ids):
+        """Let other watchers claim these test jobs again."""
+        if not ids:
+            return
+
+        conn = self._connect()
+        try:
+            conn.executemany('UPDATE pending_tests SET claimed_at = NULL WHERE id = ?',
+                             [(i,) for i in ids])
+        finally:
+            conn.close()
+
+    def remove(self, ids):
+        """Remove the queued test jobs with these ids."""
+        if not ids:
+            return
+
+        conn = self._connect()
+        try:
+            conn.executemany('DELETE FROM pending_tests WHERE id = ?', [(i,) for i in ids])
+        finally:
+            conn.close()
+
+    def __len__(self):
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM pending_tests').fetchone()[0]
+        finally:
+            conn.close()
+
+
+class BuildWatcher(object):
+    """Trigger the test jobs of a TriggerPlan once their build jobs are done."""
+
+    def __init__(self, queue=None, min_interval=MIN_POLL_INTERVAL,
+                 max_interval=MAX_POLL_INTERVAL, timeout=BUILD_TIMEOUT, rate_limit=None):
+        self.queue = queue if queue is not None else PendingTestQueue()
+        self.timeout = timeout
+        self.rate_limit = rate_limit
+        # (repo_name, revision) -> when to poll it; the interval grows while builds run
+        self._schedule = PollSchedule(min_interval, max_interval)
+
+    def defer(self, plan, extra_properties=None):
+        """Queue the test jobs of the BuildThenTest entries of a TriggerPlan."""
+        for entry in plan.build_then_test:
+            LOG.info("'%s' will be triggered %d time(s) on %s once '%s' is done." %
+                     (entry.test_buildername, entry.times, entry.revision,
+                      entry.build_buildername))
+            self.queue.add(
+                repo_name=entry.repo_name,
+                revision=entry.revision,
+                build_buildername=entry.build_buildername,
+                test_buildername=entry.test_buildername,
+                times=entry.times,
+                extra_properties=extra_properties)
+
+    def _poll_revision(self, repo_name, revision, build_buildernames):
+        """Return the information of _find_build_job() for every build of a revision."""
+        # Query the jobs of the revision once and share them for every build
+        invalidate_job_caches(repo_name, revision)
+
+        return dict(
+            (build_buildername, _find_build_job(repo_name, revision, build_buildername))
+            for build_buildername in build_buildernames)
+
+    def poll(self, now=None):
+        """Check the builds of every revision which is due and trigger what we can.
+
+        Test jobs whose requests fail stay queued for a later poll.
+        Returns the number of test jobs still waiting.
+        """
+        now = now if now is not None else time.time()
+        claimed = self.queue.claim()
+        by_revision = {}
+        for entry in claimed:
+            by_revision.setdefault((entry['repo_name'], entry['revision']), []).append(entry)
+
+        coalescer = RequestCoalescer(rate_limit=self.rate_limit)
+        done = []
+        # Test jobs we requested -> their revision
+        requested = {}
+        failed = set()
+        sent = False
+        waiting = 0
+        try:
+            for key in sorted(by_revision):
+                entries = by_revision[key]
+                if not self._schedule.due(key, now):
+                    waiting += len(entries)
+                    continue
+
+                repo_name, revision = key
+                builds = self._poll_revision(
+                    repo_name, revision, set(e['build_buildername'] for e in entries))
+
+                still_running = False
+                for entry in entries:
+                    build_info = builds[entry['build_buildername']]
+                    if build_info['working_job']:
+                        LOG.info("The build '%s' on %s is done. We will trigger '%s' %d "
+                                 "time(s)." % (entry['build_buildername'], revision,
+                                               entry['test_buildername'], entry['times']))
+                        files = build_info['files']
+                        _queue_trigger(coalescer, entry['test_buildername'], revision,
+                                       [files['packageUrl'], files['testsUrl']],
+                                       entry['times'], entry['extra_properties'],
+                                       on_failure=functools.partial(failed.add, entry['id']))
+                        requested[entry['id']] = key
+                    elif build_info['failed_job'] and not build_info['running_job']:
+                        LOG.warning("The build '%s' on %s failed without generating the "
+                                    "files needed by '%s'. We will not trigger it." %
+                                    (entry['build_buildername'], revision,
+                                     entry['test_buildername']))
+                        done.append(entry['id'])
+                    elif now - entry['queued_at'] > self.timeout:
+                        LOG.warning("We gave up waiting for '%s' on %s; '%s' will not be "
+                                    "triggered." % (entry['build_buildername'], revision,
+                                                    entry['test_buildername']))
+                        done.append(entry['id'])
+                    else:
+                        still_running = True
+                        waiting += 1
+
+                if still_running:
+                    self._schedule.backoff(key, now)
+                else:
+                    self._schedule.remove(key)
+
+            # Every request has succeeded or failed once flush() returns or raises
+            sent = True
+            coalescer.flush()
+        finally:
+            if failed:
+                LOG.warning("%d test job request(s) failed; we will try again later." %
+                            len(failed))
+            retry = set()
+            for entry_id, key in requested.iteritems():
+                if sent and entry_id not in failed:
+                    done.append(entry_id)
+                else:
+                    retry.add(key)
+                    waiting += 1
+            for key in retry:
+                self._schedule.backoff(key, now)
+            self.queue.remove(done)
+            done = set(done)
+            self.queue.release([e['id'] for e in claimed if e['id'] not in done])
+
+        return waiting
+
+    def run(self, timeout=None):
+        """Poll until no test job is waiting or for at most timeout seconds."""
+        def _poll():
+            waiting = self.poll()
+            if waiting:
+                LOG.info("%d test job(s) are waiting for their build jobs." % waiting)
+            return waiting
+
+        waiting = poll_until_done(_poll, self._schedule, timeout)
+        if waiting:
+            LOG.info("%d test job(s) are still waiting for their build jobs. "
+                     "Run the watcher again to trigger them." % waiting)
+        else:
+            LOG.info("No test jobs are waiting for a build job.")
+        return waiting
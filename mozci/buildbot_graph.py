@@ -0,0 +1,205 @@
+"""
+This module contains BuildbotGraph, a graph of Buildbot builders to trigger on revisions.
+
+buildbot_graph_builder() returns graphs as nested dictionaries (see issue 353):
+
+    {'Build builder': {'Test builder 1': None, 'Test builder 2': None}}
+
+A BuildbotGraph holds the builders of any number of revisions. Every node is a
+(revision, buildername) pair with at most one parent (the job which triggers it).
+Buildernames and revisions are interned to integer ids and the nodes are stored
+in arrays, so adding, merging and looking up nodes does not copy dictionaries.
+
+The Buildbot bridge turns a BuildbotGraph into TaskCluster tasks
+(see mozci.sources.buildbot_bridge).
+"""
+from __future__ import absolute_import
+
+import logging
+
+from array import array
+from collections import deque
+
+from mozci.errors import MozciError
+from mozci.platforms import get_buildername_metadata
+
+LOG = logging.getLogger('mozci')
+# Parent of nodes without a parent
+NO_PARENT = -1
+
+
+class BuildbotGraph(object):
+    """Graph of (revision, buildername) nodes where each node has at most one parent."""
+
+    def __init__(self):
+        self.buildernames = []
+        self.revisions = []
+        self._builder_ids = {}
+        self._revision_ids = {}
+        # Indexed by node id
+        self._node_builder = array('i')
+        self._node_revision = array('i')
+        self._parent = array('i')
+        self._children = []
+        # Indexed by revision id
+        self._revision_nodes = []
+        # (revision id, builder id) -> node id
+        self._node_ids = {}
+
+    @classmethod
+    def from_dict(cls, builders_graph, revision):
+        """Return the BuildbotGraph of a graph returned by buildbot_graph_builder()."""
+        graph = cls()
+        graph.add_dict(builders_graph, revision)
+        return graph
+
+    def _intern(self, value, values, ids):
+        if value not in ids:
+            ids[value] = len(values)
+            values.append(value)
+        return ids[value]
+
+    def __len__(self):
+        return len(self._parent)
+
+    def __contains__(self, node):
+        revision, buildername = node
+        return self.node_id(revision, buildername) is not None
+
+    def node_id(self, revision, buildername):
+        """Return the id of a node or None if it is not in the graph."""
+        revision_id = self._revision_ids.get(revision)
+        builder_id = self._builder_ids.get(buildername)
+        if revision_id is None or builder_id is None:
+            return None
+        return self._node_ids.get((revision_id, builder_id))
+
+    def node(self, node_id):
+        """Return the (revision, buildername) of a node id."""
+        return (self.revisions[self._node_revision[node_id]],
+                self.buildernames[self._node_builder[node_id]])
+
+    def parent(self, node_id):
+        """Return the node id of the parent of a node or None."""
+        parent = self._parent[node_id]
+        return None if parent == NO_PARENT else parent
+
+    def children(self, node_id):
+        return list(self._children[node_id])
+
+    def node_ids(self, revision=None):
+        """Return the ids of the nodes of a revision (of every revision by default)."""
+        if revision is None:
+            return range(len(self))
+
+        revision_id = self._revision_ids.get(revision)
+        return [] if revision_id is None else list(self._revision_nodes[revision_id])
+
+    def roots(self, revision=None):
+        return [n for n in self.node_ids(revision) if self._parent[n] == NO_PARENT]
+
+    def add(self, buildername, revision, parent=None):
+        """Add a node (if it is not already in the graph) and return its id.
+
+        parent is the buildername of the job which triggers buildername on the same
+        revision; it has to be in the graph already.
+        """
+        parent_id = NO_PARENT
+        if parent is not None:
+            parent_id = self.node_id(revision, parent)
+            if parent_id is None:
+                raise MozciError("%s is not in the graph for %s." % (parent, revision))
+
+        key = (self._intern(revision, self.revisions, self._revision_ids),
+               self._intern(buildername, self.buildernames, self._builder_ids))
+        node_id = self._node_ids.get(key)
+        if node_id is None:
+            node_id = self._node_ids[key] = len(self)
+            self._node_revision.append(key[0])
+            self._node_builder.append(key[1])
+            self._parent.append(NO_PARENT)
+            self._children.append(array('i'))
+            if key[0] == len(self._revision_nodes):
+                self._revision_nodes.append(array('i'))
+            self._revision_nodes[key[0]].append(node_id)
+
+        if parent_id != NO_PARENT and self._parent[node_id] != parent_id:
+            if self._parent[node_id] != NO_PARENT:
+                raise MozciError("%s already has a parent for %s." % (buildername, revision))
+            self._parent[node_id] = parent_id
+            self._children[parent_id].append(node_id)
+
+        return node_id
+
+    def add_dict(self, builders_graph, revision):
+        """Add the nodes of a graph returned by buildbot_graph_builder()."""
+        # We walk the graph with a stack instead of recursing; deep graphs would
+        # otherwise hit the recursion limit
+        stack = [(None, builders_graph)]
+        while stack:
+            parent, graph = stack.pop()
+            if type(graph) != dict:
+                raise MozciError("The buildbot graph should be a dictionary")
+
+            for buildername, dependent_graph in graph.iteritems():
+                self.add(buildername, revision, parent)
+                if dependent_graph:
+                    stack.append((buildername, dependent_graph))
+
+    def merge(self, other):
+        """Add the nodes of another BuildbotGraph; nodes in both graphs are added once."""
+        for node_id in other.topological_order():
+            revision, buildername = other.node(node_id)
+            parent = other.parent(node_id)
+            self.add(buildername, revision,
+                     None if parent is None else other.node(parent)[1])
+
+    def topological_order(self, revision=None):
+        """Return the node ids (of a revision) ordered so parents come before their children.
+
+        Raises MozciError if the graph has a cycle.
+        """
+        order = []
+        queue = deque(self.roots(revision))
+        while queue:
+            node_id = queue.popleft()
+            order.append(node_id)
+            queue.extend(self._children[node_id])
+
+        if len(order) != len(self.node_ids(revision)):
+            raise MozciError("The graph has a cycle.")
+        return order
+
+    def to_dict(self, revision):
+        """Return the nodes of a revision as buildbot_graph_builder() would."""
+        graph = {}
+        # node id -> dictionary of the builders it triggers (None if there are none)
+        subgraphs = {}
+        for node_id in self.topological_order(revision):
+            parent = self.parent(node_id)
+            builders = graph if parent is None else subgraphs[parent]
+            subgraphs[node_id] = {} if self._children[node_id] else None
+            builders[self.node(node_id)[1]] = subgraphs[node_id]
+
+        return graph
+
+    def validate(self, revision=None):
+        """Raise MozciError if the graph (of a revision) has a cycle or a job triggered
+        by a job of another platform."""
+        platforms = {}
+
+        def _platform(buildername):
+            if buildername not in platforms:
+                platforms[buildername] = get_buildername_metadata(buildername)['platform_name']
+            return platforms[buildername]
+
+        for node_id in self.topological_order(revision):
+            parent = self.parent(node_id)
+            if parent is None:
+                continue
+
+            buildername = self.node(node_id)[1]
+            parent_buildername = self.node(parent)[1]
+            if _platform(buildername) != _platform(parent_buildername):
+                raise MozciError("%s cannot be triggered by %s; they are for different "
+                                 "platforms." % (buildername, parent_buildername))
@@ -19,14 +19,17 @@ from buildapi_client import (
     trigger_arbitrary_job
 )
 
+from mozci.buildbot_graph import BuildbotGraph
 from mozci.platforms import list_builders
 from mozci.sources import (
     buildbot_bridge,
     tc
 )
-from mozci.mozci import trigger_range
+from mozci.mozci import execute_plan, plan_triggers, trigger_range
 from mozci.query_jobs import BuildApi
 from mozci.utils.authentication import get_credentials
+from mozci.utils.parallel import parallel_map
+from mozci.utils.profiler import span
 
 
 class BaseCIManager:
@@ -56,7 +59,7 @@ class BaseCIManager:
 
     @abstractmethod
     def trigger_range(self, buildername, repo_name, revisions, times, dry_run, files,
-                      trigger_build_if_missing):
+                      trigger_build_if_missing, workers=1, rate_limit=None, watcher=None):
         pass
 
 # End of BaseCIManager
@@ -107,29 +110,34 @@ class BuildAPIManager(BaseCIManager):
         """
         builders_for_repo = list_builders(repo_name=repo_name)
 
-        for buildername in builders_for_repo:
-            trigger_range(
-                buildername=buildername,
-                revisions=[revision],
-                times=1,
-                dry_run=dry_run,
-                extra_properties={
-                    'mozci_request': {
-                        'type': 'trigger_missing_jobs_for_revision'
-                    }
-                },
-                trigger_build_if_missing=trigger_build_if_missing
-            )
+        plan = plan_triggers(
+            buildernames=builders_for_repo,
+            revisions=[revision],
+            times=1,
+            trigger_build_if_missing=trigger_build_if_missing
+        )
+        execute_plan(
+            plan=plan,
+            dry_run=dry_run,
+            extra_properties={
+                'mozci_request': {
+                    'type': 'trigger_missing_jobs_for_revision'
+                }
+            }
+        )
 
     def trigger_range(self, buildername, repo_name, revisions, times, dry_run, files,
-                      trigger_build_if_missing):
+                      trigger_build_if_missing, workers=1, rate_limit=None, watcher=None):
         trigger_range(
             buildername=buildername,
             revisions=revisions,
             times=times,
             dry_run=dry_run,
             files=files,
-            trigger_build_if_missing=trigger_build_if_missing
+            trigger_build_if_missing=trigger_build_if_missing,
+            workers=workers,
+            rate_limit=rate_limit,
+            watcher=watcher
         )
 
 # End of BuildAPIManager
@@ -149,6 +157,9 @@ class TaskClusterManager(BaseCIManager):
     def retrigger(self, uuid, *args, **kwargs):
         return tc.retrigger_task(task_id=uuid, *args, **kwargs)
 
+    def retrigger_many(self, uuids, *args, **kwargs):
+        return tc.retrigger_tasks(task_ids=uuids, *args, **kwargs)
+
     def cancel(self, uuid, *args, **kwargs):
         pass
 
@@ -156,14 +167,22 @@ class TaskClusterManager(BaseCIManager):
         pass
 
     def trigger_range(self, buildername, repo_name, revisions, times, dry_run, files,
-                      trigger_build_if_missing):
+                      trigger_build_if_missing, workers=1, rate_limit=None, watcher=None):
         pass
 
 # End of TaskClusterManager
 
 
 class TaskClusterBuildbotManager(TaskClusterManager):
-    """ It is similar to the TaskClusterManager but it can only schedule buildbot jobs."""
+    """ It is similar to the TaskClusterManager but it can only schedule buildbot jobs.
+
+    With combine_revisions, trigger_range() merges the builders of every revision into
+    one BuildbotGraph and schedules it in as few graphs as possible instead of one
+    graph per revision.
+    """
+
+    def __init__(self, combine_revisions=False):
+        self.combine_revisions = combine_revisions
 
     def schedule_graph(self, repo_name, revision, builders_graph, *args, **kwargs):
         """ It schedules a task graph for buildbot jobs through TaskCluster.
@@ -182,7 +201,7 @@ class TaskClusterBuildbotManager(TaskClusterManager):
         :param builders_graph: It is a graph made up of a dictionary where each
                                key is a Buildbot buildername. The values to each
                                key are lists of builders (or empty list for build
-                               jobs without test jobs).
+                               jobs without test jobs). It can also be a BuildbotGraph.
         :type builders_graph: dict
         :returns: None or a valid taskcluster task graph.
         :rtype: dict
@@ -225,17 +244,41 @@ class TaskClusterBuildbotManager(TaskClusterManager):
             )
 
     def trigger_range(self, buildername, repo_name, revisions, times, dry_run, files,
-                      trigger_build_if_missing):
-        for revision in revisions:
-            builder_graph, trigger_with_buildapi = buildbot_bridge.buildbot_graph_builder(
-                builders=[buildername],
-                revision=revision,
-                complete=False  # XXX: This can be removed when BBB is in use
-            )
-            self.schedule_graph(
+                      trigger_build_if_missing, workers=1, rate_limit=None, watcher=None):
+        if self.combine_revisions:
+            def _revision_graph(revision):
+                return BuildbotGraph.from_dict(buildbot_bridge.buildbot_graph_builder(
+                    builders=[buildername],
+                    revision=revision,
+                    complete=False  # XXX: This can be removed when BBB is in use
+                )[0], revision)
+
+            # Every revision needs its own queries; we can make them at once
+            buildbot_graph = BuildbotGraph()
+            for revision_graph in parallel_map(_revision_graph, revisions, workers):
+                buildbot_graph.merge(revision_graph)
+
+            task_graphs = buildbot_bridge.generate_range_tc_graphs(
                 repo_name=repo_name,
-                revision=revision,
-                builders_graph=builder_graph,
-                dry_run=dry_run
+                buildbot_graph=buildbot_graph
             )
+            schedule_graph = super(TaskClusterBuildbotManager, self).schedule_graph
+            # The graphs are independent of each other
+            return parallel_map(lambda task_graph: schedule_graph(task_graph=task_graph,
+                                                                  dry_run=dry_run),
+                                task_graphs, workers)
+
+        for revision in revisions:
+            with span('revision', builder=buildername, revision=revision):
+                builder_graph, trigger_with_buildapi = buildbot_bridge.buildbot_graph_builder(
+                    builders=[buildername],
+                    revision=revision,
+                    complete=False  # XXX: This can be removed when BBB is in use
+                )
+                self.schedule_graph(
+                    repo_name=repo_name,
+                    revision=revision,
+                    builders_graph=builder_graph,
+                    dry_run=dry_run
+                )
 # End of TaskClusterBuildbotManager
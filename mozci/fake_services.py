@@ -0,0 +1,399 @@
+"""
+This module contains local stand-ins for the services mozci talks to.
+
+FakeServices is an HTTP server implementing the endpoints mozci uses of:
+
+* hg.mozilla.org: the json-pushes pushlog
+* buildapi self-serve: the jobs of a revision, triggering, retriggering and cancelling
+* treeherder.mozilla.org: repositories, resultsets, jobs and artifacts
+* builddata.pub.build.mozilla.org: buildjson files
+* TaskCluster: the scheduler (task graphs) and the queue (tasks)
+* any other file given in the fixtures (e.g. allthethings.json)
+
+The data served comes from a fixtures file (see load_fixtures()) and from what
+mozci schedules. Every request can be delayed and can fail with a 503 at random
+(seeded, so runs are reproducible).
+
+enable() points mozci at a running server: requests to any other host are sent to
+the server with the host as the first part of the path. Setting the environment
+variable MOZCI_FAKE_SERVICES to the URL of a server does the same when mozci is
+imported. To start a server:
+
+    python -m mozci.fake_services --fixtures fixtures.json --latency 0.05
+"""
+from __future__ import absolute_import
+
+import gzip
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urlparse
+
+from argparse import ArgumentParser
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import Counter
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+
+import requests
+
+LOG = logging.getLogger('mozci')
+SELFSERVE = 'secure.pub.build.mozilla.org/buildapi/self-serve'
+BUILDJSON = 'builddata.pub.build.mozilla.org/builddata/buildjson'
+# Number of pushes json-pushes returns when no range is given
+LATEST_PUSHES = 10
+# URL of the server enable() sends requests to
+FAKE_SERVICES_URL = None
+# The send() of the adapter enable() replaced; disable() puts it back
+_PREVIOUS_SEND = None
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeServices(object):
+    """Serve the data of fixtures through the endpoints mozci uses.
+
+    latency (seconds) and failure_rate (0 to 1) can be a number or a dictionary of
+    host -> number.
+    """
+
+    def __init__(self, fixtures=None, latency=0, failure_rate=0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        # Number of requests received per host
+        self.requests = Counter()
+        # repo url (without scheme) -> push id -> {'date', 'user', 'changesets'}
+        self.pushes = {}
+        # repo name -> revision -> jobs of query_jobs_schedule()
+        self.buildapi_jobs = {}
+        # The buildapi requests mozci made: (method, path, data)
+        self.buildapi_requests = []
+        self.treeherder = {'repositories': [], 'resultsets': {}, 'jobs': {}, 'artifacts': {}}
+        # buildjson filename (without .gz) -> contents
+        self.buildjson = {}
+        # path (host included) -> contents of any other file
+        self.files = {}
+        self.tasks = {}
+        # task graph id -> {'state', 'tasks'}
+        self.task_graphs = {}
+        if fixtures:
+            self.load_fixtures(fixtures)
+
+    def load_fixtures(self, path):
+        """Load data from a JSON file with any of these keys:
+
+        * pushes: {repo url: {push id: {'date', 'user', 'changesets'}}}
+        * buildapi: {repo name: {revision: [jobs]}}
+        * treeherder: {'repositories': [...], 'resultsets': {repo name: [...]},
+                       'jobs': {repo name: {result set id: [...]}},
+                       'artifacts': {repo name: {job id: [...]}}}
+        * buildjson: {filename: contents}
+        * files: {URL: contents}
+        * tasks: {task id: task definition}
+        * task_graphs: {task graph id: {'state', 'tasks'}}
+        """
+        with open(path) as f:
+            fixtures = json.load(f)
+
+        for repo_url, pushes in fixtures.get('pushes', {}).iteritems():
+            self.pushes.setdefault(_strip_scheme(repo_url), {}).update(
+                (int(push_id), push) for push_id, push in pushes.iteritems())
+        for repo_name, jobs in fixtures.get('buildapi', {}).iteritems():
+            self.buildapi_jobs.setdefault(repo_name, {}).update(jobs)
+        for key, value in fixtures.get('treeherder', {}).iteritems():
+            if key == 'repositories':
+                self.treeherder[key].extend(value)
+            else:
+                self.treeherder[key].update(value)
+        self.buildjson.update(fixtures.get('buildjson', {}))
+        self.files.update((_strip_scheme(url), contents)
+                          for url, contents in fixtures.get('files', {}).iteritems())
+        self.tasks.update(fixtures.get('tasks', {}))
+        self.task_graphs.update(fixtures.get('task_graphs', {}))
+
+    #
+    # Server
+    #
+    def start(self, port=0):
+        """Start serving in a background thread and return the URL of the server."""
+        # The handler classes of BaseHTTPServer are old-style classes
+        class Handler(_Handler):
+            services = self
+
+        self._server = _ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.url
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self._server.server_address[1]
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _setting(self, value, host):
+        if isinstance(value, dict):
+            return value.get(host, 0)
+        return value
+
+    def handle(self, method, path, params, body):
+        """Return (status code, response) for a request; path starts with the host."""
+        host = path.split('/', 1)[0]
+        with self._lock:
+            self.requests[host] += 1
+            failed = self._random.random() < self._setting(self.failure_rate, host)
+
+        time.sleep(self._setting(self.latency, host))
+        if failed:
+            return 503, {'message': 'Service unavailable (simulated)'}
+
+        for pattern, methods, handler in _ROUTES:
+            match = re.match(pattern, path)
+            if match and method in methods:
+                with self._lock:
+                    return handler(self, method, params, body, *match.groups())
+
+        if path in self.files:
+            return 200, self.files[path]
+        return 404, {'message': '%s %s is not handled.' % (method, path)}
+
+    #
+    # hg.mozilla.org
+    #
+    def _json_pushes(self, method, params, body, repo_url):
+        pushes = self.pushes.get(repo_url, {})
+        last_push_id = max(pushes) if pushes else 0
+        if 'changeset' in params:
+            changeset = params['changeset']
+            selected = [push_id for push_id, push in pushes.iteritems()
+                        if any(node.startswith(changeset) for node in push['changesets'])]
+            if not selected:
+                return 404, {'error': 'unknown revision %s' % changeset}
+        else:
+            # startID is excluded
+            start_id = int(params.get('startID', last_push_id - LATEST_PUSHES))
+            end_id = int(params.get('endID', last_push_id))
+            selected = [push_id for push_id in pushes if start_id < push_id <= end_id]
+
+        return 200, {'lastpushid': last_push_id,
+                     'pushes': dict((str(i), pushes[i]) for i in selected)}
+
+    #
+    # buildapi
+    #
+    def _buildapi_jobs(self, method, params, body, repo_name, revision):
+        jobs = self.buildapi_jobs.get(repo_name, {})
+        for rev, rev_jobs in jobs.iteritems():
+            if rev.startswith(revision) or revision.startswith(rev):
+                return 200, rev_jobs
+        return 200, []
+
+    def _buildapi_request(self, method, params, body, *args):
+        self.buildapi_requests.append((method, '/'.join(args), body))
+        return 202, {'status': 'OK', 'request_id': len(self.buildapi_requests)}
+
+    #
+    # Treeherder
+    #
+    def _th_repositories(self, method, params, body):
+        return 200, self.treeherder['repositories']
+
+    def _th_resultsets(self, method, params, body, repo_name):
+        revision = params.get('revision', '')
+        results = [r for r in self.treeherder['resultsets'].get(repo_name, [])
+                   if r['revision'].startswith(revision)]
+        return 200, {'results': results}
+
+    def _th_jobs(self, method, params, body, repo_name):
+        jobs = self.treeherder['jobs'].get(repo_name, {}).get(
+            str(params.get('result_set_id')), [])
+        offset = int(params.get('offset', 0))
+        count = int(params.get('count', len(jobs)))
+        return 200, {'results': jobs[offset:offset + count]}
+
+    def _th_artifacts(self, method, params, body, repo_name):
+        artifacts = self.treeherder['artifacts'].get(repo_name, {}).get(
+            str(params.get('job_id')), [])
+        return 200, {'results': [a for a in artifacts
+                                 if 'name' not in params or a.get('name') == params['name']]}
+
+    #
+    # buildjson
+    #
+    def _buildjson(self, method, params, body, filename):
+        if filename not in self.buildjson:
+            return 404, {'message': '%s does not exist.' % filename}
+        contents = StringIO()
+        with gzip.GzipFile(fileobj=contents, mode='wb') as f:
+            f.write(json.dumps(self.buildjson[filename]))
+        return 200, contents.getvalue()
+
+    #
+    # TaskCluster
+    #
+    def _graph_status(self, task_graph_id):
+        return {'status': {'taskGraphId': task_graph_id,
+                           'schedulerId': 'task-graph-scheduler',
+                           'state': self.task_graphs[task_graph_id]['state']}}
+
+    def _create_task_graph(self, method, params, body, task_graph_id):
+        self.task_graphs[task_graph_id] = {'state': 'running', 'tasks': []}
+        return self._extend_task_graph(method, params, body, task_graph_id)
+
+    def _extend_task_graph(self, method, params, body, task_graph_id):
+        if task_graph_id not in self.task_graphs:
+            return 404, {'message': 'Task graph %s does not exist.' % task_graph_id}
+        for task in json.loads(body).get('tasks', []):
+            self.task_graphs[task_graph_id]['tasks'].append(task['taskId'])
+            self.tasks[task['taskId']] = task['task']
+        return 200, self._graph_status(task_graph_id)
+
+    def _task_graph_status(self, method, params, body, task_graph_id):
+        if task_graph_id not in self.task_graphs:
+            return 404, {'message': 'Task graph %s does not exist.' % task_graph_id}
+        return 200, self._graph_status(task_graph_id)
+
+    def _task(self, method, params, body, task_id):
+        if task_id not in self.tasks:
+            return 404, {'message': 'Task %s does not exist.' % task_id}
+        return 200, self.tasks[task_id]
+
+    def set_task_graph_state(self, task_graph_id, state):
+        """Change the state of a task graph (e.g. to 'finished')."""
+        with self._lock:
+            self.task_graphs[task_graph_id]['state'] = state
+
+
+# (regular expression of the path, methods, handler)
+_ROUTES = [
+    (r'^(hg\.mozilla\.org/.+)/json-pushes/?$', ('GET',), FakeServices._json_pushes),
+    (r'^%s/([^/]+)/rev/([0-9a-f]+)/?$' % re.escape(SELFSERVE), ('GET',),
+     FakeServices._buildapi_jobs),
+    (r'^%s/([^/]+)/(builders/.+)$' % re.escape(SELFSERVE), ('POST',),
+     FakeServices._buildapi_request),
+    (r'^%s/([^/]+)/(request.*)$' % re.escape(SELFSERVE), ('POST', 'DELETE'),
+     FakeServices._buildapi_request),
+    (r'^treeherder\.mozilla\.org/api/repository/?$', ('GET',),
+     FakeServices._th_repositories),
+    (r'^treeherder\.mozilla\.org/api/project/([^/]+)/resultset/?$', ('GET',),
+     FakeServices._th_resultsets),
+    (r'^treeherder\.mozilla\.org/api/project/([^/]+)/jobs/?$', ('GET',),
+     FakeServices._th_jobs),
+    (r'^treeherder\.mozilla\.org/api/project/([^/]+)/artifact/?$', ('GET',),
+     FakeServices._th_artifacts),
+    (r'^%s/(.+)\.gz$' % re.escape(BUILDJSON), ('GET',), FakeServices._buildjson),
+    (r'^scheduler\.taskcluster\.net/v1/task-graph/([^/]+)$', ('PUT',),
+     FakeServices._create_task_graph),
+    (r'^scheduler\.taskcluster\.net/v1/task-graph/([^/]+)/extend$', ('POST',),
+     FakeServices._extend_task_graph),
+    (r'^scheduler\.taskcluster\.net/v1/task-graph/([^/]+)/status$', ('GET',),
+     FakeServices._task_graph_status),
+    (r'^queue\.taskcluster\.net/v1/task/([^/]+)$', ('GET',), FakeServices._task),
+]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    services = None
+
+    def _handle(self, method):
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ''
+
+        status, response = self.services.handle(method, url.path.lstrip('/'), params, body)
+        if not isinstance(response, basestring):
+            response = json.dumps(response)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def log_message(self, format, *args):
+        LOG.debug("Fake services: " + format % args)
+
+
+def _strip_scheme(url):
+    return url.split('://', 1)[-1].rstrip('/')
+
+
+def _fake_send(adapter, request, **kwargs):
+    if FAKE_SERVICES_URL and not request.url.startswith(FAKE_SERVICES_URL):
+        request.url = '%s/%s' % (FAKE_SERVICES_URL, _strip_scheme(request.url))
+    return _PREVIOUS_SEND(adapter, request, **kwargs)
+
+
+def enable(url):
+    """Send the requests of mozci (anything using requests) to the server at url."""
+    global FAKE_SERVICES_URL, _PREVIOUS_SEND
+    FAKE_SERVICES_URL = url.rstrip('/')
+    if _PREVIOUS_SEND is None:
+        _PREVIOUS_SEND = requests.adapters.HTTPAdapter.send
+        requests.adapters.HTTPAdapter.send = _fake_send
+    LOG.info("Requests are sent to the fake services at %s." % FAKE_SERVICES_URL)
+
+
+def disable():
+    """Stop sending requests to the fake services.
+
+    If another hook (e.g. a cassette) was installed after enable() we leave ours in
+    place; without a URL it passes requests through.
+    """
+    global FAKE_SERVICES_URL, _PREVIOUS_SEND
+    FAKE_SERVICES_URL = None
+    if requests.adapters.HTTPAdapter.send.__func__ is _fake_send:
+        requests.adapters.HTTPAdapter.send = _PREVIOUS_SEND
+        _PREVIOUS_SEND = None
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--fixtures', type=str,
+                        help='JSON file with the data to serve (see load_fixtures()).')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Seconds every request takes.')
+    parser.add_argument('--failure-rate', dest='failure_rate', type=float, default=0,
+                        help='Fraction of the requests which fail with a 503.')
+    parser.add_argument('--seed', type=int,
+                        help='Seed of the failures; a seed makes runs reproducible.')
+    options = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    services = FakeServices(options.fixtures, latency=options.latency,
+                            failure_rate=options.failure_rate, seed=options.seed)
+    url = services.start(options.port)
+    LOG.info("Serving on %s; export MOZCI_FAKE_SERVICES=%s to use it." % (url, url))
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        services.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+This module holds the status of many builders over a range of revisions.
+
+Backfilling, finding coalesced or missing jobs and triaging failures all look at
+"the status of builder B on revision R" over many revisions. A JobMatrix queries the
+jobs of each revision once and stores one status code (the PENDING..CANCELLED
+constants of mozci.query_jobs) and one job count per (revision, builder) in
+compact arrays; the builders and revisions are mapped to integer ids.
+
+A revision can have many jobs of a builder; the status kept is the most relevant
+one following STATUS_PRIORITY (e.g. any successful job makes the cell successful).
+"""
+from __future__ import absolute_import
+
+import logging
+
+from array import array
+
+from mozci.errors import BuildapiError, BuildjsonError
+from mozci.query_jobs import (
+    CANCELLED,
+    COALESCED,
+    EXCEPTION,
+    FAILURE,
+    PENDING,
+    RETRY,
+    RUNNING,
+    SKIPPED,
+    SUCCESS,
+    UNKNOWN,
+    WARNING,
+)
+
+LOG = logging.getLogger('mozci')
+# Status of a builder without jobs on a revision
+NO_JOB = -5
+# The first status found in this list is the one kept for a cell
+STATUS_PRIORITY = (SUCCESS, RUNNING, PENDING, UNKNOWN, WARNING, FAILURE, EXCEPTION, RETRY,
+                   CANCELLED, SKIPPED, COALESCED)
+_RANK = dict((status, rank) for rank, status in enumerate(STATUS_PRIORITY))
+_RANK[NO_JOB] = len(STATUS_PRIORITY)
+
+
+class JobMatrix(object):
+    """Job statuses of a set of builders on revisions (newest first)."""
+
+    def __init__(self, buildernames):
+        self.buildernames = []
+        for buildername in buildernames:
+            if buildername not in self.buildernames:
+                self.buildernames.append(buildername)
+        self._builder_ids = dict((name, i) for i, name in enumerate(self.buildernames))
+        self.revisions = []
+        self._revision_ids = {}
+        # One row of len(buildernames) cells per revision
+        self._status = array('b')
+        self._count = array('H')
+        # buildername -> newest revision with a successful job; kept as rows are added
+        self._last_successful = {}
+
+    @classmethod
+    def from_query_api(cls, query_api, repo_name, revisions, buildernames=None):
+        """Return the JobMatrix of the jobs of revisions (newest first) from a QueryApi.
+
+        If buildernames is not given we use every builder with a job in the range.
+        """
+        all_jobs = [query_api.get_all_jobs(repo_name, rev) for rev in revisions]
+        if buildernames is None:
+            buildernames = sorted(set(
+                query_api.get_buildername(job) for jobs in all_jobs for job in jobs))
+
+        matrix = cls(buildernames)
+        for rev, jobs in zip(revisions, all_jobs):
+            matrix.add_revision(rev, jobs, query_api)
+        return matrix
+
+    def add_revision(self, revision, jobs, query_api):
+        """Add the row of an older revision with the jobs returned by get_all_jobs()."""
+        if revision in self._revision_ids:
+            raise ValueError("%s is already in the matrix." % revision)
+
+        status = array('b', [NO_JOB] * len(self.buildernames))
+        count = array('H', [0] * len(self.buildernames))
+        for job in jobs:
+            builder_id = self._builder_ids.get(query_api.get_buildername(job))
+            if builder_id is None:
+                continue
+
+            try:
+                job_status = query_api.get_job_status(job)
+            except (BuildapiError, BuildjsonError):
+                LOG.debug("We could not determine the status of a job; we consider it "
+                          "unknown.")
+                job_status = UNKNOWN
+
+            count[builder_id] += 1
+            if _RANK[job_status] < _RANK[status[builder_id]]:
+                status[builder_id] = job_status
+
+        for buildername, builder_id in self._builder_ids.iteritems():
+            if status[builder_id] == SUCCESS:
+                self._last_successful.setdefault(buildername, revision)
+
+        self._revision_ids[revision] = len(self.revisions)
+        self.revisions.append(revision)
+        self._status.extend(status)
+        self._count.extend(count)
+
+    def _cell(self, revision, buildername):
+        return self._revision_ids[revision] * len(self.buildernames) + \
+            self._builder_ids[buildername]
+
+    def status(self, revision, buildername):
+        """Return the status of buildername on revision (NO_JOB if there are no jobs)."""
+        return self._status[self._cell(revision, buildername)]
+
+    def count(self, revision, buildername):
+        """Return the number of jobs of buildername on revision."""
+        return self._count[self._cell(revision, buildername)]
+
+    def column(self, buildername):
+        """Return the statuses of buildername on every revision (newest first)."""
+        return self._status[self._builder_ids[buildername]::len(self.buildernames)]
+
+    def last_successful_revisions(self):
+        """Return a dictionary buildername -> newest revision with a successful job or None."""
+        return dict((buildername, self._last_successful.get(buildername))
+                    for buildername in self.buildernames)
+
+    def missing_jobs(self):
+        """Return a dictionary buildername -> revisions without jobs of that builder.
+
+        Builders which have jobs on every revision are not included.
+        """
+        missing = {}
+        for buildername in self.buildernames:
+            column = self.column(buildername)
+            if NO_JOB in column:
+                missing[buildername] = [
+                    rev for rev, status in zip(self.revisions, column) if status == NO_JOB]
+        return missing
+
+    def coalesced_runs(self):
+        """Return a dictionary buildername -> list of (revision, length).
+
+        Every tuple is a run of 'length' consecutive revisions, starting at 'revision'
+        and going back, where the jobs of the builder were coalesced.
+        Builders without coalesced jobs are not included.
+        """
+        runs = {}
+        for buildername in self.buildernames:
+            column = self.column(buildername)
+            if COALESCED not in column:
+                continue
+
+            builder_runs = []
+            start = None
+            for i, status in enumerate(column):
+                if status == COALESCED and start is None:
+                    start = i
+                elif status != COALESCED and start is not None:
+                    builder_runs.append((self.revisions[start], i - start))
+                    start = None
+            if start is not None:
+                builder_runs.append((self.revisions[start], len(column) - start))
+            runs[buildername] = builder_runs
+        return runs
@@ -6,19 +6,35 @@ interactions with distinct modules to meet your needs.
 """
 from __future__ import absolute_import
 
+import collections
 import logging
 
-from buildapi_client import make_retrigger_request, trigger_arbitrary_job
+from buildapi_client import trigger_arbitrary_job
 
-from mozci import repositories
+from mozci import query_jobs, repositories
 from mozci.errors import MozciError
+from mozci.job_matrix import JobMatrix
 from mozci.platforms import (
     build_talos_buildernames_for_repo,
     determine_upstream_builder,
+    get_SETA_interval_dict,
     is_downstream,
     list_builders,
 )
 from mozci.sources import buildjson
+from mozci.sources.pushlog import (
+    query_pushes_by_specified_revision_range,
+    query_pushes_by_revision_range,
+    valid_revision,
+)
+from mozci.trigger_plan import (
+    ArbitraryJob,
+    BuildThenTest,
+    Retrigger,
+    Skip,
+    TriggerPlan,
+)
+from mozci.request_coalescer import RequestCoalescer
 from mozci.query_jobs import (
     PENDING,
     RUNNING,
@@ -32,17 +48,28 @@ from mozci.query_jobs import (
     BuildApi,
     TreeherderApi
 )
+from mozci.utils import metrics
 from mozci.utils.authentication import get_credentials
+from mozci.utils.build_requests import BuildRequestStore
 from mozci.utils.misc import _all_urls_reachable
-from mozci.utils.transfer import path_to_file, clean_directory
-from mozhginfo.pushlog_client import (
-    query_pushes_by_specified_revision_range,
-    query_pushes_by_revision_range,
-    valid_revision,
+from mozci.utils.parallel import (
+    KeyedLocks,
+    call_with_buffered_logs,
+    parallel_map,
+    replay_logs,
 )
+from mozci.utils.profiler import span
+from mozci.utils.transfer import path_to_file, clean_directory
 
 LOG = logging.getLogger('mozci')
-SCHEDULING_MANAGER = {}
+# Build jobs requested by any mozci process (see _build_request_store())
+BUILD_REQUESTS = None
+# Build jobs (and their files) found for a (revision, build buildername) in this session
+BUILD_JOBS_CACHE = {}
+# Test jobs evaluated in parallel should not look for the same build job at once
+_BUILD_JOBS_LOCKS = KeyedLocks()
+# Set of valid buildernames (see _valid_builders())
+VALID_BUILDERS = None
 
 # Default value of QUERY_SOURCE
 QUERY_SOURCE = BuildApi()
@@ -50,6 +77,9 @@ QUERY_SOURCE = BuildApi()
 # Set this value to False in your tool to prevent any sort of validation
 VALIDATE = True
 
+# Set this value to False to request build jobs even if they were recently requested
+DEDUPE_BUILD_REQUESTS = True
+
 
 def disable_validations():
     global VALIDATE
@@ -58,6 +88,13 @@ def disable_validations():
         VALIDATE = False
 
 
+def disable_build_request_dedupe():
+    global DEDUPE_BUILD_REQUESTS
+    if DEDUPE_BUILD_REQUESTS:
+        LOG.debug("Disable the deduplication of build requests.")
+        DEDUPE_BUILD_REQUESTS = False
+
+
 def set_query_source(query_source="buildapi"):
     """ Function to set the global QUERY_SOURCE """
     global QUERY_SOURCE
@@ -68,21 +105,28 @@ def set_query_source(query_source="buildapi"):
     QUERY_SOURCE = source_class()
 
 
+def _build_request_store():
+    """Return the store of build requests shared by every mozci process."""
+    global BUILD_REQUESTS
+    if BUILD_REQUESTS is None:
+        BUILD_REQUESTS = BuildRequestStore()
+        BUILD_REQUESTS.expire()
+    return BUILD_REQUESTS
+
+
 def _unique_build_request(buildername, revision):
     """
-    We want to prevent requesting a build job too many times
-    in the same session.
+    We want to prevent requesting a build job too many times;
+    this applies to every mozci process running in this machine.
     """
-    global SCHEDULING_MANAGER
-    sch_mgr = SCHEDULING_MANAGER
-
-    if is_downstream(buildername):
+    if is_downstream(buildername) or not DEDUPE_BUILD_REQUESTS:
         return True
     else:
-        if revision in sch_mgr and buildername in sch_mgr[revision]:
-            LOG.debug("We have already scheduled the build '%s' for "
-                      "revision %s during this session. We don't allow "
-                      "multiple requests." % (buildername, revision))
+        repo_name = query_repo_name_from_buildername(buildername)
+        if _build_request_store().was_requested(repo_name, revision, buildername):
+            LOG.debug("The build '%s' has recently been requested for "
+                      "revision %s. We don't allow multiple requests." %
+                      (buildername, revision))
             return False
         return True
 
@@ -134,30 +178,30 @@ class StatusSummary(object):
         return self._successful + self._pending + self._running + self._failed
 
 
-def determine_trigger_objective(revision, buildername, trigger_build_if_missing=True,
-                                will_use_buildapi=False):
-    """
-    Determine if we need to trigger any jobs and which job.
+def _find_build_job(repo_name, revision, build_buildername):
+    """Find the jobs of build_buildername on a revision and the files they produced.
 
-    Returns:
+    The result is stored in BUILD_JOBS_CACHE since every test job associated to the same
+    build needs the same information. It is a dictionary with these keys:
 
-    * The name of the builder we need to trigger
-    * Files, if needed, to trigger such builder
+    * working_job - A build job with files we can reach
+    * running_job - A running or pending build job
+    * failed_job - A finished build job which did not produce the files
+    * files - The files of working_job or None
     """
-    builder_to_trigger = None
-    files = None
-    repo_name = query_repo_name_from_buildername(buildername)
+    key = (revision, build_buildername)
+    with _BUILD_JOBS_LOCKS(key):
+        if key in BUILD_JOBS_CACHE:
+            LOG.debug("We have already looked for the build jobs of '%s' on %s." %
+                      (build_buildername, revision))
+            return BUILD_JOBS_CACHE[key]
 
-    build_buildername = determine_upstream_builder(buildername)
+        BUILD_JOBS_CACHE[key] = _query_build_job(repo_name, revision, build_buildername)
+        return BUILD_JOBS_CACHE[key]
 
-    if VALIDATE and not valid_builder(build_buildername):
-        raise MozciError("Our platforms mapping system has failed.")
-
-    if build_buildername == buildername:
-        # For a build job we know that we don't need files to
-        # trigger it and it's the build job we want to trigger
-        return build_buildername, None, None
 
+def _query_build_job(repo_name, revision, build_buildername):
+    """Return the build jobs of build_buildername on a revision; see _find_build_job()."""
     # Let's figure out which jobs are associated to such revision
     query_api = BuildApi()
     # Let's only look at jobs that match such build_buildername
@@ -168,6 +212,7 @@ def determine_trigger_objective(revision, buildername, trigger_build_if_missing=
     working_job = None
     running_job = None
     failed_job = None
+    files = None
 
     LOG.debug("List of matching jobs:")
     for job in build_jobs:
@@ -207,6 +252,81 @@ def determine_trigger_objective(revision, buildername, trigger_build_if_missing=
         failed_job = job
     # End of for loop
 
+    return {
+        'working_job': working_job,
+        'running_job': running_job,
+        'failed_job': failed_job,
+        'files': files,
+    }
+
+
+def invalidate_job_caches(repo_name, revision):
+    """Forget the jobs and the build jobs we found for a revision.
+
+    The jobs of a revision are only queried once per process; long running processes
+    (e.g. build_watcher.BuildWatcher) call this to see their current state.
+    """
+    query_jobs.JOBS_CACHE.pop((repo_name, revision), None)
+    for key in BUILD_JOBS_CACHE.keys():
+        if key[0] == revision:
+            BUILD_JOBS_CACHE.pop(key, None)
+
+
+def determine_trigger_objectives(revision, buildernames):
+    """Return a dictionary buildername -> determine_trigger_objective() of test builders.
+
+    Test builders which share a build job are resolved together; we only look for
+    the build job of each build builder once.
+    """
+    groups = collections.OrderedDict()
+    for buildername in buildernames:
+        groups.setdefault(determine_upstream_builder(buildername), []).append(buildername)
+
+    objectives = {}
+    for test_buildernames in groups.itervalues():
+        objective, package_url, tests_url = \
+            determine_trigger_objective(revision, test_buildernames[0])
+        for buildername in test_buildernames:
+            # The build job is completed (the objective is the test job itself), is
+            # running (None) or needs to be triggered (the build job)
+            if objective == test_buildernames[0]:
+                objectives[buildername] = (buildername, package_url, tests_url)
+            else:
+                objectives[buildername] = (objective, package_url, tests_url)
+    return objectives
+
+
+@metrics.timed('objective')
+def determine_trigger_objective(revision, buildername, trigger_build_if_missing=True,
+                                will_use_buildapi=False):
+    """
+    Determine if we need to trigger any jobs and which job.
+
+    Returns:
+
+    * The name of the builder we need to trigger
+    * Files, if needed, to trigger such builder
+    """
+    builder_to_trigger = None
+    files = None
+    repo_name = query_repo_name_from_buildername(buildername)
+
+    build_buildername = determine_upstream_builder(buildername)
+
+    if VALIDATE and not valid_builder(build_buildername):
+        raise MozciError("Our platforms mapping system has failed.")
+
+    if build_buildername == buildername:
+        # For a build job we know that we don't need files to
+        # trigger it and it's the build job we want to trigger
+        return build_buildername, None, None
+
+    build_info = _find_build_job(repo_name, revision, build_buildername)
+    working_job = build_info['working_job']
+    running_job = build_info['running_job']
+    failed_job = build_info['failed_job']
+    files = build_info['files']
+
     if working_job:
         # We found a build job with the necessary files. It could be a
         # successful job, a running job that already emitted files or a
@@ -355,12 +475,96 @@ def query_revisions_range(repo_name, from_revision, to_revision):
     )
 
 
+def query_job_statuses(repo_name, revision, buildername):
+    """Return the status of every job of buildername on a revision.
+
+    The jobs of the revision are queried again instead of using JOBS_CACHE.
+    """
+    invalidate_job_caches(repo_name, revision)
+    return [QUERY_SOURCE.get_job_status(job)
+            for job in QUERY_SOURCE.get_matching_jobs(repo_name, revision, buildername)]
+
+
+def _seta_run_revisions(pushes, seta_interval, job_revisions):
+    """Return the revisions of pushes (oldest first) on which SETA would schedule a job.
+
+    SETA schedules a job once every seta_interval[0] pushes or if seta_interval[1]
+    seconds have passed since the last time it did. We count from the pushes which
+    have a job (job_revisions, with 12 chars); we cannot tell what SETA did before the
+    first of them so we keep those pushes. Pushes with a job are always included.
+    """
+    max_pushes, max_seconds = seta_interval
+    run_revisions = []
+    last_run = None
+    pushes_since_run = 0
+    for push in pushes:
+        revision = push.changesets[0].node
+        if revision[:12] in job_revisions:
+            last_run = push
+            pushes_since_run = 0
+        elif last_run is not None:
+            pushes_since_run += 1
+            if pushes_since_run < max_pushes and push.date - last_run.date < max_seconds:
+                continue
+            last_run = push
+            pushes_since_run = 0
+        run_revisions.append(revision)
+
+    return run_revisions
+
+
+def select_seta_revisions(buildername, revisions, pushes=None, job_revisions=None, keep=()):
+    """Return the revisions on which SETA would have scheduled buildername.
+
+    'revisions' is expected to be a list of consecutive pushes, newest first. The
+    revisions SETA skips on purpose do not need a job; we find them by counting from
+    the pushes where buildername has jobs. Builders without a SETA interval keep every
+    revision and so do the revisions in 'keep' (e.g. the one the user asked for).
+    If given, 'pushes' are the pushlog pushes of 'revisions' and of the push before them
+    and 'job_revisions' are the revisions of those pushes with jobs of buildername.
+    """
+    seta_interval = get_SETA_interval_dict().get(buildername)
+    if not seta_interval or not revisions:
+        return revisions
+
+    if pushes is None:
+        pushes = query_pushes_by_specified_revision_range(
+            repo_url=query_repo_url_from_buildername(buildername),
+            revision=revisions[0],
+            before=len(revisions),
+            after=0)
+    pushes = sorted(pushes, key=lambda push: push.id)
+    if job_revisions is None:
+        repo_name = query_repo_name_from_buildername(buildername)
+        job_revisions = [push.changesets[0].node for push in pushes
+                         if QUERY_SOURCE.get_matching_jobs(
+                             repo_name, push.changesets[0].node, buildername)]
+    job_revisions = set(rev[:12] for rev in job_revisions)
+    run_revisions = set(rev[:12] for rev in
+                        _seta_run_revisions(pushes, seta_interval, job_revisions))
+    run_revisions.update(rev[:12] for rev in keep)
+
+    selected = [rev for rev in revisions if rev[:12] in run_revisions]
+    LOG.info("SETA schedules '%s' every %d pushes or %d seconds; we only need %d out of "
+             "%d revisions." % (buildername, seta_interval[0], seta_interval[1],
+                                len(selected), len(revisions)))
+    return selected
+
+
 #
 # Validation code
 #
+def _valid_builders():
+    """Return the set of builders valid_builder() accepts."""
+    global VALID_BUILDERS
+    if VALID_BUILDERS is None:
+        VALID_BUILDERS = frozenset(query_builders())
+    return VALID_BUILDERS
+
+
 def valid_builder(buildername, quiet=False):
     """Determine if the builder you're trying to trigger is valid."""
-    builders = query_builders()
+    builders = _valid_builders()
     if buildername in builders:
         LOG.debug("Buildername %s is valid." % buildername)
         return True
@@ -379,6 +583,75 @@ def valid_builder(buildername, quiet=False):
 #
 # Trigger functionality
 #
+def _determine_trigger_job(revision, buildername, times=1, files=None,
+                           trigger_build_if_missing=True):
+    """Determine what trigger_job() needs to request without requesting anything.
+
+    Returns None if nothing needs to be triggered or a tuple with the builder to
+    trigger, the files to use and how many times to trigger it.
+    """
+    if files:
+        _all_urls_reachable(files)
+        return buildername, files, times
+
+    builder_to_trigger, package_url, test_url = determine_trigger_objective(
+        revision=revision,
+        buildername=buildername,
+        trigger_build_if_missing=trigger_build_if_missing,
+        will_use_buildapi=True
+    )
+
+    if builder_to_trigger != buildername and times != 1:
+        # The user wants to trigger a downstream job,
+        # however, we need a build job instead.
+        # We should trigger the downstream job multiple times, however,
+        # we only trigger the upstream jobs once.
+        LOG.debug("Since we need to trigger a build job we don't need to "
+                  "trigger it %s times but only once." % times)
+        if trigger_build_if_missing:
+            LOG.info("In order to trigger %s %i times, "
+                     "please run the script again after %s ends."
+                     % (buildername, times, builder_to_trigger))
+        else:
+            LOG.info("We won't trigger '%s' because there is no working build."
+                     % buildername)
+            LOG.info("")
+        times = 1
+
+    if builder_to_trigger is None:
+        return None
+
+    return builder_to_trigger, [package_url, test_url], times
+
+
+def _schedule_trigger_job(revision, builder_to_trigger, files, times, dry_run=False,
+                          extra_properties=None):
+    """Request the job determined by _determine_trigger_job().
+
+    We return a list of all requests made.
+    """
+    list_of_requests = []
+    if dry_run:
+        LOG.info("Dry-run: We were going to request '%s' %s times." %
+                 (builder_to_trigger, times))
+        # Running with dry_run being True will only output information
+        trigger(
+            builder=builder_to_trigger,
+            revision=revision,
+            files=files,
+            dry_run=dry_run,
+            extra_properties=extra_properties
+        )
+    else:
+        # The jobs are requested concurrently
+        coalescer = RequestCoalescer()
+        _queue_trigger(coalescer, builder_to_trigger, revision, files, times,
+                       extra_properties)
+        list_of_requests = [req for req in coalescer.flush() if req is not None]
+
+    return list_of_requests
+
+
 def trigger_job(revision, buildername, times=1, files=None, dry_run=False,
                 extra_properties=None, trigger_build_if_missing=True):
     """Trigger a job through self-serve.
@@ -386,7 +659,6 @@ def trigger_job(revision, buildername, times=1, files=None, dry_run=False,
     We return a list of all requests made.
     """
     repo_name = query_repo_name_from_buildername(buildername)
-    builder_to_trigger = None
     list_of_requests = []
     repo_url = repositories.query_repo_url(repo_name)
 
@@ -401,57 +673,24 @@ def trigger_job(revision, buildername, times=1, files=None, dry_run=False,
         # XXX How should we exit cleanly?
         exit(-1)
 
-    if files:
-        builder_to_trigger = buildername
-        _all_urls_reachable(files)
-    else:
-        builder_to_trigger, package_url, test_url = determine_trigger_objective(
+    objective = _determine_trigger_job(
+        revision=revision,
+        buildername=buildername,
+        times=times,
+        files=files,
+        trigger_build_if_missing=trigger_build_if_missing
+    )
+
+    if objective:
+        builder_to_trigger, files, times = objective
+        list_of_requests = _schedule_trigger_job(
             revision=revision,
-            buildername=buildername,
-            trigger_build_if_missing=trigger_build_if_missing,
-            will_use_buildapi=True
+            builder_to_trigger=builder_to_trigger,
+            files=files,
+            times=times,
+            dry_run=dry_run,
+            extra_properties=extra_properties
         )
-
-        if builder_to_trigger != buildername and times != 1:
-            # The user wants to trigger a downstream job,
-            # however, we need a build job instead.
-            # We should trigger the downstream job multiple times, however,
-            # we only trigger the upstream jobs once.
-            LOG.debug("Since we need to trigger a build job we don't need to "
-                      "trigger it %s times but only once." % times)
-            if trigger_build_if_missing:
-                LOG.info("In order to trigger %s %i times, "
-                         "please run the script again after %s ends."
-                         % (buildername, times, builder_to_trigger))
-            else:
-                LOG.info("We won't trigger '%s' because there is no working build."
-                         % buildername)
-                LOG.info("")
-            times = 1
-
-    if builder_to_trigger:
-        if dry_run:
-            LOG.info("Dry-run: We were going to request '%s' %s times." %
-                     (builder_to_trigger, times))
-            # Running with dry_run being True will only output information
-            trigger(
-                builder=builder_to_trigger,
-                revision=revision,
-                files=[package_url, test_url],
-                dry_run=dry_run,
-                extra_properties=extra_properties
-            )
-        else:
-            for _ in range(times):
-                req = trigger(
-                    builder=builder_to_trigger,
-                    revision=revision,
-                    files=[package_url, test_url],
-                    dry_run=dry_run,
-                    extra_properties=extra_properties
-                )
-                if req is not None:
-                    list_of_requests.append(req)
     else:
         LOG.debug("Nothing needs to be triggered")
 
@@ -461,100 +700,311 @@ def trigger_job(revision, buildername, times=1, files=None, dry_run=False,
     return list_of_requests
 
 
-def trigger_range(buildername, revisions, times=1, dry_run=False,
-                  files=None, extra_properties=None, trigger_build_if_missing=True):
-    """Schedule the job named "buildername" ("times" times) in every revision on 'revisions'."""
-    repo_name = query_repo_name_from_buildername(buildername)
-    repo_url = repositories.query_repo_url(repo_name)
+def _evaluate_revision(repo_name, repo_url, buildername, revision, times=1, files=None,
+                       trigger_build_if_missing=True):
+    """Determine what is needed to have 'times' jobs of buildername on a revision.
+
+    This function does not schedule anything; it returns an entry for a TriggerPlan.
+    """
+    LOG.info("")
+    LOG.info("=== %s ===" % revision)
+    if VALIDATE and not valid_revision(repo_url, revision):
+        LOG.info("We can't trigger anything on pushes without a valid revision.")
+        return Skip(revision, buildername, 'invalid revision')
+
+    LOG.info("We want to have %s job(s) of %s" % (times, buildername))
+
+    # 1) How many potentially completed jobs can we get for this buildername?
+    with metrics.phase('matching_jobs'):
+        matching_jobs = QUERY_SOURCE.get_matching_jobs(repo_name, revision, buildername)
+    with metrics.phase('status'):
+        status_summary = StatusSummary(matching_jobs)
+
+    # TODO: change this debug message when we have a less hardcoded _status_summary
+    LOG.debug("We found %d pending/running jobs, %d successful jobs and "
+              "%d failed jobs" % (status_summary.pending_jobs + status_summary.running_jobs,
+                                  status_summary.successful_jobs, status_summary.failed_jobs))
+
+    if status_summary.potential_jobs >= times:
+        LOG.info("We have %d job(s) for '%s' which is enough for the %d job(s) we want." %
+                 (status_summary.potential_jobs, buildername, times))
+        return Skip(revision, buildername, 'enough jobs')
+
+    # 2) If we have less potential jobs than 'times' instances then
+    #    we need to fill it in.
+    LOG.info("We have found %d potential job(s) matching '%s' on %s. "
+             "We need to trigger more." % (status_summary.potential_jobs, buildername, revision))
+    missing_jobs = times - status_summary.potential_jobs
+
+    # If a job matching what we want already exists, we can
+    # use the retrigger API in self-serve to retrigger that
+    # instead of creating a new arbitrary job
+    if len(matching_jobs) > 0 and files is None:
+        return Retrigger(
+            repo_name=repo_name,
+            revision=revision,
+            buildername=buildername,
+            request_id=QUERY_SOURCE.get_buildapi_request_id(repo_name, matching_jobs[0]),
+            count=missing_jobs)
+
+    # If no matching job exists, we have to trigger a new arbitrary job
+    LOG.info("==> We want to trigger '%s' a total of %d time(s)." % (buildername, missing_jobs))
+    LOG.info("")  # Extra line to help visual of logs
+
+    if VALIDATE and not valid_builder(buildername):
+        # This runs in worker threads; exit() would leave parallel_map() waiting forever
+        raise MozciError("The builder %s requested is invalid" % buildername)
+
+    objective = _determine_trigger_job(
+        revision=revision,
+        buildername=buildername,
+        times=missing_jobs,
+        files=files,
+        trigger_build_if_missing=trigger_build_if_missing
+    )
+    if objective is None:
+        LOG.debug("Nothing needs to be triggered")
+        return Skip(revision, buildername, 'no build job available')
+
+    builder_to_trigger, files, times_to_trigger = objective
+    if builder_to_trigger != buildername:
+        return BuildThenTest(
+            repo_name=repo_name,
+            revision=revision,
+            build_buildername=builder_to_trigger,
+            test_buildername=buildername,
+            times=missing_jobs)
+
+    return ArbitraryJob(
+        repo_name=repo_name,
+        revision=revision,
+        buildername=buildername,
+        files=files,
+        times=times_to_trigger)
+
+
+@metrics.timed('plan_triggers')
+def plan_triggers(buildernames, revisions, times=1, files=None, trigger_build_if_missing=True,
+                  workers=1):
+    """Return a TriggerPlan to have 'times' jobs of every builder on every revision.
+
+    Nothing gets scheduled; use execute_plan() to make the requests.
+    With workers greater than 1 we evaluate the (builder, revision) pairs concurrently;
+    their log messages are still shown grouped and in order. The caches they fill
+    (JOBS_CACHE, BUILD_JOBS_CACHE, allthethings and the repositories) are locked.
+
+    Raises MozciError if a builder we need to trigger is invalid.
+    """
+    pairs = [(buildername, rev) for buildername in buildernames for rev in revisions]
+    repo_urls = {}
+    for buildername in buildernames:
+        repo_name = query_repo_name_from_buildername(buildername)
+        repo_urls[repo_name] = repositories.query_repo_url(repo_name)
+
+    def _evaluate(pair):
+        buildername, rev = pair
+        repo_name = query_repo_name_from_buildername(buildername)
+        with span('revision', builder=buildername, revision=rev):
+            return _evaluate_revision(
+                repo_name=repo_name,
+                repo_url=repo_urls[repo_name],
+                buildername=buildername,
+                revision=rev,
+                times=times,
+                files=files,
+                trigger_build_if_missing=trigger_build_if_missing)
+
+    if workers <= 1 or len(pairs) <= 1:
+        return TriggerPlan([_evaluate(pair) for pair in pairs])
+
+    # Load the data shared by all evaluations before the threads need it
+    get_credentials()
+    for buildername in buildernames:
+        try:
+            determine_upstream_builder(buildername)
+        except MozciError:
+            # The evaluation of the builder will report it
+            pass
+
+    plan = TriggerPlan()
+    results = parallel_map(
+        lambda pair: call_with_buffered_logs(_evaluate, pair),
+        pairs,
+        workers=workers)
+    for entry, records in results:
+        replay_logs(records)
+        plan.add(entry)
+
+    return plan
+
+
+@metrics.timed('scheduling')
+def execute_plan(plan, dry_run=False, extra_properties=None, workers=1, rate_limit=None):
+    """Make the requests of a TriggerPlan and return a summary of them.
+
+    A build job needed by many test jobs is only requested once per revision.
+    On dry_run mode we only show the plan.
+    With workers set to 1 the requests are made in the order of the plan; rate_limit
+    sets the maximum number of requests per second.
+    """
+    summary = plan.summary()
+    if dry_run:
+        LOG.info("")
+        LOG.info("Dry-run: This is what we would have requested:")
+        for line in plan.describe():
+            LOG.info(" - %s" % line)
+        summary['failed_requests'] = 0
+        return summary
+
+    # Requests of the same builder on the same revision are merged together
+    coalescer = RequestCoalescer(workers=workers, rate_limit=rate_limit)
+    for entry in plan.requests():
+        if isinstance(entry, Retrigger):
+            coalescer.retrigger(
+                repo_name=entry.repo_name,
+                request_id=entry.request_id,
+                count=entry.count,
+                buildername=entry.buildername,
+                revision=entry.revision)
+        else:
+            _queue_trigger(coalescer, entry.buildername, entry.revision, entry.files,
+                           entry.times, extra_properties)
+
+    coalescer.flush()
+    summary['failed_requests'] = len(coalescer.failed)
+
+    if summary['failed_requests']:
+        LOG.warning("Not all requests succeeded.")
+    LOG.info("We have retriggered %(retriggered_jobs)d job(s), triggered %(arbitrary_jobs)d "
+             "job(s) and %(build_jobs)d build job(s). %(failed_requests)d request(s) failed."
+             % summary)
+
+    return summary
 
+
+@metrics.timed('trigger_range')
+def trigger_range(buildername, revisions, times=1, dry_run=False,
+                  files=None, extra_properties=None, trigger_build_if_missing=True,
+                  workers=1, rate_limit=None, watcher=None):
+    """Schedule the job named "buildername" ("times" times) in every revision on 'revisions'.
+
+    With workers greater than 1 we determine what each revision needs concurrently.
+    The requests are still made in the order of 'revisions'; rate_limit sets how many
+    requests per second we can make.
+    If a build_watcher.BuildWatcher is given, the test jobs waiting for the build jobs
+    we request are queued in it.
+    """
     if revisions != []:
         LOG.info("We want to have %s job(s) of %s on the following revisions: "
                  % (times, buildername))
         for r in revisions:
             LOG.info(" - %s" % r)
 
-    for rev in revisions:
-        LOG.info("")
-        LOG.info("=== %s ===" % rev)
-        if VALIDATE and not valid_revision(repo_url, rev):
-            LOG.info("We can't trigger anything on pushes without a valid revision.")
-            continue
+    plan = plan_triggers(
+        buildernames=[buildername],
+        revisions=revisions,
+        times=times,
+        files=files,
+        trigger_build_if_missing=trigger_build_if_missing,
+        workers=workers)
 
-        LOG.info("We want to have %s job(s) of %s" % (times, buildername))
+    execute_plan(
+        plan=plan,
+        dry_run=dry_run,
+        extra_properties=extra_properties,
+        rate_limit=rate_limit)
 
-        # 1) How many potentially completed jobs can we get for this buildername?
-        matching_jobs = QUERY_SOURCE.get_matching_jobs(repo_name, rev, buildername)
-        status_summary = StatusSummary(matching_jobs)
+    # 3) Once we trigger a build job, the watcher monitors it and triggers as many
+    #    test jobs as we originally intended when it finishes
+    if watcher is not None and not dry_run:
+        watcher.defer(plan, extra_properties)
 
-        # TODO: change this debug message when we have a less hardcoded _status_summary
-        LOG.debug("We found %d pending/running jobs, %d successful jobs and "
-                  "%d failed jobs" % (status_summary.pending_jobs + status_summary.running_jobs,
-                                      status_summary.successful_jobs, status_summary.failed_jobs))
+    # Cleanup old buildjson files.
+    clean_directory()
 
-        if status_summary.potential_jobs >= times:
-            LOG.info("We have %d job(s) for '%s' which is enough for the %d job(s) we want." %
-                     (status_summary.potential_jobs, buildername, times))
+    return plan
 
-        else:
-            # 2) If we have less potential jobs than 'times' instances then
-            #    we need to fill it in.
-            LOG.info("We have found %d potential job(s) matching '%s' on %s. "
-                     "We need to trigger more." % (status_summary.potential_jobs, buildername, rev))
-
-            # If a job matching what we want already exists, we can
-            # use the retrigger API in self-serve to retrigger that
-            # instead of creating a new arbitrary job
-            if len(matching_jobs) > 0 and files is None:
-                request_id = QUERY_SOURCE.get_buildapi_request_id(repo_name, matching_jobs[0])
-                make_retrigger_request(
-                    repo_name=repo_name,
-                    request_id=request_id,
-                    auth=get_credentials(),
-                    count=(times - status_summary.potential_jobs),
-                    dry_run=dry_run)
-
-            # If no matching job exists, we have to trigger a new arbitrary job
-            else:
-                list_of_requests = trigger_job(
-                    revision=rev,
-                    buildername=buildername,
-                    times=(times - status_summary.potential_jobs),
-                    dry_run=dry_run,
-                    files=files,
-                    extra_properties=extra_properties,
-                    trigger_build_if_missing=trigger_build_if_missing)
 
-                if list_of_requests and any(req.status_code != 202 for req in list_of_requests):
-                    LOG.warning("Not all requests succeeded.")
+def _claim_build_request(builder, revision):
+    """Record that we're requesting a build job; test jobs are not recorded.
 
-        # TODO:
-        # 3) Once we trigger a build job, we have to monitor it to make sure that it finishes;
-        #    at that point we have to trigger as many test jobs as we originally intended
-        #    If a build job does not finish, we have to notify the user... what should it then
-        #    happen?
+    Returns False if the build has already been requested (by any mozci process)
+    unless disable_build_request_dedupe() was called.
+    """
+    if is_downstream(builder):
+        return True
 
+    repo_name = query_repo_name_from_buildername(builder)
+    if not _build_request_store().claim(repo_name, revision, builder,
+                                        force=not DEDUPE_BUILD_REQUESTS):
+        LOG.warning("The build '%s' has recently been requested for revision %s. "
+                    "We will not request it again; use --no-dedupe to request it anyway." %
+                    (builder, revision))
+        return False
 
-def trigger(builder, revision, files=[], dry_run=False, extra_properties=None):
-    """Helper to trigger a job.
+    return True
+
+
+def _release_build_request(builder, revision):
+    """Forget the claim of a build job whose request failed; other requests can try again."""
+    if is_downstream(builder):
+        return
+
+    LOG.debug("The request of '%s' on %s failed; we release it." % (builder, revision))
+    _build_request_store().release(
+        query_repo_name_from_buildername(builder), revision, builder)
 
-    Returns a request.
+
+def _queue_trigger(coalescer, builder, revision, files=[], times=1, extra_properties=None,
+                   on_failure=None):
+    """Queue 'times' jobs of builder in a RequestCoalescer as trigger() would request them.
+
+    on_failure is called if the requests fail (see RequestCoalescer.trigger()).
+    Returns False if the build job has already been requested.
     """
-    global SCHEDULING_MANAGER
-    sch_mgr = SCHEDULING_MANAGER
+    if not _claim_build_request(builder, revision):
+        return False
 
-    if revision not in sch_mgr:
-        sch_mgr[revision] = []
+    def _on_failure():
+        _release_build_request(builder, revision)
+        if on_failure is not None:
+            on_failure()
 
-    sch_mgr[revision].append(builder)
+    coalescer.trigger(
+        repo_name=query_repo_name_from_buildername(builder),
+        builder=builder,
+        revision=revision,
+        files=files,
+        extra_properties=extra_properties,
+        count=times,
+        on_failure=_on_failure)
+    return True
+
+
+def trigger(builder, revision, files=[], dry_run=False, extra_properties=None):
+    """Helper to trigger a job.
+
+    Returns a request or None if the build job has already been requested.
+    """
+    if not dry_run and not _claim_build_request(builder, revision):
+        return None
 
     repo_name = query_repo_name_from_buildername(builder)
-    return trigger_arbitrary_job(repo_name=repo_name,
-                                 builder=builder,
-                                 revision=revision,
-                                 auth=get_credentials(),
-                                 files=files,
-                                 dry_run=dry_run,
-                                 extra_properties=extra_properties)
+    req = None
+    try:
+        req = trigger_arbitrary_job(repo_name=repo_name,
+                                    builder=builder,
+                                    revision=revision,
+                                    auth=get_credentials(),
+                                    files=files,
+                                    dry_run=dry_run,
+                                    extra_properties=extra_properties)
+    finally:
+        # Let other requests try again if the request raised or failed
+        if not dry_run and (req is None or req.status_code != 202):
+            _release_build_request(builder, revision)
+
+    return req
 
 
 def trigger_all_talos_jobs(repo_name, revision, times, priority=0, dry_run=False):
@@ -565,35 +1015,43 @@ def trigger_all_talos_jobs(repo_name, revision, times, priority=0, dry_run=False
     if repo_name in ['mozilla-central', 'mozilla-aurora', 'mozilla-beta']:
         pgo = True
     buildernames = build_talos_buildernames_for_repo(repo_name, pgo)
-    for buildername in buildernames:
-        trigger_range(buildername=buildername,
-                      revisions=[revision],
-                      times=times,
-                      dry_run=dry_run,
-                      extra_properties={'mozci_request': {
-                                        'type': 'trigger_all_talos_jobs',
-                                        'times': times,
-                                        'priority': priority}
-                                        })
-
-
-def manual_backfill(revision, buildername, max_revisions, dry_run=False):
+    # We plan every builder before requesting anything so build jobs
+    # needed by many talos jobs are only requested once
+    plan = plan_triggers(buildernames=buildernames,
+                         revisions=[revision],
+                         times=times)
+    execute_plan(plan=plan,
+                 dry_run=dry_run,
+                 extra_properties={'mozci_request': {
+                                   'type': 'trigger_all_talos_jobs',
+                                   'times': times,
+                                   'priority': priority}
+                                   })
+
+
+def manual_backfill(revision, buildername, max_revisions, dry_run=False, seta_aware=False):
     """
     This function is used to trigger jobs for a range of revisions
     when a user clicks the backfill icon for a job on Treeherder.
 
     It backfills to the last known job on Treeherder.
+    If seta_aware is set we skip the revisions SETA would not have run the job on.
     """
     repo_url = query_repo_url_from_buildername(buildername)
     # We want to use data from treeherder for manual backfilling for long term.
     set_query_source("treeherder")
-    revlist = query_pushes_by_specified_revision_range(
+    pushes = query_pushes_by_specified_revision_range(
         repo_url=repo_url,
         revision=revision,
         before=max_revisions,
-        after=-1,  # We don't want the current job in the revision to be included.
-        return_revision_list=True)
-    filtered_revlist = _filter_backfill_revlist(buildername, revlist, only_successful=False)
+        after=-1)  # We don't want the current job in the revision to be included.
+    revlist = [push.changesets[0].node for push in pushes]
+    filtered_revlist, job_revisions = _backfill_range(buildername, revlist,
+                                                      only_successful=False)
+    if seta_aware:
+        filtered_revlist = select_seta_revisions(
+            buildername, filtered_revlist, pushes=pushes[:len(filtered_revlist) + 1],
+            job_revisions=job_revisions)
     trigger_range(
         buildername=buildername,
         revisions=filtered_revlist,
@@ -617,13 +1075,22 @@ def _filter_backfill_revlist(buildername, revisions, only_successful=False):
     If a job is **not** found, we will simply run trigger_range() of the complete list
     of revisions and notify the user.
     """
+    return _backfill_range(buildername, revisions, only_successful)[0]
+
+
+def _backfill_range(buildername, revisions, only_successful=False):
+    """Return what _filter_backfill_revlist() returns and the revisions we looked at
+    which have jobs of buildername (for select_seta_revisions())."""
     new_revisions_list = []
+    job_revisions = []
     repo_name = query_repo_name_from_buildername(buildername)
     # XXX: We're asssuming that the list is ordered by the push_id
     LOG.info("We want to find a job for '%s' in this range: [%s:%s] (%d revisions)" %
              (buildername, revisions[0][:12], revisions[-1][:12], len(revisions)))
     for rev in revisions:
         matching_jobs = QUERY_SOURCE.get_matching_jobs(repo_name, rev, buildername)
+        if matching_jobs:
+            job_revisions.append(rev)
         if not only_successful:
             status_summary = StatusSummary(matching_jobs)
             if matching_jobs and (status_summary.successful_jobs or status_summary.pending_jobs or
@@ -645,10 +1112,10 @@ def _filter_backfill_revlist(buildername, revisions, only_successful=False):
                 new_revisions_list.append(rev)
 
     LOG.debug("We only need to backfill %s" % new_revisions_list)
-    return new_revisions_list
+    return new_revisions_list, job_revisions
 
 
-def find_backfill_revlist(buildername, revision, max_revisions):
+def find_backfill_revlist(buildername, revision, max_revisions, seta_aware=False):
     """Determine which revisions we need to trigger in order to backfill.
 
     This function is generally called by automatic backfilling on pulse_actions.
@@ -669,6 +1136,8 @@ def find_backfill_revlist(buildername, revision, max_revisions):
     If the list of revision we need to trigger is larger than max_revisions
     it means that we either have not had that job scheduled beyond max_revisions
     or it has been failing forever.
+
+    If seta_aware is set we skip the revisions SETA would not have run the job on.
     """
     # XXX: There is a chance that a green job has run in a newer push (the priority was higher),
     # however, this is unlikely.
@@ -676,14 +1145,14 @@ def find_backfill_revlist(buildername, revision, max_revisions):
     # XXX: We might need to consider when a backout has already landed and stop backfilling
     LOG.info("BACKFILL-START:%s_%s begins." % (revision[0:8], buildername))
 
-    revlist = query_pushes_by_specified_revision_range(
+    pushes = query_pushes_by_specified_revision_range(
         repo_url=query_repo_url_from_buildername(buildername),
         revision=revision,
         before=max_revisions - 1,
-        after=0,
-        return_revision_list=True
+        after=0
     )
-    new_revlist = _filter_backfill_revlist(buildername, revlist, only_successful=True)
+    revlist = [push.changesets[0].node for push in pushes]
+    new_revlist, job_revisions = _backfill_range(buildername, revlist, only_successful=True)
 
     if len(new_revlist) >= max_revisions:
         # It is likely that we are facing a long lived permanent failure
@@ -692,6 +1161,68 @@ def find_backfill_revlist(buildername, revision, max_revisions):
         LOG.info("BACKFILL-END:%s_%s will not backfill." % (revision[0:8], buildername))
         return []
     else:
+        if seta_aware:
+            new_revlist = select_seta_revisions(
+                buildername, new_revlist, pushes=pushes[:len(new_revlist) + 1],
+                job_revisions=job_revisions, keep=[revision])
         LOG.info("BACKFILL-END:%s_%s will backfill %s." %
                  (revision[0:8], buildername, new_revlist))
         return new_revlist
+
+
+def find_backfill_revlists(buildernames, revision, max_revisions, seta_aware=False):
+    """Determine which revisions we need to trigger in order to backfill many builders.
+
+    This is the same as calling find_backfill_revlist() for every builder, however, the
+    range of pushes and the jobs of each push are only fetched once.
+
+    Returns a dictionary buildername -> list of revisions.
+    """
+    by_repo = {}
+    for buildername in buildernames:
+        by_repo.setdefault(query_repo_name_from_buildername(buildername), []).append(buildername)
+
+    revlists = {}
+    for repo_name, repo_buildernames in by_repo.iteritems():
+        pushes = query_pushes_by_specified_revision_range(
+            repo_url=repositories.query_repo_url(repo_name),
+            revision=revision,
+            before=max_revisions - 1,
+            after=0)
+        # Newest push first
+        pushes = sorted(pushes, key=lambda push: push.id, reverse=True)
+        revlist = [push.changesets[0].node for push in pushes]
+
+        # We only go back until every builder has a successful job
+        matrix = JobMatrix(repo_buildernames)
+        last_successful = dict.fromkeys(repo_buildernames)
+        for rev in revlist:
+            matrix.add_revision(rev, QUERY_SOURCE.get_all_jobs(repo_name, rev), QUERY_SOURCE)
+            last_successful = matrix.last_successful_revisions()
+            if all(last_successful.values()):
+                break
+
+        for buildername in repo_buildernames:
+            LOG.info("BACKFILL-START:%s_%s begins." % (revision[0:8], buildername))
+            if last_successful[buildername] is None:
+                new_revlist = revlist
+            else:
+                new_revlist = revlist[:revlist.index(last_successful[buildername])]
+
+            if len(new_revlist) >= max_revisions:
+                # It is likely that we are facing a long lived permanent failure
+                LOG.info("BACKFILL-END:%s_%s will not backfill." % (revision[0:8], buildername))
+                revlists[buildername] = []
+                continue
+
+            if seta_aware:
+                new_revlist = select_seta_revisions(
+                    buildername, new_revlist, pushes=pushes[:len(new_revlist) + 1],
+                    job_revisions=[rev for rev in matrix.revisions
+                                   if matrix.count(rev, buildername)],
+                    keep=[revision])
+            LOG.info("BACKFILL-END:%s_%s will backfill %s." %
+                     (revision[0:8], buildername, new_revlist))
+            revlists[buildername] = new_revlist
+
+    return revlists
@@ -8,7 +8,9 @@ from buildapi_client import query_jobs_schedule
 from thclient import TreeherderClient
 
 from mozci.errors import TreeherderError, BuildapiError, BuildjsonError
+from mozci.utils import metrics
 from mozci.utils.authentication import get_credentials
+from mozci.utils.parallel import KeyedLocks
 from mozci.platforms import list_builders
 from mozci.sources.buildjson import query_job_data
 
@@ -19,6 +21,8 @@ LOG = logging.getLogger('mozci')
 PENDING, RUNNING, COALESCED, UNKNOWN = range(-4, 0)
 SUCCESS, WARNING, FAILURE, SKIPPED, EXCEPTION, RETRY, CANCELLED = range(7)
 JOBS_CACHE = {}
+# Revisions evaluated in parallel should not query the jobs of the same push at once
+_JOBS_LOCKS = KeyedLocks()
 
 
 class QueryApi(object):
@@ -42,6 +46,11 @@ class QueryApi(object):
     def get_job_status(self, job):
         pass
 
+    def get_buildername(self, job):
+        """Return the buildername of a job returned by get_all_jobs()."""
+        return job["buildername"]
+
+    @metrics.timed('determine_missing_jobs')
     def determine_missing_jobs(self, repo_name, revision, considered_list_of_builders=None):
         if considered_list_of_builders is None:
             considered_list_of_builders = list_builders(repo_name=repo_name)
@@ -61,7 +70,7 @@ class QueryApi(object):
     def _select_missing_jobs(self, repo_name, revision, considered_list_of_builders):
         all_jobs = self.get_all_jobs(repo_name, revision)
         for job in all_jobs:
-            buildername = job["buildername"]
+            buildername = self.get_buildername(job)
             try:
                 considered_list_of_builders.remove(buildername)
             except KeyError:
@@ -93,7 +102,7 @@ class QueryApi(object):
         wrong_status_builders = set()
         correct_status_builders = set()
         for job in all_jobs:
-            buildername = job["buildername"]
+            buildername = self.get_buildername(job)
             try:
                 if self.get_job_status(job) != status:
                     wrong_status_builders.add(buildername)
@@ -116,11 +125,17 @@ class BuildApi(QueryApi):
 
         If we can't query about this revision in buildapi_client we return an empty list.
         """
-        if (repo_name, revision) not in JOBS_CACHE:
-            JOBS_CACHE[(repo_name, revision)] = \
-                query_jobs_schedule(repo_name, revision, auth=get_credentials())
+        key = (repo_name, revision)
+        with _JOBS_LOCKS(key):
+            if key not in JOBS_CACHE:
+                metrics.cache_miss('JOBS_CACHE')
+                with metrics.phase('buildapi_jobs'):
+                    JOBS_CACHE[key] = \
+                        query_jobs_schedule(repo_name, revision, auth=get_credentials())
+            else:
+                metrics.cache_hit('JOBS_CACHE')
 
-        return JOBS_CACHE[(repo_name, revision)]
+            return JOBS_CACHE[key]
 
     def get_buildapi_request_id(self, repo_name, job):
         """ Method to return buildapi's request_id for a job. """
@@ -196,7 +211,7 @@ class BuildApi(QueryApi):
         right_status_buildernames = set()
         wrong_status_buildernames = set()
         for job in all_jobs:
-            buildername = job["buildername"]
+            buildername = self.get_buildername(job)
             try:
                 if self.get_job_status(job) == status:
                     request_id = self.get_buildapi_request_id(repo_name, job)
@@ -243,6 +258,9 @@ class TreeherderApi(QueryApi):
                                                                 **query_params)
         return artifact_content[0]["blob"]["request_id"]
 
+    def get_buildername(self, job):
+        return job["ref_data_name"]
+
     def get_hidden_jobs(self, repo_name, revision):
         """ Return all hidden jobs on Treeherder """
         return self.get_all_jobs(repo_name, revision=revision, visibility='excluded')
@@ -6,15 +6,19 @@ from __future__ import absolute_import
 import json
 import logging
 import os
+import threading
 
 from thclient import TreeherderClient
 
 from mozci.errors import MozciError
+from mozci.utils import metrics
 from mozci.utils.transfer import path_to_file
 
 LOG = logging.getLogger('mozci')
 REPOSITORIES_FILE = path_to_file("repositories.txt")
 REPOSITORIES = {}
+# Builders evaluated in parallel should not load the repositories at once
+_LOAD_LOCK = threading.Lock()
 TREEHERDER_URL = 'treeherder.mozilla.org'
 
 
@@ -58,32 +62,43 @@ def query_repositories(clobber=False):
     """
     global REPOSITORIES
 
-    if clobber:
-        REPOSITORIES = {}
-        if os.path.exists(REPOSITORIES_FILE):
-            os.remove(REPOSITORIES_FILE)
-
-    if REPOSITORIES:
+    if REPOSITORIES and not clobber:
+        metrics.cache_hit('REPOSITORIES')
         return REPOSITORIES
 
-    if os.path.exists(REPOSITORIES_FILE):
-        LOG.debug("Loading %s" % REPOSITORIES_FILE)
-        fd = open(REPOSITORIES_FILE)
-        REPOSITORIES = json.load(fd)
-    else:
-
-        th_client = TreeherderClient(protocol='https', host=TREEHERDER_URL)
-        treeherderRepos = th_client.get_repositories()
-        REPOSITORIES = {}
-        for th_repo in treeherderRepos:
-            if th_repo['active_status'] == "active":
-                repo = {}
-                repo['repo'] = th_repo['url']
-                repo['repo_type'] = th_repo['dvcs_type']
-                repo['graph_branches'] = [th_repo['name'].capitalize()]
-                REPOSITORIES[th_repo['name']] = repo
-
-        with open(REPOSITORIES_FILE, "wb") as fd:
-            json.dump(REPOSITORIES, fd)
-
-    return REPOSITORIES
+    with _LOAD_LOCK:
+        if clobber:
+            REPOSITORIES = {}
+            if os.path.exists(REPOSITORIES_FILE):
+                os.remove(REPOSITORIES_FILE)
+
+        # Another thread might have loaded them while we waited
+        if REPOSITORIES:
+            metrics.cache_hit('REPOSITORIES')
+            return REPOSITORIES
+
+        metrics.cache_miss('REPOSITORIES')
+
+        if os.path.exists(REPOSITORIES_FILE):
+            LOG.debug("Loading %s" % REPOSITORIES_FILE)
+            fd = open(REPOSITORIES_FILE)
+            repositories = json.load(fd)
+        else:
+
+            th_client = TreeherderClient(protocol='https', host=TREEHERDER_URL)
+            treeherderRepos = th_client.get_repositories()
+            repositories = {}
+            for th_repo in treeherderRepos:
+                if th_repo['active_status'] == "active":
+                    repo = {}
+                    repo['repo'] = th_repo['url']
+                    repo['repo_type'] = th_repo['dvcs_type']
+                    repo['graph_branches'] = [th_repo['name'].capitalize()]
+                    repositories[th_repo['name']] = repo
+
+            with open(REPOSITORIES_FILE, "wb") as fd:
+                json.dump(repositories, fd)
+
+        # Other threads only see the repositories once they are complete
+        REPOSITORIES = repositories
+        return REPOSITORIES
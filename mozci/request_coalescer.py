@@ -0,0 +1,168 @@
+"""
+This module helps us make fewer and concurrent scheduling requests to buildapi.
+
+Requests are queued in a RequestCoalescer and sent when calling flush():
+
+* Retrigger requests of the same builder on the same revision (or of the same
+  request id) are merged into a single request with a count
+* Arbitrary job requests of the same builder on the same revision (with the same
+  files and properties) are counted together; buildapi has no count for them so
+  we make one request per job
+* Independent requests are sent concurrently with a bounded number of workers
+* A request which fails (an exception or a response other than 202) calls the
+  on_failure callback it was queued with; e.g. to release the claim of a build
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import sys
+
+from collections import OrderedDict
+
+from buildapi_client import make_retrigger_request, trigger_arbitrary_job
+
+from mozci.utils.authentication import get_credentials
+from mozci.utils.parallel import RateLimiter, parallel_map
+
+LOG = logging.getLogger('mozci')
+# Maximum number of requests sent at the same time
+MAX_WORKERS = 4
+
+
+class RequestCoalescer(object):
+    """Queue buildapi scheduling requests, merge them and send them concurrently."""
+
+    def __init__(self, dry_run=False, workers=MAX_WORKERS, rate_limit=None):
+        self.dry_run = dry_run
+        self.workers = workers
+        self.rate_limiter = RateLimiter(rate_limit)
+        # Merged requests in the order they were first added
+        self._requests = OrderedDict()
+        # The requests of the last flush() which failed; once per HTTP request
+        self.failed = []
+
+    def __len__(self):
+        """Return the number of HTTP requests flush() would make."""
+        return sum(1 if r['type'] == 'retrigger' else r['count']
+                   for r in self._requests.values())
+
+    def retrigger(self, repo_name, request_id, count=1, buildername=None, revision=None):
+        """Queue a retrigger of the job identified by request_id.
+
+        If buildername and revision are given, retriggers of any job of that builder
+        on that revision are merged together.
+        """
+        if buildername and revision:
+            key = ('retrigger', repo_name, revision, buildername)
+        else:
+            key = ('retrigger', repo_name, request_id)
+
+        if key in self._requests:
+            self._requests[key]['count'] += count
+        else:
+            self._requests[key] = {
+                'type': 'retrigger',
+                'repo_name': repo_name,
+                'request_id': request_id,
+                'count': count,
+            }
+
+    def trigger(self, repo_name, builder, revision, files=None, extra_properties=None,
+                count=1, on_failure=None):
+        """Queue 'count' arbitrary jobs of builder on revision.
+
+        on_failure is called (without arguments) once if any of the requests fails.
+        """
+        key = ('trigger', repo_name, revision, builder,
+               json.dumps(files), json.dumps(extra_properties, sort_keys=True))
+
+        if key in self._requests:
+            self._requests[key]['count'] += count
+            if on_failure is not None:
+                self._requests[key]['on_failure'].append(on_failure)
+        else:
+            self._requests[key] = {
+                'type': 'trigger',
+                'repo_name': repo_name,
+                'builder': builder,
+                'revision': revision,
+                'files': files,
+                'extra_properties': extra_properties,
+                'count': count,
+                # The callbacks of every trigger() merged into this request
+                'on_failure': [on_failure] if on_failure is not None else [],
+            }
+
+    def _send(self, request):
+        self.rate_limiter.wait()
+        if request['type'] == 'retrigger':
+            return make_retrigger_request(
+                repo_name=request['repo_name'],
+                request_id=request['request_id'],
+                auth=get_credentials(),
+                count=request['count'],
+                dry_run=self.dry_run)
+
+        return trigger_arbitrary_job(
+            repo_name=request['repo_name'],
+            builder=request['builder'],
+            revision=request['revision'],
+            auth=get_credentials(),
+            files=request['files'],
+            dry_run=self.dry_run,
+            extra_properties=request['extra_properties'])
+
+    def _send_catching(self, request):
+        """Return (response, None) or (None, exc_info) if the request raised."""
+        try:
+            return self._send(request), None
+        except Exception:
+            return None, sys.exc_info()
+
+    def flush(self):
+        """Send every queued request and return the list of responses.
+
+        The responses are in the order the requests were first queued. Every request
+        is sent even if some fail; the failed ones are in self.failed afterwards and
+        the first exception raised by a request is raised again.
+        """
+        http_requests = []
+        for request in self._requests.values():
+            if request['type'] == 'retrigger':
+                http_requests.append(request)
+            else:
+                http_requests.extend([request] * request['count'])
+        self._requests = OrderedDict()
+        self.failed = []
+
+        if not http_requests:
+            return []
+
+        LOG.debug("Sending %d request(s) to buildapi." % len(http_requests))
+        # Make sure the credentials are not asked for from several threads
+        get_credentials()
+        results = parallel_map(self._send_catching, http_requests, workers=self.workers)
+
+        errors = []
+        for request, (response, exc_info) in zip(http_requests, results):
+            if exc_info is not None:
+                errors.append(exc_info)
+            elif response is None or response.status_code == 202:
+                # Dry-run requests have no response
+                continue
+            self.failed.append(request)
+
+        # The same request is in self.failed for each of its jobs which failed
+        notified = set()
+        for request in self.failed:
+            if id(request) not in notified:
+                notified.add(id(request))
+                for on_failure in request.get('on_failure', []):
+                    on_failure()
+
+        if errors:
+            LOG.warning("%d request(s) raised an exception." % len(errors))
+            raise errors[0][0], errors[0][1], errors[0][2]
+
+        return [response for response, _ in results]
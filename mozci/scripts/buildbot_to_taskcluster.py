@@ -15,9 +15,9 @@ from mozci.sources.buildbot_bridge import (
     trigger_builders_based_on_task_id,
     generate_tc_graph_from_builders
 )
-from mozci.sources.tc import credentials_available
+from mozci.sources.tc import credentials_available, set_graph_output
 from mozci.repositories import query_repo_url
-from mozhginfo.pushlog_client import query_push_by_revision
+from mozci.sources.pushlog import query_push_by_revision
 
 
 def main():
@@ -71,6 +71,13 @@ def main():
                         help='Graph of builders in the form of: '
                              'dict(builder: [dep_builders].')
 
+    parser.add_argument("--graph-output",
+                        dest="graph_output",
+                        type=str,
+                        help="Where to write the TaskCluster graphs we schedule: 'none', "
+                        "'compact' (JSON on stdout) or the path of a file. By default "
+                        "graphs are only printed in dry-run mode.")
+
     options = parser.parse_args()
 
     if options.debug:
@@ -81,6 +88,8 @@ def main():
     assert options.repo_name and options.revision, \
         "Make sure you specify --repo-name and --revision"
 
+    set_graph_output(options.graph_output)
+
     if not options.dry_run and not credentials_available():
         sys.exit(1)
     repo_url = query_repo_url(options.repo_name)
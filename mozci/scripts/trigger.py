@@ -4,26 +4,33 @@ import urllib
 
 from argparse import ArgumentParser
 
-from buildapi_client import make_retrigger_request
-
+from mozci.bisection import bisect_backfill
+from mozci.build_watcher import BuildWatcher
 from mozci.ci_manager import BuildAPIManager, TaskClusterBuildbotManager
 from mozci.mozci import (
+    disable_build_request_dedupe,
     find_backfill_revlist,
+    find_backfill_revlists,
     query_builders,
     query_repo_name_from_buildername,
     query_repo_url_from_buildername,
+    select_seta_revisions,
     set_query_source
 )
 from mozci.query_jobs import BuildApi, COALESCED, TreeherderApi
+from mozci.request_coalescer import RequestCoalescer
 from mozci.repositories import query_repo_url
-from mozhginfo.pushlog_client import (
+from mozci.sources.pushlog import (
     query_pushes_by_specified_revision_range,
     query_pushes_by_revision_range,
     query_push_by_revision,
     query_repo_tip
 )
-from mozci.utils.authentication import valid_credentials, get_credentials
+from mozci.sources.tc import set_graph_output
+from mozci.utils import metrics, profiler
+from mozci.utils.authentication import valid_credentials
 from mozci.utils.log_util import setup_logging
+from mozci.utils.profiler import span
 from mozci.platforms import filter_buildernames
 from mozci.query_jobs import WARNING
 
@@ -78,6 +85,20 @@ def parse_args(argv=None):
                         dest="debug",
                         help="set debug for logging.")
 
+    parser.add_argument("--profile",
+                        dest="profile",
+                        nargs="?",
+                        const="mozci-trace.json",
+                        help="Show where the time went (per step, builder and revision) "
+                        "at exit and write a trace for chrome://tracing to this file "
+                        "(mozci-trace.json by default).")
+
+    parser.add_argument("--cprofile",
+                        action="store_true",
+                        dest="cprofile",
+                        help="With --profile, also run cProfile and show the slowest "
+                        "functions of the main thread.")
+
     parser.add_argument("--query-source",
                         metavar="[buildapi|treeherder]",
                         dest="query_source",
@@ -99,10 +120,54 @@ def parse_args(argv=None):
                         dest="trigger_build_if_missing",
                         help="Only trigger test jobs if the build jobs already exists.")
 
+    parser.add_argument("--workers",
+                        dest="workers",
+                        type=int,
+                        default=1,
+                        help="Number of revisions to evaluate concurrently.")
+
+    parser.add_argument("--rate-limit",
+                        dest="rate_limit",
+                        type=float,
+                        help="Maximum number of revisions per second to make "
+                        "scheduling requests for.")
+
+    parser.add_argument("--no-dedupe",
+                        action="store_true",
+                        dest="no_dedupe",
+                        help="Request build jobs even if any mozci process requested them "
+                        "on the same revision within the last 2 hours.")
+
+    parser.add_argument("--watch-builds",
+                        action="store_true",
+                        dest="watch_builds",
+                        help="Wait for the build jobs we trigger to finish and then trigger "
+                        "the test jobs which needed them.")
+
+    parser.add_argument("--watch-timeout",
+                        dest="watch_timeout",
+                        type=int,
+                        help="Maximum number of seconds to wait for build jobs with "
+                        "--watch-builds. Test jobs still waiting are triggered by the next "
+                        "run with --watch-builds.")
+
     parser.add_argument("--taskcluster",
                         action="store_true",
                         help="Schedule jobs through TaskCluster.")
 
+    parser.add_argument("--graph-output",
+                        dest="graph_output",
+                        type=str,
+                        help="Where to write the TaskCluster graphs we schedule: 'none', "
+                        "'compact' (JSON on stdout) or the path of a file. By default "
+                        "graphs are only printed in dry-run mode.")
+
+    parser.add_argument("--combine-revisions",
+                        action="store_true",
+                        dest="combine_revisions",
+                        help="With --taskcluster, schedule the jobs of every revision in as "
+                        "few graphs as possible instead of one graph per revision.")
+
     # Mode #1: Coalesced jobs of a revision
     parser.add_argument("--coalesced",
                         action="store_true",
@@ -133,6 +198,25 @@ def parse_args(argv=None):
                         help="We will trigger jobs starting from --rev in reverse chronological "
                         "order until we find the last revision where there was a good job.")
 
+    parser.add_argument("--seta-aware",
+                        action="store_true",
+                        dest="seta_aware",
+                        help="Skip the revisions on which SETA would not have scheduled the "
+                        "job when using --back-revisions or --delta. "
+                        "--backfill always does this.")
+
+    parser.add_argument("--bisect",
+                        action="store_true",
+                        dest="bisect",
+                        help="Like --backfill but we bisect the revisions down to the one "
+                        "where the job started failing. Run it again to resume a bisection.")
+
+    parser.add_argument("--bisect-timeout",
+                        dest="bisect_timeout",
+                        type=int,
+                        default=0,
+                        help="Number of seconds to wait for job results with --bisect.")
+
     parser.add_argument("--trigger-only-test-jobs",
                         action="store_true",
                         dest="trigger_tests_only",
@@ -184,10 +268,12 @@ def validate_options(options):
         if options.backfill or options.delta or options.from_rev:
             error_message = "You should not pass --backfill, --delta or --end-rev " \
                             "when you use --back-revisions."
-    elif options.backfill:
+    elif options.backfill or options.bisect:
         if options.delta or options.from_rev:
             error_message = "You should not pass --delta or --end-rev " \
-                            "when you use --backfill."
+                            "when you use --backfill or --bisect."
+        if options.backfill and options.bisect:
+            error_message = "You should not pass --backfill when you use --bisect."
     elif options.delta:
         if options.from_rev:
             error_message = "You should not pass --end-rev " \
@@ -231,8 +317,12 @@ def sanitize_buildernames(buildernames):
 
 
 def determine_revlist(repo_url, buildername, rev, back_revisions,
-                      delta, from_rev, backfill, skips, max_revisions):
-    """Determine which revisions we need to trigger."""
+                      delta, from_rev, backfill, skips, max_revisions, seta_aware=False,
+                      backfill_revlists=None):
+    """Determine which revisions we need to trigger.
+
+    backfill_revlists can have the result of find_backfill_revlists() for --backfill.
+    """
     if back_revisions:
         revlist = query_pushes_by_specified_revision_range(
             repo_url=repo_url,
@@ -253,16 +343,22 @@ def determine_revlist(repo_url, buildername, rev, back_revisions,
             to_revision=rev,
             from_revision=from_rev,
             return_revision_list=True)
+    elif backfill and backfill_revlists is not None:
+        revlist = backfill_revlists[buildername]
     elif backfill:
         revlist = find_backfill_revlist(
             buildername=buildername,
             revision=rev,
             max_revisions=max_revisions,
+            seta_aware=True,
         )
 
     else:
         revlist = [rev]
 
+    if seta_aware and (back_revisions or delta):
+        revlist = select_seta_revisions(buildername, revlist, keep=[rev])
+
     if skips:
         revlist = revlist[::skips]
 
@@ -291,6 +387,9 @@ def main():
     else:
         LOG = setup_logging(logging.INFO)
 
+    if options.profile:
+        profiler.start(options.profile, cprofile=options.cprofile)
+
     validate_options(options)
 
     if not valid_credentials():
@@ -298,9 +397,13 @@ def main():
 
     # Setting the QUERY_SOURCE global variable in mozci.py
     set_query_source(options.query_source)
+    set_graph_output(options.graph_output)
+    if options.no_dedupe:
+        disable_build_request_dedupe()
 
     if options.buildernames:
-        options.buildernames = sanitize_buildernames(options.buildernames)
+        with metrics.phase('sanitize'):
+            options.buildernames = sanitize_buildernames(options.buildernames)
         repo_url = query_repo_url_from_buildername(options.buildernames[0])
 
     if not options.repo_name:
@@ -319,7 +422,7 @@ def main():
 
     # Schedule jobs through TaskCluster if --taskcluster option has been set to true
     if options.taskcluster:
-        mgr = TaskClusterBuildbotManager()
+        mgr = TaskClusterBuildbotManager(combine_revisions=options.combine_revisions)
     else:
         mgr = BuildAPIManager()
 
@@ -330,11 +433,11 @@ def main():
                                                         revision, COALESCED)
         if len(request_ids) == 0:
             LOG.info('We did not find any coalesced job')
+        # Every retrigger is sent concurrently
+        coalescer = RequestCoalescer(dry_run=options.dry_run, rate_limit=options.rate_limit)
         for request_id in request_ids:
-            make_retrigger_request(repo_name=repo_name,
-                                   request_id=request_id,
-                                   auth=get_credentials(),
-                                   dry_run=options.dry_run)
+            coalescer.retrigger(repo_name=repo_name, request_id=request_id)
+        coalescer.flush()
 
         return
 
@@ -390,40 +493,72 @@ def main():
             revision=revision,
             status=WARNING)
 
-    for buildername in buildernames:
-        revlist = determine_revlist(
-            repo_url=repo_url,
-            buildername=buildername,
-            rev=revision,
-            back_revisions=options.back_revisions,
-            delta=options.delta,
-            from_rev=options.from_rev,
-            backfill=options.backfill,
-            skips=options.skips,
-            max_revisions=options.max_revisions)
-
-        _print_treeherder_link(
-            revlist=revlist,
-            repo_name=repo_name,
-            buildername=buildername,
+    watcher = None
+    if options.watch_builds and not options.taskcluster:
+        watcher = BuildWatcher(rate_limit=options.rate_limit)
+
+    backfill_revlists = None
+    if options.backfill and len(buildernames) > 1:
+        # Look at the jobs of every revision once for all builders
+        backfill_revlists = find_backfill_revlists(
+            buildernames=buildernames,
             revision=revision,
-            log=LOG,
-            includes=options.includes,
-            exclude=options.exclude)
+            max_revisions=options.max_revisions,
+            seta_aware=True)
 
-        try:
-            mgr.trigger_range(
-                buildername=buildername,
+    for buildername in buildernames:
+        with span('builder', builder=buildername):
+            if options.bisect:
+                bisect_backfill(
+                    buildername=buildername,
+                    revision=revision,
+                    max_revisions=options.max_revisions,
+                    dry_run=options.dry_run,
+                    timeout=options.bisect_timeout)
+                continue
+
+            with metrics.phase('revlist'):
+                revlist = determine_revlist(
+                    repo_url=repo_url,
+                    buildername=buildername,
+                    rev=revision,
+                    back_revisions=options.back_revisions,
+                    delta=options.delta,
+                    from_rev=options.from_rev,
+                    backfill=options.backfill,
+                    skips=options.skips,
+                    max_revisions=options.max_revisions,
+                    seta_aware=options.seta_aware,
+                    backfill_revlists=backfill_revlists)
+
+            _print_treeherder_link(
+                revlist=revlist,
                 repo_name=repo_name,
-                revisions=revlist,
-                times=options.times,
-                dry_run=options.dry_run,
-                files=options.files,
-                trigger_build_if_missing=options.trigger_build_if_missing
-            )
-        except Exception, e:
-            LOG.exception(e)
-            exit(1)
+                buildername=buildername,
+                revision=revision,
+                log=LOG,
+                includes=options.includes,
+                exclude=options.exclude)
+
+            try:
+                mgr.trigger_range(
+                    buildername=buildername,
+                    repo_name=repo_name,
+                    revisions=revlist,
+                    times=options.times,
+                    dry_run=options.dry_run,
+                    files=options.files,
+                    trigger_build_if_missing=options.trigger_build_if_missing,
+                    workers=options.workers,
+                    rate_limit=options.rate_limit,
+                    watcher=watcher
+                )
+            except Exception, e:
+                LOG.exception(e)
+                exit(1)
+
+    if watcher is not None:
+        watcher.run(timeout=options.watch_timeout)
 
 if __name__ == "__main__":
     try:
@@ -49,9 +49,11 @@ It contains a dictionary with 4 keys:
 import json
 import logging
 import os
+import threading
 
 import requests
 
+from mozci.utils import metrics
 from mozci.utils.transfer import path_to_file
 
 LOG = logging.getLogger('mozci')
@@ -61,6 +63,8 @@ ALLTHETHINGS = \
     "https://secure.pub.build.mozilla.org/builddata/reports/allthethings.json"
 
 DATA = None
+# Builders evaluated in parallel should not load allthethings.json at once
+_LOAD_LOCK = threading.Lock()
 
 
 def fetch_allthethings_data(no_caching=False, verify=True):
@@ -81,6 +85,7 @@ def fetch_allthethings_data(no_caching=False, verify=True):
                 if chunk:  # filter out keep-alive new chunks
                     fd.write(chunk)
                     fd.flush()
+                    metrics.inc('mozci_downloaded_bytes_total', len(chunk))
 
         if _verify_file_integrity():
             fd = open(FILENAME, "r")
@@ -105,20 +110,31 @@ def fetch_allthethings_data(no_caching=False, verify=True):
 
     global DATA
 
-    if no_caching:
-        DATA = _fetch()
-    # If we do not have an in-memory cache, try to use the file cache.
-    elif DATA is None:
-        # Only use the file cache if it is up-to-date and not corrupted.
-        if not verify or _verify_file_integrity():
-            assert os.path.exists(FILENAME), \
-                "verify=False should only be used if allthethings.json exists."
-            fd = open(FILENAME)
-            DATA = json.load(fd)
-        else:
-            DATA = _fetch()
-
-    return DATA
+    if DATA is not None and not no_caching:
+        metrics.cache_hit('DATA')
+        return DATA
+
+    with _LOAD_LOCK:
+        # Another thread might have loaded it while we waited
+        if DATA is not None and not no_caching:
+            metrics.cache_hit('DATA')
+            return DATA
+
+        metrics.cache_miss('DATA')
+        with metrics.phase('allthethings'):
+            if no_caching:
+                DATA = _fetch()
+            # If we do not have an in-memory cache, try to use the file cache.
+            # Only use the file cache if it is up-to-date and not corrupted.
+            elif not verify or _verify_file_integrity():
+                assert os.path.exists(FILENAME), \
+                    "verify=False should only be used if allthethings.json exists."
+                fd = open(FILENAME)
+                DATA = json.load(fd)
+            else:
+                DATA = _fetch()
+
+        return DATA
 
 
 def _list_builders():
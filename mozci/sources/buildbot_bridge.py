@@ -25,16 +25,18 @@ from __future__ import absolute_import
 
 import logging
 
+from mozci.buildbot_graph import BuildbotGraph
 from mozci.errors import MozciError
-from mozci.mozci import determine_trigger_objective, valid_builder
+from mozci.mozci import determine_trigger_objectives, valid_builder
 from mozci.platforms import (
     is_downstream,
     is_upstream,
     get_buildername_metadata
 )
 from mozci.repositories import query_repo_url
-from mozhginfo.pushlog_client import query_push_by_revision
+from mozci.sources.pushlog import query_push_by_revision
 from mozci.sources.tc import (
+    MAX_TASKS_PER_GRAPH,
     get_task,
     get_task_graph_status,
     create_task,
@@ -48,8 +50,30 @@ from taskcluster.utils import slugId
 LOG = logging.getLogger('mozci')
 
 
+def _push_template(repo_name, revision):
+    """Return the push information every task of a graph needs.
+
+    We compute it once per graph instead of querying pushlog for every task.
+    """
+    repo_url = query_repo_url(repo_name)
+    push_info = query_push_by_revision(repo_url=repo_url, revision=revision)
+    return {
+        'repo_name': repo_name,
+        'revision': revision,
+        'full_revision': str(push_info.changesets[0].node),
+        'who': push_info.user,
+        'metadata': generate_metadata(
+            repo_name=repo_name,
+            revision=revision,
+            name='Mozci BBB graph',
+            push_info=push_info,
+        ),
+    }
+
+
 def _create_task(buildername, repo_name, revision, task_graph_id=None,
-                 parent_task_id=None, requires=None, properties={}, *args, **kwargs):
+                 parent_task_id=None, requires=None, properties={}, push_template=None,
+                 *args, **kwargs):
     """Return takcluster task to trigger a buildbot builder.
 
     This function creates a generic task with the minimum amount of
@@ -69,6 +93,8 @@ def _create_task(buildername, repo_name, revision, task_graph_id=None,
     :type parent_task_id: str
     :param requires: List of taskIds of other tasks which this task depends on.
     :type requires: list
+    :param push_template: The result of _push_template() for repo_name and revision.
+    :type push_template: dict
     :returns: TaskCluster graph
     :rtype: dict
 
@@ -82,19 +108,16 @@ def _create_task(buildername, repo_name, revision, task_graph_id=None,
             "The builder '%s' should be for repo: %s." % (buildername, repo_name)
         )
 
-    repo_url = query_repo_url(repo_name)
-    push_info = query_push_by_revision(repo_url=repo_url, revision=revision)
-    full_revision = str(push_info.changesets[0].node)
+    if push_template is None:
+        push_template = _push_template(repo_name, revision)
 
     # Needed because of bug 1195751
     all_properties = {
         'product': builder_info['product'],
-        'who': push_info.user,
+        'who': push_template['who'],
     }
     all_properties.update(properties)
 
-    # XXX: We should validate that the parent task is a valid parent platform
-    #      e.g. do not schedule Windows tests against Linux builds
     task = create_task(
         repo_name=repo_name,
         revision=revision,
@@ -105,15 +128,11 @@ def _create_task(buildername, repo_name, revision, task_graph_id=None,
             'buildername': buildername,
             'sourcestamp': {
                 'branch': repo_name,
-                'revision': full_revision
+                'revision': push_template['full_revision']
             },
             'properties': all_properties,
         },
-        metadata=generate_metadata(
-            repo_name=repo_name,
-            revision=revision,
-            name=buildername,
-        )
+        metadata=dict(push_template['metadata'], name=buildername)
     )
 
     if requires:
@@ -130,9 +149,7 @@ def _create_task(buildername, repo_name, revision, task_graph_id=None,
 def buildbot_graph_builder(builders, revision, complete=True):
     """ Return graph of builders based on a list of builders.
 
-    # XXX: It would be better if had a BuildbotGraph class instead of messing
-           with dictionaries.
-           https://github.com/mozilla/mozilla_ci_tools/issues/353
+    NOTE: BuildbotGraph.from_dict() turns the returned graph into a BuildbotGraph.
 
     Input: a list of builders and a revision
     Output: a set which includes a graph with the builders we received, the necessary upstream
@@ -164,6 +181,7 @@ def buildbot_graph_builder(builders, revision, complete=True):
     """
     graph = {}
     ready_to_trigger = []
+    test_builders = []
 
     # We need to determine what upstream jobs need to be triggered besides the
     # builders already on our list
@@ -172,34 +190,38 @@ def buildbot_graph_builder(builders, revision, complete=True):
             continue
 
         if is_downstream(b):
-            # For test jobs, determine_trigger_objective()[0] can be 3 things:
-            # - the build job, if no build job exists
-            # - the test job, if the build job is already completed
-            # - None, if the build job is running
-            objective = determine_trigger_objective(revision, b)[0]
-
-            # The build job is already completed, we can trigger the test job
-            if objective == b:
-                # XXX: Fix me - Adding test jobs to the graph without a build associated
-                # to it does not work. This will be fixed once we switch to scheduling
-                # Buildbot jobs through BBB
-                if complete:
-                    graph[b] = None
-                else:
-                    ready_to_trigger.append(b)
+            test_builders.append(b)
+        elif b not in graph:
+            graph[b] = {}
+
+    # For test jobs, the objective can be 3 things:
+    # - the build job, if no build job exists
+    # - the test job, if the build job is already completed
+    # - None, if the build job is running
+    # Test jobs sharing a build job are resolved together
+    objectives = determine_trigger_objectives(revision, test_builders)
+    for b in test_builders:
+        objective = objectives[b][0]
+
+        # The build job is already completed, we can trigger the test job
+        if objective == b:
+            # XXX: Fix me - Adding test jobs to the graph without a build associated
+            # to it does not work. This will be fixed once we switch to scheduling
+            # Buildbot jobs through BBB
+            if complete:
+                graph[b] = None
+            else:
+                ready_to_trigger.append(b)
 
-            # The build job is running, there is nothing we can do
-            elif objective is None:
-                pass
+        # The build job is running, there is nothing we can do
+        elif objective is None:
+            pass
 
-            # We need to trigger the build job and the test job
-            else:
-                if objective not in graph:
-                    graph[objective] = {}
-                graph[objective][b] = None
+        # We need to trigger the build job and the test job
         else:
-            if b not in graph:
-                graph[b] = {}
+            if objective not in graph:
+                graph[objective] = {}
+            graph[objective][b] = None
 
     # We might have left a build job poiting to an empty dict
     for builder in graph:
@@ -222,6 +244,7 @@ def generate_tc_graph_from_builders(builders, repo_name, revision):
     :rtype: dict
 
     """
+    push_template = _push_template(repo_name, revision)
     return generate_task_graph(
         scopes=[
             # This is needed to define tasks which take advantage of the BBB
@@ -229,18 +252,15 @@ def generate_tc_graph_from_builders(builders, repo_name, revision):
         ],
         tasks=_generate_tc_tasks_from_builders(
             builders=builders,
-            repo_name=repo_name,
-            revision=revision
-        ),
-        metadata=generate_metadata(
             repo_name=repo_name,
             revision=revision,
-            name='Mozci BBB graph'
-        )
+            push_template=push_template
+        ),
+        metadata=push_template['metadata']
     )
 
 
-def _generate_tc_tasks_from_builders(builders, repo_name, revision):
+def _generate_tc_tasks_from_builders(builders, repo_name, revision, push_template=None):
     """ Return TC tasks based on a list of builders.
 
     Input: a list of builders and a revision
@@ -252,12 +272,16 @@ def _generate_tc_tasks_from_builders(builders, repo_name, revision):
     :type repo_name: str
     :param revision: push revision
     :type revision: str
+    :param push_template: The result of _push_template() for repo_name and revision.
+    :type push_template: dict
     :return: TC tasks
     :rtype: dict
 
     """
     tasks = []
     build_builders = {}
+    if push_template is None:
+        push_template = _push_template(repo_name, revision)
 
     # We need to determine what upstream jobs need to be triggered besides the
     # builders already on our list
@@ -269,20 +293,23 @@ def _generate_tc_tasks_from_builders(builders, repo_name, revision):
                 revision=revision,
                 # task_graph_id=task_graph_id,
                 properties={'upload_to_task_id': slugId()},
+                push_template=push_template,
             )
             tasks.append(task)
 
             # We want to keep track of how many build builders we have
             build_builders[builder] = task
 
+    # Test jobs sharing a build job are resolved together
+    objectives = determine_trigger_objectives(
+        revision, [builder for builder in builders if is_downstream(builder)])
     for builder in builders:
         if is_downstream(builder):
             # For test jobs, determine_trigger_objective()[0] can be 3 things:
             # - the build job, if no build job exists
             # - the test job, if the build job is already completed
             # - None, if the build job is running
-            objective, package_url, tests_url = \
-                determine_trigger_objective(revision, builder)
+            objective, package_url, tests_url = objectives[builder]
 
             # The build job is already completed, we can trigger the test job
             if objective == builder:
@@ -294,6 +321,7 @@ def _generate_tc_tasks_from_builders(builders, repo_name, revision):
                         buildername=builder,
                         repo_name=repo_name,
                         revision=revision,
+                        push_template=push_template,
                         # task_graph_id=task_graph_id,
                         parent_task_id=build_builders[objective]['taskId'],
                         properties={'upload_to_task_id': slugId()},
@@ -304,6 +332,7 @@ def _generate_tc_tasks_from_builders(builders, repo_name, revision):
                         buildername=builder,
                         repo_name=repo_name,
                         revision=revision,
+                        push_template=push_template,
                         properties={
                             'packageUrl': package_url,
                             'testUrl': tests_url
@@ -324,6 +353,7 @@ def _generate_tc_tasks_from_builders(builders, repo_name, revision):
                         buildername=builder,
                         repo_name=repo_name,
                         revision=revision,
+                        push_template=push_template,
                         # task_graph_id=task_graph_id,
                         properties={'upload_to_task_id': slugId()},
                     )
@@ -339,6 +369,7 @@ def _generate_tc_tasks_from_builders(builders, repo_name, revision):
                     revision=revision,
                     # task_graph_id=task_graph_id,
                     parent_task_id=taskId,
+                    push_template=push_template,
                 )
                 tasks.append(task)
 
@@ -377,7 +408,7 @@ def generate_builders_tc_graph(repo_name, revision, builders_graph, *args, **kwa
     :param builders_graph:
         It is a graph made up of a dictionary where each
         key is a Buildbot buildername. The value for each key is either None
-        or another graph of dependent builders.
+        or another graph of dependent builders. It can also be a BuildbotGraph.
     :type builders_graph: dict
     :returns: return None or a valid taskcluster task graph.
     :rtype: dict
@@ -385,11 +416,10 @@ def generate_builders_tc_graph(repo_name, revision, builders_graph, *args, **kwa
     """
     if builders_graph is None:
         return None
+    push_template = _push_template(repo_name, revision)
     metadata = kwargs.get('metadata')
     if metadata is None:
-        metadata = generate_metadata(repo_name=repo_name,
-                                     revision=revision,
-                                     name='Mozci BBB graph')
+        metadata = push_template['metadata']
     # This is the initial task graph which we're defining
     task_graph = generate_task_graph(
         scopes=[
@@ -399,7 +429,8 @@ def generate_builders_tc_graph(repo_name, revision, builders_graph, *args, **kwa
         tasks=_generate_tasks(
             repo_name=repo_name,
             revision=revision,
-            builders_graph=builders_graph
+            builders_graph=builders_graph,
+            push_template=push_template
         ),
         metadata=metadata
     )
@@ -407,10 +438,72 @@ def generate_builders_tc_graph(repo_name, revision, builders_graph, *args, **kwa
     return task_graph
 
 
+def generate_range_tc_graphs(repo_name, buildbot_graph, max_tasks=MAX_TASKS_PER_GRAPH):
+    """Return TaskCluster graphs with the tasks of a BuildbotGraph of many revisions.
+
+    The tasks of a revision are never split between graphs; we put as many revisions
+    in a graph as it fits within max_tasks tasks. The name of each task includes
+    its revision and the description of each graph lists its revisions.
+
+    :param repo_name The name of a repository e.g. mozilla-inbound
+    :type repo_name: str
+    :param buildbot_graph: The builders to trigger on every revision.
+    :type buildbot_graph: BuildbotGraph
+    :returns: A list of valid taskcluster task graphs.
+    :rtype: list
+
+    """
+    task_graphs = []
+    tasks = []
+    templates = []
+
+    def _add_graph():
+        revisions = ', '.join(template['revision'][:12] for template in templates)
+        metadata = dict(templates[0]['metadata'],
+                        name='Mozci BBB graph for %d revisions' % len(templates),
+                        description='Task graph generated via Mozilla CI tools for the '
+                                    'revisions %s' % revisions)
+        task_graphs.append(generate_task_graph(
+            scopes=[
+                # This is needed to define tasks which take advantage of the BBB
+                'queue:define-task:buildbot-bridge/buildbot-bridge',
+            ],
+            tasks=list(tasks),
+            metadata=metadata
+        ))
+        del tasks[:]
+        del templates[:]
+
+    for revision in buildbot_graph.revisions:
+        push_template = _push_template(repo_name, revision)
+        revision_tasks = _generate_tasks(
+            repo_name=repo_name,
+            revision=revision,
+            builders_graph=buildbot_graph,
+            push_template=push_template
+        )
+        for task in revision_tasks:
+            metadata = task['task']['metadata']
+            metadata['name'] = '%s %s' % (metadata['name'], revision[:12])
+
+        if tasks and len(tasks) + len(revision_tasks) > max_tasks:
+            _add_graph()
+        tasks.extend(revision_tasks)
+        templates.append(push_template)
+
+    if tasks:
+        _add_graph()
+
+    return task_graphs
+
+
 def _generate_tasks(repo_name, revision, builders_graph, task_graph_id=None,
-                    parent_task_id=None, required_task_ids=[], **kwargs):
+                    parent_task_id=None, required_task_ids=[], push_template=None, **kwargs):
     """ Generate a TC json object with tasks based on a graph of graphs of buildernames
 
+    The graph is validated first; a builder cannot be triggered by a builder of
+    another platform (e.g. Windows tests by a Linux build).
+
     :param repo_name: The name of a repository e.g. mozilla-inbound
     :type repo_name: str
     :param revision: Changeset ID of a revision.
@@ -418,12 +511,15 @@ def _generate_tasks(repo_name, revision, builders_graph, task_graph_id=None,
     :param builders_graph:
         It is a graph made up of a dictionary where each
         key is a Buildbot buildername. The value for each key is either None
-        or another graph of dependent builders.
+        or another graph of dependent builders. It can also be a BuildbotGraph;
+        we only generate the tasks of revision.
     :type builders_graph: dict
     :param task_graph_id: TC graph id to which this task belongs to
     :type task_graph_id: str
     :param parent_task_id: Task from which to find artifacts. It is not a dependency.
     :type parent_task_id: int
+    :param push_template: The result of _push_template() for repo_name and revision.
+    :type push_template: dict
     :returns: A dictionary of TC tasks
     :rtype: dict
 
@@ -431,43 +527,46 @@ def _generate_tasks(repo_name, revision, builders_graph, task_graph_id=None,
     if not type(required_task_ids) == list:
         raise MozciError("required_task_ids must be a list")
 
-    tasks = []
+    if isinstance(builders_graph, BuildbotGraph):
+        buildbot_graph = builders_graph
+    else:
+        buildbot_graph = BuildbotGraph.from_dict(builders_graph, revision)
+    buildbot_graph.validate(revision)
+
+    if push_template is None:
+        push_template = _push_template(repo_name, revision)
 
-    if type(builders_graph) != dict:
-        raise MozciError("The buildbot graph should be a dictionary")
+    tasks = []
+    # Node id -> (upload_to_task_id, taskId) of the task of the node
+    node_tasks = {}
+    # Parents come before the builders they trigger
+    for node_id in buildbot_graph.topological_order(revision):
+        parent = buildbot_graph.parent(node_id)
+        if parent is None:
+            parent_ids = (parent_task_id, required_task_ids)
+        else:
+            # The parent task id is used to find artifacts; only one can be given.
+            # The required tasks are the one holding this task from running.
+            upload_to_task_id, task_id = node_tasks[parent]
+            parent_ids = (upload_to_task_id, [task_id])
 
-    # Let's iterate through the root builders in this graph
-    for builder, dependent_graph in builders_graph.iteritems():
         # Due to bug 1221091 this will be used to know to which task
         # the artifacts will be uploaded to
         upload_to_task_id = slugId()
         task = _create_task(
-            buildername=builder,
+            buildername=buildbot_graph.node(node_id)[1],
             repo_name=repo_name,
             revision=revision,
             task_graph_id=task_graph_id,
-            parent_task_id=parent_task_id,
+            parent_task_id=parent_ids[0],
             properties={'upload_to_task_id': upload_to_task_id},
-            requires=required_task_ids,
+            requires=parent_ids[1],
+            push_template=push_template,
             **kwargs
         )
-        task_id = task['taskId']
+        node_tasks[node_id] = (upload_to_task_id, task['taskId'])
         tasks.append(task)
 
-        if dependent_graph:
-            # If there are builders this builder triggers let's add them as well
-            tasks = tasks + _generate_tasks(
-                repo_name=repo_name,
-                revision=revision,
-                builders_graph=dependent_graph,
-                task_graph_id=task_graph_id,
-                # The parent task id is used to find artifacts; only one can be given
-                parent_task_id=upload_to_task_id,
-                # The required tasks are the one holding this task from running
-                required_task_ids=[task_id],
-                **kwargs
-            )
-
     return tasks
 
 
@@ -501,6 +600,7 @@ def trigger_builders_based_on_task_id(repo_name, revision, task_id, builders,
     else:
         required_task_ids = []
 
+    push_template = _push_template(repo_name, revision)
     task_graph = generate_task_graph(
         scopes=[
             # This is needed to define tasks which take advantage of the BBB
@@ -514,12 +614,9 @@ def trigger_builders_based_on_task_id(repo_name, revision, task_id, builders,
             parent_task_id=task_id,
             # This creates dependencies on other tasks
             required_task_ids=required_task_ids,
+            push_template=push_template,
         ),
-        metadata=generate_metadata(
-            repo_name=repo_name,
-            revision=revision,
-            name='Mozci BBB graph'
-        )
+        metadata=push_template['metadata']
     )
 
     if state == "running":
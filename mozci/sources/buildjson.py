@@ -6,6 +6,8 @@ systems: http://builddata.pub.build.mozilla.org/builddata/buildjson
 import logging
 import os
 
+from mozci.utils import metrics
+from mozci.utils.parallel import KeyedLocks
 from mozci.utils.tzone import utc_dt, utc_time, utc_day
 from mozci.utils.transfer import load_file, path_to_file
 
@@ -18,6 +20,8 @@ BUILDS_DAY_FILE = "builds-%s.js"
 
 # This helps us read into memory and load less from disk
 BUILDS_CACHE = {}
+# Jobs evaluated in parallel should not download the same file at once
+_FETCH_LOCKS = KeyedLocks()
 
 
 def fetch_by_date(date):
@@ -34,19 +38,23 @@ def _fetch_data(filename):
     Returns all jobs inside of this buildjson file.
     """
     global BUILDS_CACHE
-    if filename in BUILDS_CACHE:
-        return BUILDS_CACHE[filename]
-    url = "%s/%s.gz" % (BUILDJSON_DATA, filename)
+    with _FETCH_LOCKS(filename):
+        if filename in BUILDS_CACHE:
+            metrics.cache_hit('BUILDS_CACHE')
+            return BUILDS_CACHE[filename]
+        metrics.cache_miss('BUILDS_CACHE')
+        url = "%s/%s.gz" % (BUILDJSON_DATA, filename)
 
-    if not os.path.isabs(filename):
-        filepath = path_to_file(filename)
-    else:
-        filepath = filename
+        if not os.path.isabs(filename):
+            filepath = path_to_file(filename)
+        else:
+            filepath = filename
 
-    # If the file exists and is valid we won't download it again
-    json_contents = load_file(filepath, url)
-    BUILDS_CACHE[filename] = json_contents["builds"]
-    return json_contents["builds"]
+        # If the file exists and is valid we won't download it again
+        with metrics.phase('buildjson'):
+            json_contents = load_file(filepath, url)
+        BUILDS_CACHE[filename] = json_contents["builds"]
+        return json_contents["builds"]
 
 
 def _find_job(request_id, jobs, loaded_from):
@@ -158,7 +166,7 @@ def query_job_data(complete_at, request_id):
     # it fails, we will raise an Exception
     LOG.debug("We did not find %d in %s, we'll clear our cache and try again."
               % (request_id, filename))
-    del BUILDS_CACHE[filename]
+    BUILDS_CACHE.pop(filename, None)
 
     job = _find_job(request_id, _fetch_data(filename), filename)
     if job:
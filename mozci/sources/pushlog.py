@@ -0,0 +1,252 @@
+"""
+This module allow us to interact with the hg.mozilla.org pushlog.
+
+Pushes are stored in a local sqlite database (under ~/.mozilla/mozci) keyed by
+repository and push id. Range queries are served from it; we only ask the pushlog
+for the pushes we don't have (usually the ones newer than the last stored push).
+Push ids are contiguous in the pushlog and pushes never change, so stored pushes
+never become stale.
+
+The functions of this module mirror the ones of mozhginfo.pushlog_client. Lists of
+pushes (or revisions) are ordered from the newest push to the oldest one.
+A revision refers to the last changeset of a push unless stated otherwise.
+"""
+from __future__ import absolute_import
+
+import logging
+
+import requests
+
+from mozci.errors import PushlogError
+from mozci.utils import metrics
+from mozci.utils.sqlite_store import SqliteStore
+from mozci.utils.transfer import path_to_file
+
+LOG = logging.getLogger('mozci')
+JSON_PUSHES = "%(repo_url)s/json-pushes"
+PUSHLOG_DB = path_to_file('pushlog.db')
+# The store used by the functions of this module (see _pushlog_store())
+PUSHLOG_STORE = None
+
+
+class Changeset(object):
+    def __init__(self, node):
+        self.node = node
+
+
+class Push(object):
+    """A push with its changesets; the last changeset of the push comes first."""
+
+    def __init__(self, push_id, date, user, nodes):
+        self.id = push_id
+        self.date = date
+        self.user = user
+        self.changesets = [Changeset(node) for node in nodes]
+
+    def __repr__(self):
+        return '<Push %d %s>' % (self.id, self.changesets[0].node[:12])
+
+
+class PushlogStore(SqliteStore):
+    """Local copy of the pushes of any number of repositories."""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS pushes ('
+        'repo_url TEXT, push_id INTEGER, date INTEGER, user TEXT, '
+        'PRIMARY KEY (repo_url, push_id))',
+        # position 0 is the last changeset of the push
+        'CREATE TABLE IF NOT EXISTS changesets ('
+        'repo_url TEXT, node TEXT, push_id INTEGER, position INTEGER, '
+        'PRIMARY KEY (repo_url, node))',
+    )
+
+    def __init__(self, path=PUSHLOG_DB):
+        super(PushlogStore, self).__init__(path)
+
+    @metrics.timed('pushlog')
+    def _fetch(self, repo_url, **params):
+        """Query the pushlog and store the pushes it returns.
+
+        Raises PushlogError if the pushlog cannot be reached.
+        """
+        params['version'] = 2
+        url = JSON_PUSHES % {'repo_url': repo_url}
+        LOG.debug("Fetching pushes from %s with %s" % (url, params))
+        try:
+            req = requests.get(url, params=params, timeout=60)
+        except requests.exceptions.RequestException, e:
+            raise PushlogError("We could not reach %s: %s" % (url, e))
+
+        if req.status_code == 404:
+            # The pushlog returns 404 for unknown changesets
+            return 0
+        if req.status_code != 200:
+            raise PushlogError("%s returned status code %d." % (url, req.status_code))
+
+        pushes = req.json()['pushes']
+        with self.transaction() as conn:
+            for push_id, push in pushes.iteritems():
+                conn.execute(
+                    'INSERT OR REPLACE INTO pushes (repo_url, push_id, date, user) '
+                    'VALUES (?, ?, ?, ?)',
+                    (repo_url, int(push_id), push['date'], push['user']))
+                # The pushlog lists the changesets of a push from oldest to newest
+                conn.executemany(
+                    'INSERT OR REPLACE INTO changesets (repo_url, node, push_id, position) '
+                    'VALUES (?, ?, ?, ?)',
+                    [(repo_url, node, int(push_id), position)
+                     for position, node in enumerate(reversed(push['changesets']))])
+
+        return len(pushes)
+
+    def last_push_id(self, repo_url):
+        """Return the id of the newest push we have stored for a repository or None."""
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT MAX(push_id) FROM pushes WHERE repo_url = ?',
+                                (repo_url,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def sync(self, repo_url):
+        """Fetch the pushes newer than the last one stored and return how many there were.
+
+        If we have nothing stored for the repository we fetch the latest pushes.
+        """
+        last_push_id = self.last_push_id(repo_url)
+        if last_push_id is None:
+            return self._fetch(repo_url)
+        return self._fetch(repo_url, startID=last_push_id)
+
+    def _lookup(self, repo_url, revision):
+        # Revisions can be given with 12 or 40 chars
+        conn = self._connect()
+        try:
+            return conn.execute(
+                'SELECT push_id, node FROM changesets '
+                'WHERE repo_url = ? AND node >= ? AND node < ?',
+                (repo_url, revision, revision + 'g')).fetchone()
+        finally:
+            conn.close()
+
+    def find_changeset(self, repo_url, revision):
+        """Return (push id, full node) of a changeset or None if it does not exist.
+
+        Unknown changesets cost one request for their push; we never sync the repository.
+        """
+        revision = str(revision).lower()
+        found = self._lookup(repo_url, revision)
+        if found is None:
+            self._fetch(repo_url, changeset=revision)
+            found = self._lookup(repo_url, revision)
+        return found
+
+    def pushes(self, repo_url, start_id, end_id):
+        """Return the pushes with ids from start_id to end_id (both included), newest first."""
+        start_id = max(start_id, 1)
+        if end_id < start_id:
+            return []
+
+        pushes = self._load(repo_url, start_id, end_id)
+        stored_ids = set(push.id for push in pushes)
+        missing_ids = [i for i in range(start_id, end_id + 1) if i not in stored_ids]
+        if missing_ids:
+            # startID is excluded by the pushlog
+            self._fetch(repo_url, startID=missing_ids[0] - 1, endID=missing_ids[-1])
+            pushes = self._load(repo_url, start_id, end_id)
+
+        return pushes
+
+    def _load(self, repo_url, start_id, end_id):
+        conn = self._connect()
+        try:
+            push_rows = conn.execute(
+                'SELECT push_id, date, user FROM pushes '
+                'WHERE repo_url = ? AND push_id >= ? AND push_id <= ? ORDER BY push_id DESC',
+                (repo_url, start_id, end_id)).fetchall()
+            nodes = {}
+            for push_id, node in conn.execute(
+                    'SELECT push_id, node FROM changesets '
+                    'WHERE repo_url = ? AND push_id >= ? AND push_id <= ? '
+                    'ORDER BY push_id, position',
+                    (repo_url, start_id, end_id)):
+                nodes.setdefault(push_id, []).append(str(node))
+        finally:
+            conn.close()
+
+        return [Push(push_id, date, user, nodes.get(push_id, []))
+                for push_id, date, user in push_rows]
+
+
+def _pushlog_store():
+    """Return the store shared by the functions of this module."""
+    global PUSHLOG_STORE
+    if PUSHLOG_STORE is None:
+        PUSHLOG_STORE = PushlogStore()
+    return PUSHLOG_STORE
+
+
+def _push_id(repo_url, revision):
+    """Return the id of the push of a revision. Raises PushlogError if it does not exist."""
+    found = _pushlog_store().find_changeset(repo_url, revision)
+    if found is None:
+        raise PushlogError("The revision %s does not exist in %s." % (revision, repo_url))
+    return found[0]
+
+
+def _result(pushes, return_revision_list):
+    if return_revision_list:
+        return [push.changesets[0].node for push in pushes]
+    return pushes
+
+
+def query_pushes_by_specified_revision_range(repo_url, revision, before, after,
+                                             return_revision_list=False):
+    """Return the push of a revision, 'before' pushes before it and 'after' pushes after it."""
+    push_id = _push_id(repo_url, revision)
+    pushes = _pushlog_store().pushes(repo_url, push_id - before, push_id + after)
+    return _result(pushes, return_revision_list)
+
+
+def query_pushes_by_revision_range(repo_url, from_revision, to_revision,
+                                   return_revision_list=False):
+    """Return the pushes from the push of from_revision to the push of to_revision."""
+    start_id = _push_id(repo_url, from_revision)
+    end_id = _push_id(repo_url, to_revision)
+    pushes = _pushlog_store().pushes(repo_url, min(start_id, end_id), max(start_id, end_id))
+    return _result(pushes, return_revision_list)
+
+
+def query_push_by_revision(repo_url, revision, return_revision_list=False):
+    """Return the push of a revision (or its last revision if return_revision_list is set)."""
+    push_id = _push_id(repo_url, revision)
+    push = _pushlog_store().pushes(repo_url, push_id, push_id)[0]
+    if return_revision_list:
+        return push.changesets[0].node
+    return push
+
+
+def query_repo_tip(repo_url):
+    """Return the newest push of a repository."""
+    store = _pushlog_store()
+    store.sync(repo_url)
+    last_push_id = store.last_push_id(repo_url)
+    if last_push_id is None:
+        raise PushlogError("We could not find any push in %s." % repo_url)
+    return store.pushes(repo_url, last_push_id, last_push_id)[0]
+
+
+def query_full_revision(repo_url, revision):
+    """Return the 40 chars node of any changeset given with 12 chars or more."""
+    found = _pushlog_store().find_changeset(repo_url, revision)
+    if found is None:
+        raise PushlogError("The revision %s does not exist in %s." % (revision, repo_url))
+    return str(found[1])
+
+
+def valid_revision(repo_url, revision):
+    """Determine if a revision (any changeset of a push) exists in a repository."""
+    if _pushlog_store().find_changeset(repo_url, revision) is None:
+        LOG.warning("The revision %s does not exist in %s." % (revision, repo_url))
+        return False
+    return True
@@ -8,19 +8,87 @@ import datetime
 import json
 import logging
 import os
+import sys
+import threading
 import traceback
 
+import requests
 import taskcluster as taskcluster_client
+from requests.adapters import HTTPAdapter
 from taskcluster.utils import slugId, fromNow
 
 from mozci.repositories import query_repo_url
-from mozhginfo.pushlog_client import query_push_by_revision
+from mozci.sources.pushlog import query_push_by_revision
+from mozci.utils import metrics
+from mozci.utils.parallel import parallel_map
 
 
 LOG = logging.getLogger('mozci')
 TC_TOOLS_HOST = 'https://tools.taskcluster.net'
 TC_TASK_INSPECTOR = "%s/task-inspector/#" % TC_TOOLS_HOST
 TC_TASK_GRAPH_INSPECTOR = "%s/task-graph-inspector/#" % TC_TOOLS_HOST
+# Seconds to wait for TaskCluster to (connect, respond); see configure_clients()
+TC_TIMEOUT = (10, 120)
+# Connections kept open to each TaskCluster host
+TC_POOL_SIZE = 10
+# Clients shared by the whole process keyed by class name (see get_client())
+TC_CLIENTS = {}
+TC_SESSION = None
+TC_CLIENTS_LOCK = threading.Lock()
+# Number of tasks we put at most in a graph when scheduling many tasks at once
+MAX_TASKS_PER_GRAPH = 100
+# Where the graphs we schedule are written (see set_graph_output())
+GRAPH_OUTPUT = None
+GRAPH_OUTPUT_LOCK = threading.Lock()
+
+
+class _TimeoutAdapter(HTTPAdapter):
+    """HTTPAdapter using TC_TIMEOUT for requests made without a timeout."""
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = TC_TIMEOUT
+        return super(_TimeoutAdapter, self).send(request, **kwargs)
+
+
+def configure_clients(timeout=None, pool_size=None):
+    """ Change the timeout or connection pool size of the TaskCluster clients.
+
+    Clients created before are discarded.
+    """
+    global TC_TIMEOUT, TC_POOL_SIZE, TC_SESSION
+    with TC_CLIENTS_LOCK:
+        if timeout is not None:
+            TC_TIMEOUT = timeout
+        if pool_size is not None:
+            TC_POOL_SIZE = pool_size
+        TC_CLIENTS.clear()
+        TC_SESSION = None
+
+
+def get_client(name):
+    """ Return the process-wide TaskCluster client of a class e.g. 'Queue' or 'Scheduler'.
+
+    Clients are created on first use and share a requests session, so credentials
+    are read once and connections are reused between calls.
+    """
+    global TC_SESSION
+    with TC_CLIENTS_LOCK:
+        if name not in TC_CLIENTS:
+            if TC_SESSION is None:
+                TC_SESSION = requests.Session()
+                adapter = _TimeoutAdapter(pool_connections=TC_POOL_SIZE,
+                                          pool_maxsize=TC_POOL_SIZE)
+                TC_SESSION.mount('https://', adapter)
+                TC_SESSION.mount('http://', adapter)
+
+            client_class = getattr(taskcluster_client, name)
+            try:
+                TC_CLIENTS[name] = client_class(session=TC_SESSION)
+            except TypeError:
+                # Older versions of the client create their own session
+                TC_CLIENTS[name] = client_class()
+        return TC_CLIENTS[name]
 
 
 def credentials_available():
@@ -53,7 +121,8 @@ def handle_auth_failure(e):
 
 
 def generate_metadata(repo_name, revision, name,
-                      description='Task graph generated via Mozilla CI tools'):
+                      description='Task graph generated via Mozilla CI tools',
+                      push_info=None):
     """ Generate metadata based on input
     :param repo_name: e.g. alder, mozilla-central
     :type repo_name: str
@@ -64,10 +133,13 @@ def generate_metadata(repo_name, revision, name,
     :type name: str
     :param description: Human readable description of task-graph, explain what it does!
     :type description: str
+    :param push_info: The push of revision if we already have it (no need to query pushlog)
+    :type push_info: Push
     """
     repo_url = query_repo_url(repo_name)
-    push_info = query_push_by_revision(repo_url=repo_url,
-                                       revision=revision)
+    if push_info is None:
+        push_info = query_push_by_revision(repo_url=repo_url,
+                                           revision=revision)
 
     return {
         'name': name,
@@ -80,7 +152,7 @@ def generate_metadata(repo_name, revision, name,
 def get_task(task_id):
     """ Returns task information for given task id.
     """
-    queue = taskcluster_client.Queue()
+    queue = get_client('Queue')
     task = queue.task(task_id)
     LOG.debug("Original task: (Limit 1024 char)")
     LOG.debug(str(json.dumps(task))[:1024])
@@ -90,7 +162,7 @@ def get_task(task_id):
 def get_task_graph_status(task_graph_id):
     """ Returns state of a Task-Graph Status Response
     """
-    scheduler = taskcluster_client.Scheduler()
+    scheduler = get_client('Scheduler')
     response = scheduler.status(task_graph_id)
     return response['status']['state']
 
@@ -133,7 +205,7 @@ def create_task(**kwargs):
 
 def _recreate_task(task_id):
     one_year = 365
-    queue = taskcluster_client.Queue()
+    queue = get_client('Queue')
     task = queue.task(task_id)
 
     LOG.debug("Original task: (Limit 1024 char)")
@@ -210,6 +282,113 @@ def retrigger_task(task_id, dry_run=False):
     return results
 
 
+def _chunks(items, size):
+    """Split a list in lists of at most size items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _graph_groups(tasks, size):
+    """Split (task id, task) pairs in lists of at most size tasks to schedule as one graph.
+
+    Only tasks of the same task group with the same scopes share a graph.
+    """
+    groups = {}
+    for task_id, task in tasks:
+        key = (task.get('taskGroupId'), tuple(sorted(task.get('scopes', []))))
+        groups.setdefault(key, []).append((task_id, task))
+
+    chunks = []
+    for key in sorted(groups, key=str):
+        chunks.extend(_chunks(groups[key], size))
+    return chunks
+
+
+def retrigger_tasks(task_ids, dry_run=False, workers=8, max_tasks=MAX_TASKS_PER_GRAPH):
+    """ Retrigger many tasks at once.
+
+    Like retrigger_task() but we fetch the tasks concurrently and schedule the new
+    tasks in as few graphs as possible (of at most max_tasks tasks each). Tasks from
+    different task groups are scheduled in different graphs.
+
+    Returns a dictionary of task id -> id of the new task, or None if the task could
+    not be retriggered (or nothing was scheduled because of dry_run).
+    """
+    if not credentials_available():
+        return None
+
+    results = dict((task_id, None) for task_id in task_ids)
+
+    def _recreate(task_id):
+        try:
+            return _recreate_task(task_id)
+        except taskcluster_client.exceptions.TaskclusterRestFailure as e:
+            LOG.warning("We could not fetch task %s: %s" % (task_id, e))
+        except taskcluster_client.exceptions.TaskclusterAuthFailure as e:
+            handle_auth_failure(e)
+        return None
+
+    recreated = [(task_id, task) for task_id, task in
+                 zip(task_ids, parallel_map(_recreate, task_ids, workers)) if task]
+
+    def _schedule(chunk):
+        tasks = [task for _, task in chunk]
+        task_graph = generate_task_graph(
+            scopes=[],
+            tasks=tasks,
+            metadata=dict(tasks[0]['metadata'],
+                          name='Mozci retrigger of %d tasks' % len(tasks))
+        )
+        try:
+            return schedule_graph(task_graph, dry_run=dry_run)
+        except taskcluster_client.exceptions.TaskclusterRestFailure:
+            traceback.print_exc()
+        except taskcluster_client.exceptions.TaskclusterAuthFailure as e:
+            handle_auth_failure(e)
+        return None
+
+    chunks = _graph_groups(recreated, max_tasks)
+    for chunk, result in zip(chunks, parallel_map(_schedule, chunks, workers)):
+        if result:
+            for task_id, task in chunk:
+                results[task_id] = task['taskId']
+
+    if dry_run:
+        LOG.info("Dry-run mode: Nothing was retriggered.")
+    return results
+
+
+def set_graph_output(output=None):
+    """ Set where schedule_graph() and extend_task_graph() write the graphs.
+
+    * None: indented to stdout in dry-run mode and nowhere otherwise
+    * 'none': nowhere
+    * 'compact': to stdout without indentation
+    * any other value is the path of a file; graphs are appended one per line
+    """
+    global GRAPH_OUTPUT
+    GRAPH_OUTPUT = output
+
+
+def _output_graph(task_graph, dry_run):
+    if GRAPH_OUTPUT == 'none' or (GRAPH_OUTPUT is None and not dry_run):
+        return
+
+    # Graphs can be scheduled concurrently
+    with GRAPH_OUTPUT_LOCK:
+        if GRAPH_OUTPUT is None:
+            LOG.info("Outputting the graph:")
+            # We print to stdout instead of using the standard logging with dates and info
+            # levels
+            # XXX: Use a different formatter for other tools to work better with this code
+            write_task_graph(task_graph, sys.stdout, indent=4)
+        elif GRAPH_OUTPUT == 'compact':
+            write_task_graph(task_graph, sys.stdout)
+        else:
+            with open(GRAPH_OUTPUT, 'a') as f:
+                write_task_graph(task_graph, f)
+
+
+@metrics.timed('tc_scheduling')
 def schedule_graph(task_graph, task_graph_id=None, dry_run=False, *args, **kwargs):
     """ It schedules a TaskCluster graph and returns its id.
 
@@ -226,12 +405,9 @@ def schedule_graph(task_graph, task_graph_id=None, dry_run=False, *args, **kwarg
     """
     if not task_graph_id:
         task_graph_id = taskcluster_client.slugId()
-    scheduler = taskcluster_client.Scheduler()
+    scheduler = get_client('Scheduler')
 
-    LOG.info("Outputting the graph:")
-    # We print to stdout instead of using the standard logging with dates and info levels
-    # XXX: Use a different formatter for other tools to work better with this code
-    print(json.dumps(task_graph, indent=4))
+    _output_graph(task_graph, dry_run)
     if dry_run:
         LOG.info("DRY-RUN: We have not scheduled the graph.")
     else:
@@ -260,14 +436,14 @@ def extend_task_graph(task_graph_id, task_graph, dry_run=False):
     returns Task-Graph Status Response
     """
     # XXX: handle the case when the task-graph is not running
-    scheduler = taskcluster_client.Scheduler()
+    scheduler = get_client('Scheduler')
     if dry_run:
         LOG.info("DRY-RUN: We have not extended the graph.")
     else:
         LOG.debug("When extending a graph we don't need metadata and scopes.")
         del task_graph['metadata']
         del task_graph['scopes']
-        print(json.dumps(task_graph, indent=4))
+        _output_graph(task_graph, dry_run)
         return scheduler.extendTaskGraph(task_graph_id, task_graph)
 
 
@@ -284,3 +460,24 @@ def generate_task_graph(scopes, tasks, metadata):
         'metadata': metadata
     }
     return task_graph
+
+
+def write_task_graph(task_graph, output, indent=None):
+    """ Write the JSON of a task graph to a file-like object one task at a time.
+
+    We never build the JSON of the whole graph in memory. output can be a file,
+    sys.stdout or a socket (see socket.makefile()).
+    """
+    output.write('{')
+    for key in sorted(task_graph):
+        if key != 'tasks':
+            output.write('%s: %s, ' % (json.dumps(key), json.dumps(task_graph[key],
+                                                                   indent=indent)))
+
+    output.write('"tasks": [')
+    for i, task in enumerate(task_graph.get('tasks', [])):
+        if i:
+            output.write(', ')
+        output.write(json.dumps(task, indent=indent))
+    output.write(']}\n')
+    output.flush()
@@ -0,0 +1,101 @@
+"""
+This module follows TaskCluster task graphs until they are done.
+
+A TaskGraphWatcher tracks the state of many task graphs:
+
+* The graphs which are due are polled together (concurrently through the shared
+  TaskCluster client) instead of one after another
+* A graph whose state did not change is polled less and less often; a change
+  brings it back to the shortest interval
+* The callback is only called when the state of a graph changes
+* Graphs are dropped once they are finished or blocked
+"""
+from __future__ import absolute_import
+
+import logging
+import time
+
+import taskcluster as taskcluster_client
+
+from mozci.sources.tc import get_task_graph_status
+from mozci.utils.parallel import parallel_map
+from mozci.utils.polling import (
+    MAX_POLL_INTERVAL,
+    MIN_POLL_INTERVAL,
+    PollSchedule,
+    poll_until_done,
+)
+
+LOG = logging.getLogger('mozci')
+# States of a task graph after which it does not change anymore
+DONE_STATES = ('finished', 'blocked')
+
+
+class TaskGraphWatcher(object):
+    """Call callback(task_graph_id, old_state, new_state) when a watched graph changes.
+
+    old_state is None the first time we get the state of a graph.
+    """
+
+    def __init__(self, callback=None, min_interval=MIN_POLL_INTERVAL,
+                 max_interval=MAX_POLL_INTERVAL, workers=8):
+        self.callback = callback
+        self.workers = workers
+        # task graph id -> last known state
+        self.states = {}
+        # The graphs being watched; the interval of a graph grows while its state is the same
+        self._schedule = PollSchedule(min_interval, max_interval)
+
+    def watch(self, task_graph_id):
+        if task_graph_id not in self._schedule:
+            self.states.setdefault(task_graph_id, None)
+            self._schedule.add(task_graph_id)
+
+    def unwatch(self, task_graph_id):
+        self._schedule.remove(task_graph_id)
+
+    def __len__(self):
+        return len(self._schedule)
+
+    def _status(self, task_graph_id):
+        try:
+            return get_task_graph_status(task_graph_id)
+        except (taskcluster_client.exceptions.TaskclusterRestFailure,
+                taskcluster_client.exceptions.TaskclusterAuthFailure) as e:
+            LOG.warning("We could not get the state of task graph %s: %s" %
+                        (task_graph_id, e))
+            return None
+
+    def poll(self, now=None):
+        """Get the state of every graph which is due.
+
+        Returns the number of graphs still being watched.
+        """
+        now = now if now is not None else time.time()
+        due = self._schedule.due_keys(now)
+
+        for task_graph_id, state in zip(due, parallel_map(self._status, due, self.workers)):
+            old_state = self.states[task_graph_id]
+            if state is None or state == old_state:
+                self._schedule.backoff(task_graph_id, now)
+                continue
+
+            LOG.debug("Task graph %s: %s -> %s" % (task_graph_id, old_state, state))
+            self.states[task_graph_id] = state
+            self._schedule.reset(task_graph_id, now)
+            if state in DONE_STATES:
+                self.unwatch(task_graph_id)
+            if self.callback is not None:
+                self.callback(task_graph_id, old_state, state)
+
+        return len(self)
+
+    def run(self, timeout=None):
+        """Poll until every graph is done or for at most timeout seconds.
+
+        Returns the number of graphs still being watched.
+        """
+        watched = poll_until_done(self.poll, self._schedule, timeout)
+        if watched:
+            LOG.info("%d task graph(s) are not done yet." % watched)
+        return watched
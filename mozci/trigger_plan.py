@@ -0,0 +1,120 @@
+"""
+This module describes the requests needed to trigger jobs before making them.
+
+A TriggerPlan is computed by mozci.mozci.plan_triggers() without any side effects
+and it is run by mozci.mozci.execute_plan(). A plan contains four kinds of entries:
+
+* Retrigger - Retrigger an existing job through its buildapi request id
+* ArbitraryJob - Trigger a builder which does not need a new build job
+* BuildThenTest - Trigger the build job a test job needs (the test job will
+  have to be triggered once the build is done)
+* Skip - Nothing is needed (or possible) for a builder on a revision
+"""
+from __future__ import absolute_import
+
+from collections import namedtuple
+
+Retrigger = namedtuple(
+    'Retrigger', ['repo_name', 'revision', 'buildername', 'request_id', 'count'])
+ArbitraryJob = namedtuple(
+    'ArbitraryJob', ['repo_name', 'revision', 'buildername', 'files', 'times'])
+BuildThenTest = namedtuple(
+    'BuildThenTest', ['repo_name', 'revision', 'build_buildername', 'test_buildername', 'times'])
+Skip = namedtuple('Skip', ['revision', 'buildername', 'reason'])
+
+
+class TriggerPlan(object):
+    """Every request needed to trigger a set of builders on a set of revisions."""
+
+    def __init__(self, entries=None):
+        self.retriggers = []
+        self.arbitrary_jobs = []
+        self.build_then_test = []
+        self.skips = []
+        # Every entry in the order they were added
+        self._entries = []
+        for entry in entries or []:
+            self.add(entry)
+
+    def add(self, entry):
+        """Add an entry to its corresponding list."""
+        if isinstance(entry, Retrigger):
+            self.retriggers.append(entry)
+        elif isinstance(entry, ArbitraryJob):
+            self.arbitrary_jobs.append(entry)
+        elif isinstance(entry, BuildThenTest):
+            self.build_then_test.append(entry)
+        elif isinstance(entry, Skip):
+            self.skips.append(entry)
+        else:
+            raise TypeError("%s is not a valid plan entry." % str(entry))
+        self._entries.append(entry)
+
+    def extend(self, plan):
+        """Add every entry of another plan to this one."""
+        for entry in plan.entries():
+            self.add(entry)
+
+    def entries(self):
+        """Return all entries of the plan in the order they were added."""
+        return list(self._entries)
+
+    def requests(self):
+        """Return the list of Retrigger and ArbitraryJob entries we need to request.
+
+        The build jobs of BuildThenTest entries become ArbitraryJob entries; we only
+        request a build once per revision even if many test jobs need it.
+        The requests keep the order of the entries.
+        """
+        requests = []
+        requested_builds = set(
+            (job.revision, job.buildername) for job in self.arbitrary_jobs)
+
+        for entry in self._entries:
+            if isinstance(entry, (Retrigger, ArbitraryJob)):
+                requests.append(entry)
+                continue
+            if isinstance(entry, Skip):
+                continue
+
+            key = (entry.revision, entry.build_buildername)
+            if key in requested_builds:
+                continue
+            requested_builds.add(key)
+            requests.append(ArbitraryJob(
+                repo_name=entry.repo_name,
+                revision=entry.revision,
+                buildername=entry.build_buildername,
+                files=[None, None],
+                times=1))
+
+        return requests
+
+    def is_empty(self):
+        return not (self.retriggers or self.arbitrary_jobs or self.build_then_test)
+
+    def summary(self):
+        """Return a dictionary with the number of jobs of each kind of entry."""
+        build_requests = len(self.requests()) - len(self.retriggers) - len(self.arbitrary_jobs)
+        return {
+            'retriggered_jobs': sum(r.count for r in self.retriggers),
+            'arbitrary_jobs': sum(j.times for j in self.arbitrary_jobs),
+            'build_jobs': build_requests,
+            'waiting_for_build': len(self.build_then_test),
+            'skipped': len(self.skips),
+        }
+
+    def describe(self):
+        """Return a list of human readable lines describing the plan."""
+        lines = []
+        for r in self.retriggers:
+            lines.append("Retrigger request %s ('%s' on %s) %d time(s)." %
+                         (r.request_id, r.buildername, r.revision, r.count))
+        for j in self.arbitrary_jobs:
+            lines.append("Trigger '%s' on %s %d time(s)." % (j.buildername, j.revision, j.times))
+        for b in self.build_then_test:
+            lines.append("Trigger '%s' on %s in order to be able to trigger '%s' %d time(s)." %
+                         (b.build_buildername, b.revision, b.test_buildername, b.times))
+        for s in self.skips:
+            lines.append("Skip '%s' on %s: %s." % (s.buildername, s.revision, s.reason))
+        return lines
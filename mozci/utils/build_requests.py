@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+"""
+This module keeps track of the build jobs requested on a revision across processes.
+
+Many short lived mozci processes (e.g. pulse workers) can request the same build job
+for the same revision within minutes of each other. The requests are stored in an
+sqlite database (in WAL mode) under ~/.mozilla/mozci so every process can check
+atomically whether a build has already been requested.
+"""
+from __future__ import absolute_import
+
+import logging
+import time
+
+from mozci.utils.sqlite_store import SqliteStore
+from mozci.utils.transfer import path_to_file
+
+LOG = logging.getLogger('mozci')
+BUILD_REQUESTS_DB = path_to_file('build_requests.db')
+# Number of seconds during which we won't request a build job again
+BUILD_REQUEST_TTL = 2 * 60 * 60
+
+
+class BuildRequestStore(SqliteStore):
+    """Record (repo_name, revision, buildername) build requests for ttl seconds."""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS build_requests ('
+        'repo_name TEXT, revision TEXT, buildername TEXT, requested_at REAL, '
+        'PRIMARY KEY (repo_name, revision, buildername))',
+    )
+
+    def __init__(self, path=BUILD_REQUESTS_DB, ttl=BUILD_REQUEST_TTL):
+        self.ttl = ttl
+        super(BuildRequestStore, self).__init__(path)
+
+    @staticmethod
+    def _key(repo_name, revision, buildername):
+        # Revisions can be given with 12 or 40 chars
+        return (repo_name, revision[:12], buildername)
+
+    def was_requested(self, repo_name, revision, buildername):
+        """Return True if the build was requested less than ttl seconds ago."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT requested_at FROM build_requests '
+                'WHERE repo_name = ? AND revision = ? AND buildername = ?',
+                self._key(repo_name, revision, buildername)).fetchone()
+        finally:
+            conn.close()
+
+        return row is not None and row[0] > time.time() - self.ttl
+
+    def claim(self, repo_name, revision, buildername, force=False):
+        """Record a build request unless another one is still valid.
+
+        This is atomic across processes. Returns True if the caller can request the build.
+        With force we record the request even if another one is still valid.
+        """
+        key = self._key(repo_name, revision, buildername)
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute(
+                'SELECT requested_at FROM build_requests '
+                'WHERE repo_name = ? AND revision = ? AND buildername = ?', key).fetchone()
+            if not force and row is not None and row[0] > now - self.ttl:
+                return False
+
+            conn.execute(
+                'INSERT OR REPLACE INTO build_requests '
+                '(repo_name, revision, buildername, requested_at) VALUES (?, ?, ?, ?)',
+                key + (now,))
+            return True
+
+    def release(self, repo_name, revision, buildername):
+        """Forget a build request (e.g. the request failed)."""
+        conn = self._connect()
+        try:
+            conn.execute(
+                'DELETE FROM build_requests '
+                'WHERE repo_name = ? AND revision = ? AND buildername = ?',
+                self._key(repo_name, revision, buildername))
+        finally:
+            conn.close()
+
+    def expire(self):
+        """Remove the requests older than ttl seconds."""
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM build_requests WHERE requested_at <= ?',
+                         (time.time() - self.ttl,))
+        finally:
+            conn.close()
@@ -0,0 +1,189 @@
+"""
+This module records the HTTP responses of a mozci run and replays them.
+
+A Cassette hooks the transport adapter of requests, which every HTTP call of mozci
+goes through (mozci.utils.transfer, allthethings, the pushlog, buildapi_client,
+thclient and the TaskCluster client):
+
+* In record mode, requests go to the network and the responses (with how long they
+  took) are saved to a gzipped file of JSON lines when the cassette stops
+* In replay mode, nothing goes to the network; responses are served from the file,
+  with their original timings or without any delay
+
+In both modes the number of requests per endpoint is counted; this allows running
+the same workload against different versions of mozci and comparing them.
+
+Requests are matched on method, URL and body; if nothing matches (e.g. the body
+includes new task ids or dates) we use the next response recorded for the same
+endpoint. Setting MOZCI_CASSETTE to the path of a cassette (and MOZCI_CASSETTE_MODE
+to 'record' or 'replay') enables a cassette when mozci is imported.
+"""
+from __future__ import absolute_import
+
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import urlparse
+
+from collections import Counter
+
+import requests
+
+from requests.structures import CaseInsensitiveDict
+
+from mozci.errors import CassetteError
+
+LOG = logging.getLogger('mozci')
+RECORD, REPLAY = 'record', 'replay'
+# Replay latencies
+ORIGINAL, NONE = 'original', 'none'
+# TaskCluster slug ids (task and task graph ids) in paths
+_SLUG_ID = re.compile(r'/[A-Za-z0-9_-]{22}(?=/|$)')
+
+
+def _body_hash(body):
+    return hashlib.sha1(body or '').hexdigest()
+
+
+def endpoint(method, url):
+    """Return the endpoint of a request; the query and TaskCluster ids are left out."""
+    url = urlparse.urlparse(url)
+    return '%s %s%s' % (method, url.netloc, _SLUG_ID.sub('/<id>', url.path))
+
+
+class Cassette(object):
+    """Record or replay the HTTP requests made while the cassette is started."""
+
+    def __init__(self, path, mode=REPLAY, latency=ORIGINAL):
+        assert mode in (RECORD, REPLAY)
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        # Number of requests per endpoint
+        self.requests = Counter()
+        self.entries = []
+        # (method, url, body hash) or endpoint -> indexes of entries not served yet
+        self._by_request = {}
+        self._by_endpoint = {}
+        self._previous_send = None
+        self._hook = None
+        # Requests made by workers are recorded and replayed concurrently
+        self._lock = threading.Lock()
+        if mode == REPLAY:
+            self.load()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        cassette = self
+        self._previous_send = previous_send = requests.adapters.HTTPAdapter.send
+
+        def send(adapter, request, **kwargs):
+            if cassette._hook is None:
+                # The cassette stopped under a hook installed after it
+                return previous_send(adapter, request, **kwargs)
+            return cassette._send(adapter, request, **kwargs)
+
+        self._hook = send
+        requests.adapters.HTTPAdapter.send = send
+
+    def stop(self):
+        """Stop recording or replaying.
+
+        If another hook (e.g. metrics) was installed after start() we leave ours in
+        place; it passes requests through from now on.
+        """
+        if self._hook is None:
+            return
+
+        if requests.adapters.HTTPAdapter.send.__func__ is self._hook:
+            requests.adapters.HTTPAdapter.send = self._previous_send
+        self._hook = None
+        if self.mode == RECORD:
+            self.save()
+        LOG.debug("Requests per endpoint: %s" % dict(self.requests))
+
+    def load(self):
+        with gzip.open(self.path, 'rb') as f:
+            self.entries = [json.loads(line) for line in f]
+
+        for i, entry in enumerate(self.entries):
+            key = (entry['method'], entry['url'], entry['body_hash'])
+            self._by_request.setdefault(key, []).append(i)
+            self._by_endpoint.setdefault(endpoint(entry['method'], entry['url']), []).append(i)
+
+    def save(self):
+        with gzip.open(self.path, 'wb') as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry) + '\n')
+        LOG.info("We recorded %d responses in %s." % (len(self.entries), self.path))
+
+    def _send(self, adapter, request, **kwargs):
+        with self._lock:
+            self.requests[endpoint(request.method, request.url)] += 1
+        if self.mode == RECORD:
+            return self._record(adapter, request, **kwargs)
+        return self._replay(request)
+
+    def _record(self, adapter, request, **kwargs):
+        # The URL we match on is the one mozci asked for
+        url, body_hash = request.url, _body_hash(request.body)
+        start = time.time()
+        response = self._previous_send(adapter, request, **kwargs)
+        # This reads streamed responses; they can still be iterated afterwards
+        content = response.content
+        headers = dict(response.headers)
+        # The content we keep is already decoded
+        headers.pop('content-encoding', None)
+        headers['content-length'] = str(len(content))
+        entry = {
+            'method': request.method,
+            'url': url,
+            'body_hash': body_hash,
+            'status_code': response.status_code,
+            'reason': response.reason,
+            'headers': headers,
+            'content': base64.b64encode(content),
+            'elapsed': time.time() - start,
+        }
+        with self._lock:
+            self.entries.append(entry)
+        return response
+
+    def _next_entry(self, indexes):
+        # The last response of a request is served again once the others are used
+        with self._lock:
+            return self.entries[indexes.pop(0) if len(indexes) > 1 else indexes[0]]
+
+    def _replay(self, request):
+        key = (request.method, request.url, _body_hash(request.body))
+        indexes = self._by_request.get(key) or \
+            self._by_endpoint.get(endpoint(request.method, request.url))
+        if not indexes:
+            raise CassetteError("%s %s was not recorded in %s." %
+                                (request.method, request.url, self.path))
+
+        entry = self._next_entry(indexes)
+        if self.latency == ORIGINAL:
+            time.sleep(entry['elapsed'])
+
+        response = requests.Response()
+        response.status_code = entry['status_code']
+        response.reason = entry['reason']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = base64.b64decode(entry['content'])
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
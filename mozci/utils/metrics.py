@@ -0,0 +1,230 @@
+"""
+This module keeps metrics about where the time of a mozci run goes.
+
+The registry holds:
+
+* Counters, e.g. the requests made per remote endpoint, the bytes downloaded and
+  decompressed and the hits and misses of mozci's caches
+* Histograms of durations, e.g. the latency per remote endpoint and the time spent
+  in each phase (loading allthethings, downloading buildjson, querying buildapi...)
+
+Recording a value is a dictionary update; instrument_http() hooks the transport
+adapter of requests (as utils/cassette.py does) to measure every HTTP call.
+
+Setting the environment variable MOZCI_METRICS to a path writes the metrics there when
+the process exits: as a Prometheus textfile if the path ends with '.prom' and as JSON
+otherwise.
+"""
+from __future__ import absolute_import
+
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from contextlib import contextmanager
+
+import requests
+
+from mozci.utils import profiler
+from mozci.utils.cassette import endpoint
+
+LOG = logging.getLogger('mozci')
+# Upper bounds (seconds) of the buckets of the histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+# Revisions and numeric ids in paths; they would give every request its own endpoint
+_PATH_ID = re.compile(r'/([0-9a-f]{12,40}|[0-9]+)(?=/|$)')
+_PREVIOUS_SEND = None
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.iteritems())))
+
+
+class Registry(object):
+    """Counters and histograms identified by a name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (name, labels) -> value
+        self.counters = {}
+        # (name, labels) -> [count of each bucket, count, sum]
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = [[0] * len(BUCKETS), 0, 0.0]
+            histogram = self.histograms[key]
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += 1
+            histogram[2] += value
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self.counters.get(_key(name, labels), 0)
+
+    def histogram(self, name, **labels):
+        """Return (count, sum) of a histogram."""
+        _, count, total = self.histograms.get(_key(name, labels), (None, 0, 0.0))
+        return count, total
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_json(self):
+        """Return the metrics as a dictionary which can be serialized to JSON."""
+        with self._lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self.counters.items())],
+                'histograms': [{'name': name, 'labels': dict(labels), 'count': count,
+                                'sum': total, 'buckets': dict(zip(BUCKETS, buckets))}
+                               for (name, labels), (buckets, count, total)
+                               in sorted(self.histograms.items())],
+            }
+
+    def to_prometheus(self):
+        """Return the metrics in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            names = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in names:
+                    names.add(name)
+                    lines.append('# TYPE %s counter' % name)
+                lines.append('%s%s %s' % (name, _labels(labels), value))
+
+            for (name, labels), (buckets, count, total) in sorted(self.histograms.items()):
+                if name not in names:
+                    names.add(name)
+                    lines.append('# TYPE %s histogram' % name)
+                for bound, bucket_count in zip(BUCKETS, buckets):
+                    lines.append('%s_bucket%s %d' % (
+                        name, _labels(labels + (('le', str(bound)),)), bucket_count))
+                lines.append('%s_bucket%s %d' % (name, _labels(labels + (('le', '+Inf'),)), count))
+                lines.append('%s_sum%s %s' % (name, _labels(labels), total))
+                lines.append('%s_count%s %d' % (name, _labels(labels), count))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write the metrics to path; in the Prometheus format if it ends with '.prom'."""
+        if path.endswith('.prom'):
+            data = self.to_prometheus()
+        else:
+            data = json.dumps(self.to_json(), indent=2, sort_keys=True)
+
+        # Readers (e.g. node_exporter's textfile collector) should not see a partial file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+        LOG.debug("We wrote the metrics of this run to %s." % path)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for k, v in labels)
+
+
+REGISTRY = Registry()
+
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+def cache_hit(cache):
+    REGISTRY.inc('mozci_cache_requests_total', cache=cache, result='hit')
+
+
+def cache_miss(cache):
+    REGISTRY.inc('mozci_cache_requests_total', cache=cache, result='miss')
+
+
+@contextmanager
+def phase(name):
+    """Record the duration of the block in the histogram of a phase.
+
+    The block is also a span of the trace if we are profiling (see utils/profiler.py).
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        duration = time.time() - start
+        REGISTRY.observe('mozci_phase_seconds', duration, phase=name)
+        if profiler.TRACE is not None:
+            profiler.TRACE.add(name, start, duration)
+
+
+def timed(name):
+    """Decorator recording the duration of every call in the histogram of a phase."""
+    def _decorator(func):
+        @functools.wraps(func)
+        def _timed(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return _timed
+    return _decorator
+
+
+def http_endpoint(method, url):
+    """Return the endpoint of a request with revisions and numeric ids left out."""
+    return _PATH_ID.sub('/<id>', endpoint(method, url))
+
+
+def instrument_http():
+    """Count the requests, latencies and bytes of every HTTP call per endpoint."""
+    global _PREVIOUS_SEND
+    if _PREVIOUS_SEND is not None:
+        return
+
+    _PREVIOUS_SEND = previous_send = requests.adapters.HTTPAdapter.send
+
+    def send(adapter, request, **kwargs):
+        name = http_endpoint(request.method, request.url)
+        start = time.time()
+        try:
+            response = previous_send(adapter, request, **kwargs)
+        except Exception:
+            REGISTRY.inc('mozci_http_requests_total', endpoint=name, status='error')
+            raise
+        REGISTRY.observe('mozci_http_request_seconds', time.time() - start, endpoint=name)
+        REGISTRY.inc('mozci_http_requests_total', endpoint=name, status=str(response.status_code))
+        # Streamed responses are read by the caller; we trust their Content-Length
+        if kwargs.get('stream'):
+            size = int(response.headers.get('Content-Length') or 0)
+        else:
+            size = len(response.content or '')
+        REGISTRY.inc('mozci_http_response_bytes_total', size, endpoint=name)
+        return response
+
+    requests.adapters.HTTPAdapter.send = send
+
+
+def uninstrument_http():
+    global _PREVIOUS_SEND
+    if _PREVIOUS_SEND is not None:
+        requests.adapters.HTTPAdapter.send = _PREVIOUS_SEND
+        _PREVIOUS_SEND = None
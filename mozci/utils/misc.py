@@ -6,6 +6,7 @@ import logging
 
 import requests
 
+from mozci.utils import metrics
 from mozci.utils.authentication import get_credentials
 
 LOG = logging.getLogger('mozci')
@@ -30,6 +31,7 @@ def _public_url(url):
     return url
 
 
+@metrics.timed('artifact_checks')
 def _all_urls_reachable(urls):
     """Determine if the URLs are reachable."""
     for url in urls:
@@ -0,0 +1,110 @@
+#! /usr/bin/env python
+"""This module helps us run independent pieces of work concurrently."""
+from __future__ import absolute_import
+
+import logging
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+LOG = logging.getLogger('mozci')
+
+# Records emitted by a thread which is buffering its log messages
+_BUFFERS = threading.local()
+
+
+class _BufferingFilter(logging.Filter):
+    """Divert the records of buffering threads instead of emitting them."""
+
+    def filter(self, record):
+        records = getattr(_BUFFERS, 'records', None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+
+_BUFFERING_FILTER = _BufferingFilter()
+
+
+class RateLimiter(object):
+    """Space out calls to wait() so we make at most max_per_second requests per second.
+
+    A value of None or 0 for max_per_second means no limit.
+    """
+
+    def __init__(self, max_per_second=None):
+        self.interval = 1.0 / max_per_second if max_per_second else 0
+        self._lock = threading.Lock()
+        self._next_time = 0
+
+    def wait(self):
+        if not self.interval:
+            return
+
+        with self._lock:
+            now = time.time()
+            if self._next_time > now:
+                time.sleep(self._next_time - now)
+                now = self._next_time
+            self._next_time = now + self.interval
+
+
+class KeyedLocks(object):
+    """Hand out one lock per key; work on different keys can still run at once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def __call__(self, key):
+        with self._lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+
+def parallel_map(func, items, workers=1):
+    """Return [func(item) for item in items] while running up to 'workers' calls at once.
+
+    The returned list keeps the order of items.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def call_with_buffered_logs(func, *args, **kwargs):
+    """Call func and return its result together with the log records it emitted.
+
+    The records are not shown until they are given to replay_logs(); this allows
+    grouping the output of work done in parallel.
+    """
+    if _BUFFERING_FILTER not in LOG.filters:
+        LOG.addFilter(_BUFFERING_FILTER)
+
+    records = _BUFFERS.records = []
+    try:
+        result = func(*args, **kwargs)
+    except Exception:
+        # We don't want to lose what lead to the failure
+        del _BUFFERS.records
+        replay_logs(records)
+        raise
+
+    del _BUFFERS.records
+    return result, records
+
+
+def replay_logs(records):
+    """Emit log records previously collected by call_with_buffered_logs()."""
+    for record in records:
+        LOG.handle(record)
@@ -0,0 +1,89 @@
+"""
+This module helps waiting for things which take long to change (builds, task graphs,
+job results) by polling them less and less often.
+
+A PollSchedule knows when each of many keys (e.g. revisions) is due for a poll; the
+interval of a key doubles every time it is backed off, up to a maximum, and goes
+back to the minimum once it is reset. poll_until_done() calls a poll function until
+nothing is left to wait for, sleeping until the next key is due in between.
+"""
+from __future__ import absolute_import
+
+import time
+
+# Seconds between polls of a key; doubled every time it has not changed
+MIN_POLL_INTERVAL = 60
+MAX_POLL_INTERVAL = 15 * 60
+
+
+class PollSchedule(object):
+    """Time of the next poll of each key."""
+
+    def __init__(self, min_interval=MIN_POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # key -> [time of the next poll, current interval]
+        self._schedule = {}
+
+    def __contains__(self, key):
+        return key in self._schedule
+
+    def __len__(self):
+        return len(self._schedule)
+
+    def add(self, key):
+        """Poll key at the next poll (unless it is already scheduled)."""
+        if key not in self._schedule:
+            self._schedule[key] = [0, self.min_interval]
+
+    def remove(self, key):
+        self._schedule.pop(key, None)
+
+    def due(self, key, now):
+        """Return True if key is due; keys which are not scheduled are always due."""
+        return key not in self._schedule or self._schedule[key][0] <= now
+
+    def due_keys(self, now):
+        return sorted(key for key, (next_poll, _) in self._schedule.iteritems()
+                      if next_poll <= now)
+
+    def backoff(self, key, now):
+        """Poll key again after twice the previous interval (min_interval at first)."""
+        interval = self.min_interval
+        if key in self._schedule:
+            interval = min(self._schedule[key][1] * 2, self.max_interval)
+        self._schedule[key] = [now + interval, interval]
+
+    def reset(self, key, now):
+        """Poll key again after min_interval."""
+        self._schedule[key] = [now + self.min_interval, self.min_interval]
+
+    def next_poll(self):
+        """Return the time of the next poll or None if nothing is scheduled."""
+        if not self._schedule:
+            return None
+        return min(next_poll for next_poll, _ in self._schedule.itervalues())
+
+
+def poll_until_done(poll, schedule, timeout=None):
+    """Call poll() until it returns 0 or for at most timeout seconds.
+
+    poll() returns how many things we are still waiting for; between calls we sleep
+    until the next key of schedule (a PollSchedule) is due.
+    Returns what the last call of poll() returned.
+    """
+    start = time.time()
+    while True:
+        waiting = poll()
+        if not waiting:
+            return 0
+
+        now = time.time()
+        if timeout is not None and now - start >= timeout:
+            return waiting
+
+        next_poll = schedule.next_poll()
+        sleep = next_poll - now if next_poll is not None else schedule.min_interval
+        if timeout is not None:
+            sleep = min(sleep, start + timeout - now)
+        time.sleep(max(sleep, 0))
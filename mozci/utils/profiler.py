@@ -0,0 +1,163 @@
+"""
+This module records where the wall time of a mozci run goes.
+
+Once start() is called, spans are recorded for:
+
+* every builder and every revision we evaluate (with the builder and revision)
+* every step: sanitize, revlist, matching_jobs, status, objective, artifact_checks,
+  scheduling, tc_scheduling and the phases of utils/metrics.py (allthethings, buildjson, pushlog...)
+
+When the process exits we log a summary table sorted by total time and write the
+spans to a trace file which Chrome trace viewers (chrome://tracing, Perfetto) can
+open. cProfile can also run alongside; its stats are saved next to the trace.
+
+Spans cost next to nothing until start() is called.
+"""
+from __future__ import absolute_import
+
+import atexit
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+from StringIO import StringIO
+
+LOG = logging.getLogger('mozci')
+# The Trace being recorded; None if we are not profiling
+TRACE = None
+# The cProfile.Profile running alongside the trace, if any
+_PROFILE = None
+# Names of the spans which get a table of their own, grouped by this argument
+GROUPED_SPANS = {'builder': 'builder', 'revision': 'revision'}
+# Number of functions of the cProfile stats we log
+CPROFILE_LINES = 25
+
+
+class Trace(object):
+    """The spans recorded during a run."""
+
+    def __init__(self):
+        self.start = time.time()
+        # (name, start, duration, thread id, args)
+        self.events = []
+
+    def add(self, name, start, duration, args=None):
+        # list.append is atomic; spans come from many threads with --workers
+        self.events.append((name, start, duration, threading.current_thread().ident,
+                            args or {}))
+
+    def summary(self):
+        """Return the lines of tables with the total time per step, builder and revision.
+
+        Times include the time of the spans inside them.
+        """
+        tables = {'step': defaultdict(list)}
+        for group in GROUPED_SPANS.itervalues():
+            tables[group] = defaultdict(list)
+
+        for name, _, duration, _, args in self.events:
+            if name in GROUPED_SPANS:
+                tables[GROUPED_SPANS[name]][args.get(GROUPED_SPANS[name])].append(duration)
+            else:
+                tables['step'][name].append(duration)
+
+        lines = ['Wall time: %.3f s' % (time.time() - self.start)]
+        for group in ('step', 'builder', 'revision'):
+            if not tables[group]:
+                continue
+            lines.append('')
+            lines.append('%-60s %8s %12s %12s %12s' % (
+                group, 'calls', 'total (s)', 'mean (s)', 'max (s)'))
+            for key, durations in sorted(tables[group].iteritems(),
+                                         key=lambda item: sum(item[1]), reverse=True):
+                lines.append('%-60s %8d %12.3f %12.3f %12.3f' % (
+                    str(key)[:60], len(durations), sum(durations),
+                    sum(durations) / len(durations), max(durations)))
+        return lines
+
+    def to_chrome_trace(self):
+        """Return the spans in the Trace Event Format of Chrome's trace viewer."""
+        pid = os.getpid()
+        return {
+            'displayTimeUnit': 'ms',
+            'traceEvents': [{
+                'name': name if name not in GROUPED_SPANS else
+                '%s %s' % (name, args.get(GROUPED_SPANS[name])),
+                'cat': name,
+                'ph': 'X',
+                # Microseconds since the start of the trace
+                'ts': int((start - self.start) * 1000000),
+                'dur': int(duration * 1000000),
+                'pid': pid,
+                'tid': tid,
+                'args': args,
+            } for name, start, duration, tid, args in self.events],
+        }
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+@contextmanager
+def span(name, **args):
+    """Record the time spent in the block if we are profiling."""
+    trace = TRACE
+    if trace is None:
+        yield
+        return
+
+    start = time.time()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.time() - start, args)
+
+
+def start(trace_path, cprofile=False):
+    """Start profiling; the summary and the trace are written when the process exits.
+
+    With cprofile, the main thread also runs under cProfile and its stats are written
+    to trace_path + '.pstats'.
+    """
+    global TRACE, _PROFILE
+    TRACE = Trace()
+    if cprofile:
+        _PROFILE = cProfile.Profile()
+        _PROFILE.enable()
+    atexit.register(stop, trace_path)
+
+
+def stop(trace_path):
+    """Stop profiling, log the summary and write the trace."""
+    global TRACE, _PROFILE
+    if TRACE is None:
+        return
+
+    trace, TRACE = TRACE, None
+    profile, _PROFILE = _PROFILE, None
+    if profile is not None:
+        profile.disable()
+    for line in trace.summary():
+        LOG.info(line)
+    trace.write(trace_path)
+    LOG.info("We wrote the trace of this run to %s; open it with chrome://tracing." %
+             trace_path)
+
+    if profile is not None:
+        stats_path = trace_path + '.pstats'
+        profile.dump_stats(stats_path)
+        LOG.info("We wrote the cProfile stats to %s; these are the slowest functions:" %
+                 stats_path)
+        stream = StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(
+            CPROFILE_LINES)
+        for line in stream.getvalue().splitlines():
+            if line.strip():
+                LOG.info(line)
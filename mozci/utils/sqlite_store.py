@@ -0,0 +1,60 @@
+"""
+This module contains SqliteStore, the base class of the sqlite databases of mozci.
+
+The stores (build requests, pending test jobs, pushes) live under ~/.mozilla/mozci
+and are shared by every mozci process of the machine. The databases are in WAL mode
+so readers do not block the writer, and connections are in autocommit mode; a store
+uses transaction() whenever it reads rows and writes based on them.
+"""
+from __future__ import absolute_import
+
+import os
+import sqlite3
+
+from contextlib import contextmanager
+
+
+class SqliteStore(object):
+    """An sqlite database with the tables created by the statements of SCHEMA."""
+
+    SCHEMA = ()
+
+    def __init__(self, path):
+        self.path = path
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        conn = self._connect()
+        try:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        # We let sqlite know that we will handle the transactions
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    @contextmanager
+    def transaction(self, row_factory=None):
+        """Yield a connection inside a transaction which is committed at the end.
+
+        The write lock is taken before anything is read, so no other process can
+        change the rows we read before we commit. The transaction is rolled back if
+        the block raises.
+        """
+        conn = self._connect()
+        conn.row_factory = row_factory
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
@@ -14,6 +14,7 @@ import time
 import requests
 
 from mozci.errors import MozciError
+from mozci.utils import metrics
 from progressbar import Bar, Timer, FileTransferSpeed, ProgressBar
 
 # yajl2 backend is faster then the default backend, but it requires
@@ -117,6 +118,7 @@ def _load_json_file(filepath):
             gzipper = gzip.GzipFile(fileobj=fd)
             data = gzipper.read()
             gzipper.close()
+        metrics.inc('mozci_decompressed_bytes_total', len(data))
 
     else:
         data = fd.read()
@@ -153,6 +155,7 @@ def _save_file(req, filepath):
                     pbar.update(bytes)
     if SHOW_PROGRESS_BAR:
         pbar.finish()
+    metrics.inc('mozci_downloaded_bytes_total', bytes)
     _verify_last_mod(req.headers['last-modified'], filepath)
 
 
@@ -239,6 +242,7 @@ def _lean_load_json_file(filepath):
             },
             'request_ids': b['request_ids']
         } for b in builds]
+        metrics.inc('mozci_decompressed_bytes_total', gzipper.tell())
 
     except IOError, e:
         LOG.warning(str(e))
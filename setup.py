@@ -14,7 +14,6 @@ setup(
         'ijson>=2.2',
         'keyring>=5.3',
         'progressbar>=2.3',
-        'pushlog_client>=0.3',
         'requests>=2.8.1',
         'taskcluster>=0.0.28',
         'treeherder-client>=2.0.1',
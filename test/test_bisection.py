@@ -0,0 +1,127 @@
+"""This file contains tests for mozci/bisection.py."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+from mozci.bisection import (
+    BAD,
+    Bisection,
+    DONE,
+    FAILED,
+    GOOD,
+    NO_RESULT,
+    SEARCHING,
+    WAITING,
+    bisect_backfill,
+)
+
+BUILDER = 'Platform1 repo opt test mochitest-1'
+REVISIONS = ['rev%d' % i for i in range(9)]
+
+
+def _results(first_bad):
+    """Return a job_result() where every revision from first_bad onwards is bad."""
+    def job_result(repo_name, revision, buildername):
+        return BAD if REVISIONS.index(revision) >= first_bad else GOOD
+    return job_result
+
+
+@patch('mozci.bisection.build_running', return_value=False)
+class TestBisection(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'bisection.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @patch('mozci.bisection.trigger_range')
+    def test_find_culprit(self, trigger_range, build_running):
+        """With every result known we find the first bad revision without triggering."""
+        with patch('mozci.bisection.job_result', side_effect=_results(5)) as job_result:
+            bisection = Bisection('repo', BUILDER, REVISIONS)
+            self.assertEquals(bisection.step(), DONE)
+
+        self.assertEquals(bisection.culprit, 'rev5')
+        # log2(8) revisions checked
+        self.assertEquals(job_result.call_count, 3)
+        self.assertFalse(trigger_range.called)
+
+    @patch('mozci.bisection.query_job_statuses', return_value=[])
+    @patch('mozci.bisection.trigger_range')
+    def test_trigger_midpoint_and_resume(self, trigger_range, query_job_statuses,
+                                         build_running):
+        bisection = Bisection('repo', BUILDER, REVISIONS, self.path)
+        with patch('mozci.bisection.job_result', return_value=NO_RESULT):
+            self.assertEquals(bisection.step(), SEARCHING)
+        self.assertEquals(trigger_range.call_args[1]['revisions'], ['rev4'])
+        bisection.save()
+
+        # A later run resumes the bisection once the job is running and then done
+        bisection = Bisection.load(self.path)
+        self.assertEquals(bisection.testing, 4)
+        with patch('mozci.bisection.job_result', return_value=WAITING):
+            self.assertEquals(bisection.step(), SEARCHING)
+        with patch('mozci.bisection.job_result', side_effect=_results(3)):
+            self.assertEquals(bisection.step(), DONE)
+        self.assertEquals(bisection.culprit, 'rev3')
+        self.assertEquals(trigger_range.call_count, 1)
+
+    @patch('mozci.bisection.query_job_statuses', return_value=[])
+    @patch('mozci.bisection.job_result', return_value=NO_RESULT)
+    @patch('mozci.bisection.trigger_range')
+    def test_give_up(self, trigger_range, job_result, query_job_statuses, build_running):
+        """We stop if a revision never gets a result."""
+        trigger_range.return_value = Mock(build_then_test=[])
+        bisection = Bisection('repo', BUILDER, REVISIONS)
+        for _ in range(3):
+            self.assertEquals(bisection.step(), SEARCHING)
+        self.assertEquals(bisection.step(), FAILED)
+        self.assertEquals(trigger_range.call_count, 3)
+
+    @patch('mozci.bisection.query_job_statuses', return_value=[])
+    @patch('mozci.bisection.job_result', return_value=NO_RESULT)
+    @patch('mozci.bisection.trigger_range')
+    def test_revision_without_build(self, trigger_range, job_result, query_job_statuses,
+                                    build_running):
+        """We wait for the build of a revision without counting it as an attempt."""
+        bisection = Bisection('repo', BUILDER, REVISIONS)
+        trigger_range.return_value = Mock(build_then_test=['build'])
+        self.assertEquals(bisection.step(), SEARCHING)
+
+        build_running.return_value = True
+        for _ in range(5):
+            self.assertEquals(bisection.step(), SEARCHING)
+        self.assertEquals(trigger_range.call_count, 1)
+
+        # The build is done; we trigger the job itself
+        build_running.return_value = False
+        trigger_range.return_value = Mock(build_then_test=[])
+        self.assertEquals(bisection.step(), SEARCHING)
+        self.assertEquals((bisection.attempts, bisection.build_attempts), (1, 1))
+
+    @patch('mozci.bisection.query_repo_name_from_buildername', return_value='repo')
+    @patch('mozci.bisection.job_result', side_effect=_results(5))
+    def test_state_is_removed(self, job_result, query_repo_name, build_running):
+        """The state of a finished bisection is removed; the next run starts over."""
+        Bisection('repo', BUILDER, REVISIONS, self.path).save()
+        with patch('mozci.bisection._state_path', return_value=self.path):
+            bisection = bisect_backfill(BUILDER, 'rev8', 10)
+        self.assertEquals(bisection.culprit, 'rev5')
+        self.assertFalse(os.path.exists(self.path))
+
+    @patch('mozci.bisection.query_repo_url_from_buildername', return_value='repo_url')
+    @patch('mozci.bisection.query_repo_name_from_buildername', return_value='repo')
+    @patch('mozci.bisection.query_pushes_by_specified_revision_range')
+    @patch('mozci.bisection._filter_backfill_revlist', return_value=[])
+    def test_revision_is_good(self, filter_backfill_revlist, query_pushes, query_repo_name,
+                              query_repo_url, build_running):
+        """There is nothing to bisect if the revision already has a successful job."""
+        query_pushes.return_value = list(reversed(REVISIONS))
+        with patch('mozci.bisection._state_path', return_value=self.path):
+            self.assertIsNone(bisect_backfill(BUILDER, 'rev8', 10))
+        self.assertFalse(os.path.exists(self.path))
@@ -0,0 +1,55 @@
+"""This file contains tests for mozci/utils/build_requests.py."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from mozci.utils.build_requests import BuildRequestStore
+
+BUILD = 'Platform1 repo build'
+
+
+class TestBuildRequestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'build_requests.db')
+        self.store = BuildRequestStore(path=self.path, ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_claim_once(self):
+        """A build can only be claimed once."""
+        self.assertFalse(self.store.was_requested('repo', 'rev1', BUILD))
+        self.assertTrue(self.store.claim('repo', 'rev1', BUILD))
+        self.assertFalse(self.store.claim('repo', 'rev1', BUILD))
+        self.assertTrue(self.store.was_requested('repo', 'rev1', BUILD))
+
+    def test_claim_is_shared_between_stores(self):
+        """Another process (i.e. another store on the same database) sees the claim."""
+        self.store.claim('repo', 'a' * 40, BUILD)
+        other = BuildRequestStore(path=self.path, ttl=60)
+        self.assertFalse(other.claim('repo', 'a' * 12, BUILD))
+        self.assertTrue(other.claim('repo', 'a' * 12, 'Platform2 repo build'))
+
+    def test_release(self):
+        self.store.claim('repo', 'rev1', BUILD)
+        self.store.release('repo', 'rev1', BUILD)
+        self.assertTrue(self.store.claim('repo', 'rev1', BUILD))
+
+    def test_force(self):
+        """A forced claim succeeds and is seen by later claims."""
+        self.store.claim('repo', 'rev1', BUILD)
+        self.assertTrue(self.store.claim('repo', 'rev1', BUILD, force=True))
+        self.assertFalse(self.store.claim('repo', 'rev1', BUILD))
+
+    @patch('mozci.utils.build_requests.time.time')
+    def test_claim_expires(self, time):
+        time.return_value = 1000
+        self.store.claim('repo', 'rev1', BUILD)
+        time.return_value = 1061
+        self.assertFalse(self.store.was_requested('repo', 'rev1', BUILD))
+        self.assertTrue(self.store.claim('repo', 'rev1', BUILD))
@@ -0,0 +1,104 @@
+"""This file contains tests for mozci/build_watcher.py."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from mozci.build_watcher import BuildWatcher, PendingTestQueue
+from mozci.trigger_plan import BuildThenTest, TriggerPlan
+
+BUILD = 'Platform1 repo build'
+TEST = 'Platform1 repo opt test mochitest-1'
+FILES = {'packageUrl': 'http://package.tar.bz2', 'testsUrl': 'http://tests.zip'}
+RUNNING = {'working_job': None, 'running_job': {'status': 0}, 'failed_job': None, 'files': None}
+DONE = {'working_job': {'status': 0}, 'running_job': None, 'failed_job': None, 'files': FILES}
+FAILED = {'working_job': None, 'running_job': None, 'failed_job': {'status': 2}, 'files': None}
+
+
+@patch('mozci.build_watcher.RequestCoalescer')
+class TestBuildWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = PendingTestQueue(path=os.path.join(self.tmp_dir, 'pending_tests.db'))
+        self.watcher = BuildWatcher(queue=self.queue, min_interval=10, max_interval=30)
+        self.watcher.defer(TriggerPlan([
+            BuildThenTest('repo', 'rev1', BUILD, TEST, 3),
+            BuildThenTest('repo', 'rev1', BUILD, 'Platform1 repo opt test mochitest-2', 1),
+        ]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @patch('mozci.build_watcher._queue_trigger')
+    @patch('mozci.build_watcher._find_build_job', return_value=DONE)
+    def test_tests_triggered_when_build_is_done(self, find_build_job, queue_trigger,
+                                                coalescer):
+        self.assertEquals(self.watcher.poll(now=0), 0)
+        # One poll for the build of the revision
+        find_build_job.assert_called_once_with('repo', 'rev1', BUILD)
+        self.assertEquals(queue_trigger.call_args_list[0][0], (
+            coalescer.return_value, TEST, 'rev1', [FILES['packageUrl'], FILES['testsUrl']],
+            3, None))
+        self.assertEquals(queue_trigger.call_count, 2)
+        self.assertEquals(len(self.queue), 0)
+
+    @patch('mozci.build_watcher._queue_trigger')
+    @patch('mozci.build_watcher._find_build_job', return_value=DONE)
+    def test_failed_requests_stay_queued(self, find_build_job, queue_trigger, coalescer):
+        """A test job whose request fails is triggered again by a later poll."""
+        def _flush():
+            # The request of the first test job fails
+            queue_trigger.call_args_list[0][1]['on_failure']()
+
+        coalescer.return_value.flush.side_effect = _flush
+        self.assertEquals(self.watcher.poll(now=0), 1)
+        self.assertEquals([e['test_buildername'] for e in self.queue.pending()], [TEST])
+
+        coalescer.return_value.flush.side_effect = None
+        queue_trigger.reset_mock()
+        self.assertEquals(self.watcher.poll(now=10), 0)
+        self.assertEquals(queue_trigger.call_args[0][1], TEST)
+        self.assertEquals(len(self.queue), 0)
+
+    @patch('mozci.build_watcher._queue_trigger')
+    @patch('mozci.build_watcher._find_build_job', side_effect=ValueError())
+    def test_claims_are_released(self, find_build_job, queue_trigger, coalescer):
+        """A poll which raises lets other watchers claim its test jobs."""
+        with self.assertRaises(ValueError):
+            self.watcher.poll(now=0)
+        self.assertEquals(len(self.queue.claim()), 2)
+
+    def test_claims_are_exclusive(self, coalescer):
+        """Two watchers sharing a queue never look at the same test job at once."""
+        other = PendingTestQueue(path=self.queue.path)
+        self.assertEquals(len(self.queue.claim()), 2)
+        self.assertEquals(other.claim(), [])
+        # Claims of a watcher which died expire
+        self.assertEquals(len(other.claim(ttl=-1)), 2)
+
+    @patch('mozci.build_watcher._queue_trigger')
+    @patch('mozci.build_watcher._find_build_job', return_value=RUNNING)
+    def test_backoff_while_running(self, find_build_job, queue_trigger, coalescer):
+        self.assertEquals(self.watcher.poll(now=0), 2)
+        # Not due yet
+        self.watcher.poll(now=5)
+        self.assertEquals(find_build_job.call_count, 1)
+        self.watcher.poll(now=10)
+        self.assertEquals(find_build_job.call_count, 2)
+        # The interval doubled
+        self.watcher.poll(now=25)
+        self.assertEquals(find_build_job.call_count, 2)
+        self.watcher.poll(now=30)
+        self.assertEquals(find_build_job.call_count, 3)
+        self.assertFalse(queue_trigger.called)
+        self.assertEquals(len(self.queue), 2)
+
+    @patch('mozci.build_watcher._queue_trigger')
+    @patch('mozci.build_watcher._find_build_job', return_value=FAILED)
+    def test_failed_build_drops_tests(self, find_build_job, queue_trigger, coalescer):
+        self.assertEquals(self.watcher.poll(now=0), 0)
+        self.assertFalse(queue_trigger.called)
+        self.assertEquals(len(self.queue), 0)
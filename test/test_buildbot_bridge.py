@@ -0,0 +1,126 @@
+"""This file contains tests for mozci/sources/buildbot_bridge.py."""
+import unittest
+
+from mock import Mock, patch
+
+from mozci.buildbot_graph import BuildbotGraph
+from mozci.errors import MozciError
+from mozci.sources import buildbot_bridge
+
+REPO_URL = 'https://hg.mozilla.org/integration/repo'
+BUILD = 'Platform1 repo build'
+TESTS = ['Platform1 repo opt test mochitest-%d' % i for i in range(1, 4)]
+
+
+def _push():
+    push = Mock(user='nobody@mozilla.com')
+    push.changesets = [Mock(node='a' * 40)]
+    return push
+
+
+def _metadata(buildername):
+    return {'repo_name': 'repo', 'product': 'firefox',
+            'platform_name': buildername.split(' ')[0]}
+
+
+@patch('mozci.sources.buildbot_bridge.valid_builder', return_value=True)
+@patch('mozci.sources.buildbot_bridge.get_buildername_metadata', side_effect=_metadata)
+@patch('mozci.buildbot_graph.get_buildername_metadata', side_effect=_metadata)
+@patch('mozci.sources.buildbot_bridge.query_repo_url', return_value=REPO_URL)
+@patch('mozci.sources.tc.query_repo_url', return_value=REPO_URL)
+@patch('mozci.sources.tc.query_push_by_revision')
+@patch('mozci.sources.buildbot_bridge.query_push_by_revision', return_value=_push())
+class TestGenerateGraph(unittest.TestCase):
+
+    def test_push_queried_once(self, query_push, tc_query_push, *args):
+        """We resolve the push once for the whole graph, not once per task."""
+        graph = buildbot_bridge.generate_builders_tc_graph(
+            repo_name='repo',
+            revision='a' * 12,
+            builders_graph={BUILD: dict((test, None) for test in TESTS)})
+
+        self.assertEquals(len(graph['tasks']), 4)
+        self.assertEquals(query_push.call_count, 1)
+        self.assertEquals(tc_query_push.call_count, 0)
+
+        names = sorted(task['task']['metadata']['name'] for task in graph['tasks'])
+        self.assertEquals(names, sorted([BUILD] + TESTS))
+        self.assertEquals(graph['metadata']['name'], 'Mozci BBB graph')
+        for task in graph['tasks']:
+            self.assertEquals(task['task']['metadata']['owner'], 'nobody@mozilla.com')
+            self.assertEquals(task['task']['payload']['sourcestamp']['revision'], 'a' * 40)
+
+    def test_deep_graph(self, *args):
+        """Every task requires the task of the builder which triggers it."""
+        depth = 2000
+        graph = None
+        for i in reversed(range(depth)):
+            graph = {'Platform1 repo build %d' % i: graph}
+
+        tasks = buildbot_bridge.generate_builders_tc_graph(
+            repo_name='repo', revision='a' * 12, builders_graph=graph)['tasks']
+
+        self.assertEquals(len(tasks), depth)
+        self.assertNotIn('requires', tasks[0])
+        for parent, task in zip(tasks, tasks[1:]):
+            self.assertEquals(task['requires'], [parent['taskId']])
+            self.assertEquals(task['task']['payload']['properties']['parent_task_id'],
+                              parent['task']['payload']['properties']['upload_to_task_id'])
+
+    def test_range_graphs(self, query_push, *args):
+        """The tasks of many revisions are combined without splitting a revision."""
+        buildbot_graph = BuildbotGraph()
+        for revision in [c * 40 for c in 'abc']:
+            buildbot_graph.add_dict({BUILD: dict((test, None) for test in TESTS)}, revision)
+        # Builders already in the graph are not added twice
+        buildbot_graph.add_dict({BUILD: {TESTS[0]: None}}, 'a' * 40)
+        graphs = buildbot_bridge.generate_range_tc_graphs(
+            repo_name='repo', buildbot_graph=buildbot_graph, max_tasks=8)
+
+        self.assertEquals([len(graph['tasks']) for graph in graphs], [8, 4])
+        self.assertEquals(query_push.call_count, 3)
+        self.assertEquals(graphs[0]['metadata']['name'], 'Mozci BBB graph for 2 revisions')
+        self.assertIn('%s, %s' % ('a' * 12, 'b' * 12), graphs[0]['metadata']['description'])
+        self.assertIn('c' * 12, graphs[1]['metadata']['description'])
+        self.assertEquals(graphs[1]['tasks'][0]['task']['metadata']['name'],
+                          '%s %s' % (BUILD, 'c' * 12))
+        for graph in graphs:
+            task_ids = set(task['taskId'] for task in graph['tasks'])
+            for task in graph['tasks']:
+                self.assertTrue(set(task.get('requires', [])) <= task_ids)
+
+    def test_platform_mismatch(self, *args):
+        """We do not trigger tests of a platform on a build of another one."""
+        with self.assertRaises(MozciError):
+            buildbot_bridge.generate_builders_tc_graph(
+                repo_name='repo',
+                revision='a' * 12,
+                builders_graph={BUILD: {'Platform2 repo opt test mochitest-1': None}})
+
+
+@patch('mozci.sources.buildbot_bridge.valid_builder', return_value=True)
+@patch('mozci.sources.buildbot_bridge.is_downstream', side_effect=lambda b: 'test' in b)
+@patch('mozci.mozci.determine_upstream_builder',
+       side_effect=lambda b: b.split(' opt test')[0] + ' build')
+class TestBuildbotGraphBuilder(unittest.TestCase):
+
+    @patch('mozci.mozci.determine_trigger_objective',
+           side_effect=lambda revision, b: (b.split(' opt test')[0] + ' build', None, None))
+    def test_build_resolved_once(self, determine_trigger_objective, *args):
+        other_tests = ['Platform2 repo opt test mochitest-1']
+        graph, ready = buildbot_bridge.buildbot_graph_builder(TESTS + other_tests, 'a' * 12)
+
+        self.assertEquals(determine_trigger_objective.call_count, 2)
+        self.assertEquals(graph, {
+            BUILD: dict((test, None) for test in TESTS),
+            'Platform2 repo build': {other_tests[0]: None},
+        })
+        self.assertEquals(ready, [])
+
+    @patch('mozci.mozci.determine_trigger_objective',
+           side_effect=lambda revision, b: (b, 'package', 'tests'))
+    def test_build_completed(self, determine_trigger_objective, *args):
+        graph, ready = buildbot_bridge.buildbot_graph_builder(TESTS, 'a' * 12, complete=False)
+        self.assertEquals(determine_trigger_objective.call_count, 1)
+        self.assertEquals(graph, {})
+        self.assertEquals(ready, TESTS)
@@ -0,0 +1,86 @@
+"""This file contains tests for mozci/buildbot_graph.py."""
+import unittest
+
+from mock import patch
+
+from mozci.buildbot_graph import BuildbotGraph
+from mozci.errors import MozciError
+
+BUILD = 'Platform1 repo build'
+TEST1 = 'Platform1 repo opt test mochitest-1'
+TEST2 = 'Platform1 repo opt test mochitest-2'
+OTHER_TEST = 'Platform2 repo opt test mochitest-1'
+
+
+def _metadata(buildername):
+    return {'repo_name': 'repo', 'product': 'firefox',
+            'platform_name': buildername.split(' ')[0]}
+
+
+class TestBuildbotGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = BuildbotGraph.from_dict({BUILD: {TEST1: None, TEST2: None}}, 'rev1')
+
+    def test_lookup(self):
+        self.assertEquals(len(self.graph), 3)
+        self.assertIn(('rev1', TEST1), self.graph)
+        self.assertNotIn(('rev2', TEST1), self.graph)
+        build = self.graph.node_id('rev1', BUILD)
+        self.assertEquals(self.graph.roots(), [build])
+        self.assertEquals(self.graph.parent(self.graph.node_id('rev1', TEST2)), build)
+
+    def test_merge(self):
+        """Nodes in both graphs are only added once."""
+        other = BuildbotGraph.from_dict({BUILD: {TEST1: None}}, 'rev1')
+        other.add_dict({BUILD: {TEST1: None}}, 'rev2')
+        self.graph.merge(other)
+
+        self.assertEquals(len(self.graph), 5)
+        self.assertEquals(self.graph.to_dict('rev1'), {BUILD: {TEST1: None, TEST2: None}})
+        self.assertEquals(self.graph.to_dict('rev2'), {BUILD: {TEST1: None}})
+        self.assertEquals(self.graph.revisions, ['rev1', 'rev2'])
+
+    def test_revision(self):
+        self.graph.add_dict({BUILD: {TEST1: None}}, 'rev2')
+        self.assertEquals(len(self.graph.node_ids('rev2')), 2)
+        order = [self.graph.node(n) for n in self.graph.topological_order('rev2')]
+        self.assertEquals(order, [('rev2', BUILD), ('rev2', TEST1)])
+        self.assertEquals(self.graph.node_ids('rev3'), [])
+
+    def test_deep_graph(self):
+        """Deep graphs are converted without recursing."""
+        graph = None
+        for i in reversed(range(2000)):
+            graph = {'Platform1 repo build %d' % i: graph}
+        graph = BuildbotGraph.from_dict(graph, 'rev1').to_dict('rev1')
+        for i in range(2000):
+            buildername, graph = graph.items()[0]
+            self.assertEquals(buildername, 'Platform1 repo build %d' % i)
+        self.assertIsNone(graph)
+
+    def test_topological_order(self):
+        order = [self.graph.node(n)[1] for n in self.graph.topological_order()]
+        self.assertEquals(order[0], BUILD)
+        self.assertEquals(sorted(order[1:]), [TEST1, TEST2])
+
+    def test_two_parents(self):
+        self.graph.add(TEST2, 'rev1')
+        with self.assertRaises(MozciError):
+            self.graph.add(TEST2, 'rev1', parent=TEST1)
+
+    def test_cycle(self):
+        graph = BuildbotGraph()
+        graph.add(BUILD, 'rev1')
+        graph.add(TEST1, 'rev1', parent=BUILD)
+        # Nothing prevents making a root the child of its own child
+        graph.add(BUILD, 'rev1', parent=TEST1)
+        with self.assertRaises(MozciError):
+            graph.topological_order()
+
+    @patch('mozci.buildbot_graph.get_buildername_metadata', side_effect=_metadata)
+    def test_platform_mismatch(self, get_buildername_metadata):
+        self.graph.validate()
+        self.graph.add(OTHER_TEST, 'rev1', parent=BUILD)
+        with self.assertRaises(MozciError):
+            self.graph.validate()
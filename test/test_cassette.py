@@ -0,0 +1,76 @@
+"""This file contains tests for mozci/utils/cassette.py."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from mozci import fake_services
+from mozci.errors import CassetteError
+from mozci.utils import metrics
+from mozci.utils.cassette import Cassette, NONE, RECORD, endpoint
+from mozci.utils.parallel import parallel_map
+
+URL = 'https://host/file.json'
+TC_URL = 'https://scheduler.taskcluster.net/v1/task-graph/%s/status'
+
+
+class TestCassette(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'cassette.gz')
+        services = fake_services.FakeServices()
+        services.files['host/file.json'] = {'value': 1}
+        services.task_graphs['A' * 22] = {'state': 'running', 'tasks': []}
+        fake_services.enable(services.start())
+        try:
+            with Cassette(self.path, mode=RECORD) as cassette:
+                requests.get(URL, stream=True)
+                requests.get(TC_URL % ('A' * 22))
+        finally:
+            fake_services.disable()
+            services.stop()
+        self.recorded = cassette.requests
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_replay(self):
+        with Cassette(self.path, latency=NONE) as cassette:
+            req = requests.get(URL, stream=True)
+            self.assertEquals(req.json(), {'value': 1})
+            self.assertEquals(''.join(requests.get(URL, stream=True).iter_content(2)),
+                              '{"value": 1}')
+            # Another task graph id is the same endpoint
+            self.assertEquals(requests.get(TC_URL % ('B' * 22)).json()['status']['state'],
+                              'running')
+            with self.assertRaises(CassetteError):
+                requests.get('https://host/other.json')
+
+        self.assertEquals(self.recorded[endpoint('GET', URL)], 1)
+        self.assertEquals(cassette.requests[endpoint('GET', URL)], 2)
+        self.assertEquals(cassette.requests['GET scheduler.taskcluster.net/v1/task-graph/<id>/'
+                                            'status'], 1)
+
+    def test_stop_keeps_later_hooks(self):
+        """Stopping a cassette does not remove a hook installed after it."""
+        original_send = requests.adapters.HTTPAdapter.send
+        cassette = Cassette(self.path, latency=NONE)
+        cassette.start()
+        metrics.instrument_http()
+        metrics_send = requests.adapters.HTTPAdapter.send
+        cassette.stop()
+        try:
+            self.assertEquals(requests.adapters.HTTPAdapter.send, metrics_send)
+        finally:
+            metrics.uninstrument_http()
+            # The hook of the stopped cassette passes requests through
+            requests.adapters.HTTPAdapter.send = original_send
+
+    def test_concurrent_replay(self):
+        """Workers can replay the same request at once."""
+        with Cassette(self.path, latency=NONE):
+            responses = parallel_map(lambda _: requests.get(URL).json(), range(20), 8)
+        self.assertEquals(responses, [{'value': 1}] * 20)
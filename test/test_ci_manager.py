@@ -2,7 +2,14 @@
 
 import unittest
 
-from mozci.ci_manager import BaseCIManager, BuildAPIManager, TaskClusterManager
+from mock import patch
+
+from mozci.ci_manager import (
+    BaseCIManager,
+    BuildAPIManager,
+    TaskClusterBuildbotManager,
+    TaskClusterManager,
+)
 
 
 class TestInstantiation(unittest.TestCase):
@@ -17,3 +24,25 @@ class TestInstantiation(unittest.TestCase):
 
     def test_initiate_taskcluster_manager(self):
         TaskClusterManager()
+
+
+class TestTaskClusterBuildbotManager(unittest.TestCase):
+
+    @patch('mozci.ci_manager.buildbot_bridge.buildbot_graph_builder',
+           return_value=({'Platform1 repo build': None}, []))
+    @patch('mozci.ci_manager.buildbot_bridge.generate_range_tc_graphs',
+           return_value=[{'tasks': []}, {'tasks': []}])
+    @patch.object(TaskClusterManager, 'schedule_graph', return_value='graph id')
+    def test_combined_graphs_are_scheduled_by_the_manager(self, schedule_graph,
+                                                          generate_range_tc_graphs, *args):
+        manager = TaskClusterBuildbotManager(combine_revisions=True)
+        results = manager.trigger_range('Platform1 repo build', 'repo', ['rev1', 'rev2'], 1,
+                                        dry_run=True, files=None,
+                                        trigger_build_if_missing=False)
+        self.assertEquals(results, ['graph id', 'graph id'])
+        self.assertEquals(schedule_graph.call_args[1],
+                          {'task_graph': {'tasks': []}, 'dry_run': True})
+        # The builders of every revision are merged into one graph
+        buildbot_graph = generate_range_tc_graphs.call_args[1]['buildbot_graph']
+        self.assertEquals(buildbot_graph.revisions, ['rev1', 'rev2'])
+        self.assertEquals(len(buildbot_graph), 2)
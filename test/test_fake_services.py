@@ -0,0 +1,80 @@
+"""This file contains tests for mozci/fake_services.py."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from mock import patch
+
+from mozci import fake_services
+from mozci.sources import pushlog, tc
+
+REPO_URL = 'https://hg.mozilla.org/integration/repo'
+FIXTURES = {
+    'pushes': {
+        REPO_URL: dict((str(i), {'date': 1000 * i, 'user': 'user%d' % i,
+                                 'changesets': ['%02d' % i * 20]})
+                       for i in range(1, 21))
+    },
+    'buildapi': {'repo': {'01' * 20: [{'build_id': 1}]}},
+    'files': {'https://host/allthethings.json': {'builders': {}}},
+}
+
+
+class TestFakeServices(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        fixtures_path = os.path.join(self.tmp_dir, 'fixtures.json')
+        with open(fixtures_path, 'w') as f:
+            json.dump(FIXTURES, f)
+
+        self.services = fake_services.FakeServices(fixtures_path)
+        fake_services.enable(self.services.start())
+        pushlog.PUSHLOG_STORE = pushlog.PushlogStore(
+            path=os.path.join(self.tmp_dir, 'pushlog.db'))
+        tc.configure_clients()
+
+    def tearDown(self):
+        fake_services.disable()
+        self.services.stop()
+        pushlog.PUSHLOG_STORE = None
+        tc.configure_clients()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_pushlog(self):
+        revisions = pushlog.query_pushes_by_specified_revision_range(
+            REPO_URL, '05' * 6, before=2, after=1, return_revision_list=True)
+        self.assertEquals(revisions, ['%02d' % i * 20 for i in (6, 5, 4, 3)])
+        self.assertEquals(pushlog.query_repo_tip(REPO_URL).id, 20)
+        self.assertFalse(pushlog.valid_revision(REPO_URL, 'ff' * 6))
+
+    def test_buildapi_and_files(self):
+        selfserve = 'https://%s/repo' % fake_services.SELFSERVE
+        self.assertEquals(requests.get('%s/rev/%s' % (selfserve, '01' * 6)).json(),
+                          [{'build_id': 1}])
+        self.assertEquals(requests.post('%s/request' % selfserve,
+                                        data={'request_id': 1}).status_code, 202)
+        self.assertEquals(len(self.services.buildapi_requests), 1)
+        self.assertEquals(requests.get('https://host/allthethings.json').json(),
+                          {'builders': {}})
+
+    @patch.dict(os.environ, {'TASKCLUSTER_CLIENT_ID': 'id', 'TASKCLUSTER_ACCESS_TOKEN': 'x'})
+    def test_taskcluster(self):
+        task_graph = tc.generate_task_graph(
+            scopes=[], metadata={'name': 'graph'},
+            tasks=[{'taskId': 'task1', 'task': {'metadata': {'name': 'task1'}}}])
+        tc.schedule_graph(task_graph, task_graph_id='graph1')
+
+        self.assertEquals(tc.get_task_graph_status('graph1'), 'running')
+        self.assertEquals(tc.get_task('task1'), {'metadata': {'name': 'task1'}})
+        self.services.set_task_graph_state('graph1', 'finished')
+        self.assertEquals(tc.get_task_graph_status('graph1'), 'finished')
+
+    def test_failures(self):
+        self.services.failure_rate = {'host': 1}
+        self.assertEquals(requests.get('https://host/allthethings.json').status_code, 503)
+        self.assertEquals(self.services.requests['host'], 1)
@@ -0,0 +1,90 @@
+"""This file contains tests for mozci/job_matrix.py."""
+import unittest
+
+from mozci.errors import BuildapiError
+from mozci.job_matrix import JobMatrix, NO_JOB
+from mozci.query_jobs import COALESCED, FAILURE, RUNNING, SUCCESS, UNKNOWN
+
+BUILDER1 = 'Platform1 repo opt test mochitest-1'
+BUILDER2 = 'Platform1 repo opt test mochitest-2'
+
+
+class FakeQueryApi(object):
+    """Return jobs of the form {'buildername': ..., 'status': ...}."""
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.queried = []
+
+    def get_all_jobs(self, repo_name, revision):
+        self.queried.append(revision)
+        return self.jobs[revision]
+
+    def get_buildername(self, job):
+        return job['buildername']
+
+    def get_job_status(self, job):
+        if job['status'] is None:
+            raise BuildapiError("Unexpected status")
+        return job['status']
+
+
+def _job(buildername, status):
+    return {'buildername': buildername, 'status': status}
+
+
+class TestJobMatrix(unittest.TestCase):
+
+    def setUp(self):
+        # Newest revision first
+        self.revisions = ['rev4', 'rev3', 'rev2', 'rev1', 'rev0']
+        self.query_api = FakeQueryApi({
+            'rev4': [_job(BUILDER1, FAILURE), _job(BUILDER2, RUNNING)],
+            'rev3': [_job(BUILDER1, COALESCED)],
+            'rev2': [_job(BUILDER1, COALESCED), _job(BUILDER2, COALESCED)],
+            'rev1': [_job(BUILDER1, FAILURE), _job(BUILDER1, SUCCESS)],
+            'rev0': [_job(BUILDER1, COALESCED), _job(BUILDER2, SUCCESS)],
+        })
+        self.matrix = JobMatrix.from_query_api(self.query_api, 'repo', self.revisions)
+
+    def test_jobs_queried_once(self):
+        self.assertEquals(self.query_api.queried, self.revisions)
+        self.assertEquals(self.matrix.buildernames, [BUILDER1, BUILDER2])
+
+    def test_status_and_count(self):
+        """A successful job makes the cell successful."""
+        self.assertEquals(self.matrix.status('rev1', BUILDER1), SUCCESS)
+        self.assertEquals(self.matrix.count('rev1', BUILDER1), 2)
+        self.assertEquals(self.matrix.status('rev3', BUILDER2), NO_JOB)
+        self.assertEquals(self.matrix.count('rev3', BUILDER2), 0)
+
+    def test_last_successful_revisions(self):
+        self.assertEquals(self.matrix.last_successful_revisions(),
+                          {BUILDER1: 'rev1', BUILDER2: 'rev0'})
+
+    def test_last_successful_revisions_as_rows_are_added(self):
+        matrix = JobMatrix([BUILDER1, BUILDER2])
+        matrix.add_revision('rev1', self.query_api.jobs['rev1'], self.query_api)
+        self.assertEquals(matrix.last_successful_revisions(), {BUILDER1: 'rev1', BUILDER2: None})
+        matrix.add_revision('rev0', self.query_api.jobs['rev0'], self.query_api)
+        self.assertEquals(matrix.last_successful_revisions(), {BUILDER1: 'rev1', BUILDER2: 'rev0'})
+
+    def test_unexpected_status(self):
+        """Jobs with an unexpected status are considered unknown."""
+        matrix = JobMatrix([BUILDER1])
+        matrix.add_revision('rev5', [_job(BUILDER1, None)], self.query_api)
+        self.assertEquals(matrix.status('rev5', BUILDER1), UNKNOWN)
+
+    def test_missing_jobs(self):
+        self.assertEquals(self.matrix.missing_jobs(), {BUILDER2: ['rev3', 'rev1']})
+
+    def test_coalesced_runs(self):
+        self.assertEquals(self.matrix.coalesced_runs(), {
+            BUILDER1: [('rev3', 2), ('rev0', 1)],
+            BUILDER2: [('rev2', 1)],
+        })
+
+    def test_selected_builders(self):
+        matrix = JobMatrix.from_query_api(self.query_api, 'repo', self.revisions[:2],
+                                          buildernames=[BUILDER2])
+        self.assertEquals(list(matrix.column(BUILDER2)), [RUNNING, NO_JOB])
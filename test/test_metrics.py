@@ -0,0 +1,135 @@
+"""This file contains tests for mozci/utils/metrics.py."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+from mock import patch
+
+from mozci import fake_services
+from mozci.sources import buildjson
+from mozci.utils import metrics
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counters(self):
+        self.registry.inc('requests', cache='A')
+        self.registry.inc('requests', 2, cache='A')
+        self.registry.inc('requests', cache='B')
+        self.assertEquals(self.registry.counter('requests', cache='A'), 3)
+        self.assertEquals(self.registry.counter('requests', cache='B'), 1)
+        self.assertEquals(self.registry.counter('requests', cache='C'), 0)
+
+    def test_counters_after_clear(self):
+        self.registry.inc('mozci_cache_requests_total', cache='DATA')
+        self.registry.clear()
+        self.registry.inc('mozci_cache_requests_total', cache='DATA')
+        self.assertEquals(self.registry.counter('mozci_cache_requests_total', cache='DATA'), 1)
+        self.assertEquals(self.registry.to_json()['counters'][0]['value'], 1)
+
+    def test_histograms(self):
+        for value in (0.001, 0.2, 7):
+            self.registry.observe('latency', value, endpoint='GET host/path')
+        self.assertEquals(self.registry.histogram('latency', endpoint='GET host/path'),
+                          (3, 7.201))
+        buckets = self.registry.to_json()['histograms'][0]['buckets']
+        self.assertEquals((buckets[0.005], buckets[0.25], buckets[10]), (1, 2, 3))
+
+    def test_prometheus(self):
+        self.registry.inc('mozci_http_requests_total', endpoint='GET host/"x"', status='200')
+        self.registry.observe('mozci_phase_seconds', 0.5, phase='pushlog')
+        lines = self.registry.to_prometheus().splitlines()
+        self.assertIn('# TYPE mozci_http_requests_total counter', lines)
+        self.assertIn('mozci_http_requests_total{endpoint="GET host/\\"x\\"",status="200"} 1',
+                      lines)
+        self.assertIn('# TYPE mozci_phase_seconds histogram', lines)
+        self.assertIn('mozci_phase_seconds_bucket{phase="pushlog",le="0.25"} 0', lines)
+        self.assertIn('mozci_phase_seconds_bucket{phase="pushlog",le="+Inf"} 1', lines)
+        self.assertIn('mozci_phase_seconds_count{phase="pushlog"} 1', lines)
+
+    def test_write(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            self.registry.inc('mozci_downloaded_bytes_total', 10)
+            self.registry.write(os.path.join(tmp_dir, 'mozci.prom'))
+            self.registry.write(os.path.join(tmp_dir, 'mozci.json'))
+            with open(os.path.join(tmp_dir, 'mozci.prom')) as f:
+                self.assertIn('mozci_downloaded_bytes_total 10\n', f.read())
+            with open(os.path.join(tmp_dir, 'mozci.json')) as f:
+                self.assertEquals(json.load(f)['counters'][0]['value'], 10)
+            self.assertEquals(sorted(os.listdir(tmp_dir)), ['mozci.json', 'mozci.prom'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        metrics.REGISTRY.clear()
+
+    def test_timed(self):
+        @metrics.timed('phase')
+        def _phase():
+            return 1
+
+        self.assertEquals(_phase(), 1)
+        self.assertEquals(metrics.REGISTRY.histogram('mozci_phase_seconds', phase='phase')[0], 1)
+
+    @patch('mozci.sources.buildjson.load_file', return_value={'builds': []})
+    def test_cache_hits(self, load_file):
+        buildjson.BUILDS_CACHE.pop('builds-2015-01-01.js', None)
+        buildjson.fetch_by_date('2015-01-01')
+        buildjson.fetch_by_date('2015-01-01')
+        self.assertEquals(metrics.REGISTRY.counter(
+            'mozci_cache_requests_total', cache='BUILDS_CACHE', result='miss'), 1)
+        self.assertEquals(metrics.REGISTRY.counter(
+            'mozci_cache_requests_total', cache='BUILDS_CACHE', result='hit'), 1)
+        self.assertEquals(
+            metrics.REGISTRY.histogram('mozci_phase_seconds', phase='buildjson')[0], 1)
+
+    def test_http(self):
+        response = requests.models.Response()
+        response.status_code = 200
+        response._content = 'x' * 10
+        with patch('requests.adapters.HTTPAdapter.send', return_value=response):
+            metrics.instrument_http()
+            try:
+                requests.get('https://hg.mozilla.org/integration/repo/rev/abcdef123456')
+            finally:
+                metrics.uninstrument_http()
+
+        endpoint = 'GET hg.mozilla.org/integration/repo/rev/<id>'
+        self.assertEquals(metrics.REGISTRY.counter(
+            'mozci_http_requests_total', endpoint=endpoint, status='200'), 1)
+        self.assertEquals(metrics.REGISTRY.counter(
+            'mozci_http_response_bytes_total', endpoint=endpoint), 10)
+        self.assertEquals(
+            metrics.REGISTRY.histogram('mozci_http_request_seconds', endpoint=endpoint)[0], 1)
+
+    def test_http_hooks_restore_their_send(self):
+        """Removing a hook keeps the hooks installed after it."""
+        original_send = requests.adapters.HTTPAdapter.send
+        metrics.instrument_http()
+        fake_services.enable('http://localhost:1')
+        fake_services.disable()
+        metrics.uninstrument_http()
+        self.assertEquals(requests.adapters.HTTPAdapter.send, original_send)
+
+        fake_services.enable('http://localhost:1')
+        metrics.instrument_http()
+        metrics_send = requests.adapters.HTTPAdapter.send
+        fake_services.disable()
+        try:
+            # The metrics hook was installed after the fake services one
+            self.assertEquals(requests.adapters.HTTPAdapter.send, metrics_send)
+        finally:
+            metrics.uninstrument_http()
+            fake_services.disable()
+        self.assertEquals(requests.adapters.HTTPAdapter.send, original_send)
@@ -1,13 +1,19 @@
 """This file contains tests for mozci/mozci.py."""
 
 import json
+import os
 import pytest
+import shutil
+import tempfile
 import unittest
 
 import mozci.mozci
+from mozci.errors import MozciError
 from mozci.query_jobs import SUCCESS, PENDING, RUNNING, COALESCED
+from mozci.trigger_plan import BuildThenTest, TriggerPlan
+from mozci.utils.build_requests import BuildRequestStore
 
-from mock import patch
+from mock import Mock, patch
 
 
 MOCK_JSON = '''{
@@ -121,3 +127,257 @@ class TestJobValidation(unittest.TestCase):
     def test_status_summary_coalesced(self, get_status):
         """Test StatusSummary with a coalesced state."""
         assert mozci.mozci.StatusSummary(self.jobs).coalesced_jobs == 1
+
+
+class TestFindBuildJob(unittest.TestCase):
+    """Test that the build jobs are only looked up once per revision."""
+
+    def setUp(self):
+        mozci.mozci.BUILD_JOBS_CACHE = {}
+
+    @patch('mozci.query_jobs.BuildApi.get_matching_jobs', return_value=[])
+    def test_build_job_is_memoized(self, get_matching_jobs):
+        """Every test job of the same build should reuse the first lookup."""
+        first = mozci.mozci._find_build_job('repo', 'rev', 'Platform repo build')
+        second = mozci.mozci._find_build_job('repo', 'rev', 'Platform repo build')
+        assert first is second
+        assert get_matching_jobs.call_count == 1
+
+    @patch('mozci.query_jobs.BuildApi.get_matching_jobs', return_value=[])
+    def test_different_revisions(self, get_matching_jobs):
+        """Different revisions need their own lookup."""
+        mozci.mozci._find_build_job('repo', 'rev1', 'Platform repo build')
+        mozci.mozci._find_build_job('repo', 'rev2', 'Platform repo build')
+        assert get_matching_jobs.call_count == 2
+
+    @patch('mozci.query_jobs.BuildApi.get_matching_jobs', return_value=[])
+    def test_invalidate(self, get_matching_jobs):
+        """A build job is looked up again once the caches of its revision are invalidated."""
+        mozci.mozci.query_jobs.JOBS_CACHE[('repo', 'rev1')] = []
+        mozci.mozci._find_build_job('repo', 'rev1', 'Platform repo build')
+        mozci.mozci._find_build_job('repo', 'rev2', 'Platform repo build')
+        mozci.mozci.invalidate_job_caches('repo', 'rev1')
+
+        assert ('repo', 'rev1') not in mozci.mozci.query_jobs.JOBS_CACHE
+        assert mozci.mozci.BUILD_JOBS_CACHE.keys() == [('rev2', 'Platform repo build')]
+        mozci.mozci._find_build_job('repo', 'rev1', 'Platform repo build')
+        assert get_matching_jobs.call_count == 3
+
+
+class TestPlanTriggers(unittest.TestCase):
+    """Test the evaluation of revisions in worker threads."""
+
+    BUILDER = 'Platform1 repo opt test mochitest-1'
+
+    @patch('mozci.mozci.valid_builder', return_value=False)
+    @patch('mozci.mozci.valid_revision', return_value=True)
+    @patch('mozci.mozci.determine_upstream_builder')
+    @patch('mozci.mozci.get_credentials')
+    @patch('mozci.mozci.query_repo_name_from_buildername', return_value='repo')
+    @patch('mozci.repositories.query_repo_url', return_value='repo_url')
+    def test_invalid_builder_in_workers(self, query_repo_url, query_repo_name,
+                                        get_credentials, determine_upstream_builder,
+                                        valid_revision, valid_builder):
+        """An invalid builder should raise instead of killing a worker thread."""
+        with patch.object(mozci.mozci.QUERY_SOURCE, 'get_matching_jobs', return_value=[]):
+            with pytest.raises(MozciError):
+                mozci.mozci.plan_triggers([self.BUILDER], ['rev1', 'rev2'], workers=2)
+
+
+@patch('mozci.mozci.is_downstream', side_effect=lambda buildername: ' test ' in buildername)
+@patch('mozci.mozci.query_repo_name_from_buildername', return_value='repo')
+@patch('mozci.mozci.get_credentials')
+@patch('mozci.request_coalescer.get_credentials')
+class TestBuildRequestClaims(unittest.TestCase):
+    """Test that the claim of a build job is released when its request fails."""
+
+    BUILD = 'Platform1 repo opt build'
+    TEST = 'Platform1 repo opt test mochitest-1'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = BuildRequestStore(path=os.path.join(self.tmp_dir, 'build_requests.db'))
+        mozci.mozci.BUILD_REQUESTS = self.store
+
+    def tearDown(self):
+        mozci.mozci.BUILD_REQUESTS = None
+        mozci.mozci.DEDUPE_BUILD_REQUESTS = True
+        shutil.rmtree(self.tmp_dir)
+
+    def _plan(self):
+        return TriggerPlan([BuildThenTest(
+            repo_name='repo', revision='rev1', build_buildername=self.BUILD,
+            test_buildername=self.TEST, times=1)])
+
+    @patch('mozci.mozci.trigger_arbitrary_job', return_value=Mock(status_code=202))
+    def test_trigger(self, trigger_arbitrary_job, *args):
+        self.assertEquals(mozci.mozci.trigger(self.BUILD, 'rev1').status_code, 202)
+        self.assertIsNone(mozci.mozci.trigger(self.BUILD, 'rev1'))
+        self.assertEquals(trigger_arbitrary_job.call_count, 1)
+
+    @patch('mozci.mozci.trigger_arbitrary_job', side_effect=ValueError())
+    def test_trigger_raises(self, trigger_arbitrary_job, *args):
+        with pytest.raises(ValueError):
+            mozci.mozci.trigger(self.BUILD, 'rev1')
+        self.assertFalse(self.store.was_requested('repo', 'rev1', self.BUILD))
+
+    @patch('mozci.mozci.trigger_arbitrary_job', return_value=Mock(status_code=401))
+    def test_trigger_fails(self, trigger_arbitrary_job, *args):
+        mozci.mozci.trigger(self.BUILD, 'rev1')
+        self.assertFalse(self.store.was_requested('repo', 'rev1', self.BUILD))
+
+    @patch('mozci.request_coalescer.trigger_arbitrary_job', return_value=Mock(status_code=500))
+    def test_execute_plan_fails(self, trigger_arbitrary_job, *args):
+        summary = mozci.mozci.execute_plan(self._plan())
+        self.assertEquals(summary['failed_requests'], 1)
+        self.assertFalse(self.store.was_requested('repo', 'rev1', self.BUILD))
+        # The next run can request the build again
+        mozci.mozci.execute_plan(self._plan())
+        self.assertEquals(trigger_arbitrary_job.call_count, 2)
+
+    @patch('mozci.request_coalescer.trigger_arbitrary_job', side_effect=ValueError())
+    def test_execute_plan_raises(self, trigger_arbitrary_job, *args):
+        with pytest.raises(ValueError):
+            mozci.mozci.execute_plan(self._plan())
+        self.assertFalse(self.store.was_requested('repo', 'rev1', self.BUILD))
+
+    @patch('mozci.request_coalescer.trigger_arbitrary_job', return_value=Mock(status_code=202))
+    def test_no_dedupe(self, trigger_arbitrary_job, *args):
+        mozci.mozci.execute_plan(self._plan())
+        mozci.mozci.execute_plan(self._plan())
+        self.assertEquals(trigger_arbitrary_job.call_count, 1)
+
+        mozci.mozci.disable_build_request_dedupe()
+        mozci.mozci.execute_plan(self._plan())
+        self.assertEquals(trigger_arbitrary_job.call_count, 2)
+
+
+class Push(object):
+    def __init__(self, push_id, date):
+        self.id = push_id
+        self.date = date
+        self.changesets = [type('Changeset', (object,), {'node': 'rev%d' % push_id})]
+
+
+class TestSETARevisions(unittest.TestCase):
+    """Test that we only select the revisions SETA would run a job on."""
+
+    BUILDER = 'Platform1 repo opt test mochitest-1'
+
+    def test_seta_run_revisions_by_pushes(self):
+        pushes = [Push(i, i) for i in range(10)]
+        assert mozci.mozci._seta_run_revisions(pushes, [3, 3600], set(['rev0'])) == \
+            ['rev0', 'rev3', 'rev6', 'rev9']
+
+    def test_seta_run_revisions_by_time(self):
+        """A job runs after seta_interval[1] seconds even if not enough pushes landed."""
+        pushes = [Push(0, 0), Push(1, 10), Push(2, 4000), Push(3, 4010)]
+        assert mozci.mozci._seta_run_revisions(pushes, [7, 3600], set(['rev0'])) == \
+            ['rev0', 'rev2']
+
+    def test_seta_run_revisions_from_jobs(self):
+        """We count from the pushes with jobs and keep the pushes before the first one."""
+        pushes = [Push(i, i) for i in range(10)]
+        assert mozci.mozci._seta_run_revisions(pushes, [3, 3600], set(['rev2', 'rev4'])) == \
+            ['rev0', 'rev1', 'rev2', 'rev4', 'rev7']
+
+    @patch('mozci.mozci.query_repo_name_from_buildername', return_value='repo')
+    @patch('mozci.mozci.query_repo_url_from_buildername', return_value='repo_url')
+    @patch('mozci.mozci.query_pushes_by_specified_revision_range')
+    @patch('mozci.mozci.get_SETA_interval_dict')
+    def test_select_seta_revisions(self, get_SETA_interval_dict, query_pushes, query_repo_url,
+                                   query_repo_name):
+        get_SETA_interval_dict.return_value = {self.BUILDER: [2, 3600]}
+        # Newest first as pushlog returns them; rev0 had a job
+        query_pushes.return_value = [Push(i, i) for i in range(6, -1, -1)]
+        revisions = ['rev%d' % i for i in range(6, 0, -1)]
+        with patch.object(mozci.mozci.QUERY_SOURCE, 'get_matching_jobs',
+                          side_effect=lambda repo_name, rev, b: [{}] if rev == 'rev0' else []):
+            assert mozci.mozci.select_seta_revisions(self.BUILDER, revisions) == \
+                ['rev6', 'rev4', 'rev2']
+            # The requested revision is always kept
+            assert mozci.mozci.select_seta_revisions(self.BUILDER, revisions, keep=['rev5']) == \
+                ['rev6', 'rev5', 'rev4', 'rev2']
+
+    @patch('mozci.mozci.query_pushes_by_specified_revision_range')
+    @patch('mozci.mozci.get_SETA_interval_dict')
+    def test_select_seta_revisions_without_jobs(self, get_SETA_interval_dict, query_pushes):
+        """Without a job before the range (e.g. --delta) we keep every revision."""
+        get_SETA_interval_dict.return_value = {self.BUILDER: [2, 3600]}
+        pushes = [Push(i, i) for i in range(4, -1, -1)]
+        revisions = ['rev%d' % i for i in range(4, 0, -1)]
+        assert mozci.mozci.select_seta_revisions(
+            self.BUILDER, revisions, pushes=pushes, job_revisions=[]) == revisions
+        assert not query_pushes.called
+
+    @patch('mozci.mozci.query_pushes_by_specified_revision_range')
+    @patch('mozci.mozci.get_SETA_interval_dict', return_value={})
+    def test_no_seta(self, get_SETA_interval_dict, query_pushes):
+        """Builders without SETA keep all revisions."""
+        assert mozci.mozci.select_seta_revisions(self.BUILDER, ['rev2', 'rev1']) == \
+            ['rev2', 'rev1']
+        assert not query_pushes.called
+
+
+class TestFindBackfillRevlist(unittest.TestCase):
+    """Test that a SETA aware backfill reuses the pushes and jobs it looked at."""
+
+    BUILDER = 'Platform1 repo opt test mochitest-1'
+
+    @patch('mozci.mozci.query_repo_name_from_buildername', return_value='repo')
+    @patch('mozci.mozci.query_repo_url_from_buildername', return_value='repo_url')
+    @patch('mozci.mozci.query_pushes_by_specified_revision_range')
+    @patch('mozci.mozci.get_SETA_interval_dict')
+    def test_seta_aware(self, get_SETA_interval_dict, query_pushes, query_repo_url,
+                        query_repo_name):
+        get_SETA_interval_dict.return_value = {self.BUILDER: [2, 3600]}
+        query_pushes.return_value = [Push(i, i) for i in range(4, -1, -1)]
+        # rev4 failed and rev0 is the last successful job
+        jobs = {'rev4': [{'status': 2}], 'rev0': [{'status': 0}]}
+        query_source = mozci.mozci.QUERY_SOURCE
+        with patch.object(query_source, 'get_matching_jobs',
+                          side_effect=lambda repo_name, rev, b: jobs.get(rev, [])) as matching, \
+                patch.object(query_source, 'get_job_status', side_effect=lambda job: job['status']):
+            assert mozci.mozci.find_backfill_revlist(self.BUILDER, 'rev4', 5) == \
+                ['rev4', 'rev3', 'rev2', 'rev1']
+            assert mozci.mozci.find_backfill_revlist(
+                self.BUILDER, 'rev4', 5, seta_aware=True) == ['rev4', 'rev2']
+
+        assert query_pushes.call_count == 2
+        # Every revision is looked at once per backfill
+        assert matching.call_count == 10
+
+
+class TestFindBackfillRevlists(unittest.TestCase):
+    """Test that backfilling many builders queries every push once."""
+
+    BUILDER1 = 'Platform1 repo opt test mochitest-1'
+    BUILDER2 = 'Platform1 repo opt test mochitest-2'
+
+    def setUp(self):
+        # rev4 is the newest push
+        self.jobs = {
+            'rev4': [{'buildername': self.BUILDER1, 'status': 2},
+                     {'buildername': self.BUILDER2, 'status': 2}],
+            'rev3': [{'buildername': self.BUILDER1, 'status': 0}],
+            'rev2': [{'buildername': self.BUILDER2, 'status': 0}],
+            'rev1': [],
+            'rev0': [],
+        }
+
+    @patch('mozci.mozci.query_repo_name_from_buildername', return_value='repo')
+    @patch('mozci.repositories.query_repo_url', return_value='repo_url')
+    @patch('mozci.mozci.query_pushes_by_specified_revision_range')
+    def test_backfill_revlists(self, query_pushes, query_repo_url, query_repo_name):
+        query_pushes.return_value = [Push(i, i) for i in range(5)]
+        query_source = mozci.mozci.QUERY_SOURCE
+        with patch.object(query_source, 'get_all_jobs',
+                          side_effect=lambda repo_name, rev: self.jobs[rev]) as get_all_jobs, \
+                patch.object(query_source, 'get_job_status', side_effect=lambda job: job['status']):
+            revlists = mozci.mozci.find_backfill_revlists(
+                [self.BUILDER1, self.BUILDER2], 'rev4', 5, seta_aware=False)
+
+        assert revlists == {self.BUILDER1: ['rev4'], self.BUILDER2: ['rev4', 'rev3']}
+        assert query_pushes.call_count == 1
+        # We stop once every builder has a successful job
+        assert [c[0][1] for c in get_all_jobs.call_args_list] == ['rev4', 'rev3', 'rev2']
@@ -0,0 +1,122 @@
+"""This file contains tests for mozci/utils/parallel.py."""
+import logging
+import time
+import unittest
+
+from mozci.utils.parallel import (
+    KeyedLocks,
+    RateLimiter,
+    call_with_buffered_logs,
+    parallel_map,
+    replay_logs,
+)
+
+LOG = logging.getLogger('mozci')
+
+
+class ListHandler(logging.Handler):
+    """Keep every message that reaches the handler."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestParallelMap(unittest.TestCase):
+
+    def test_keeps_order(self):
+        """The results should be in the same order as the items."""
+        def _slow_double(x):
+            time.sleep(0.01 * (5 - x))
+            return x * 2
+
+        self.assertEquals(parallel_map(_slow_double, range(5), workers=5), [0, 2, 4, 6, 8])
+
+    def test_serial(self):
+        self.assertEquals(parallel_map(lambda x: x + 1, [1, 2], workers=1), [2, 3])
+
+
+class TestKeyedLocks(unittest.TestCase):
+
+    def test_one_lock_per_key(self):
+        locks = KeyedLocks()
+        self.assertIs(locks('a'), locks('a'))
+        self.assertIsNot(locks('a'), locks('b'))
+
+    def test_fill_once(self):
+        """Threads filling a cache under the lock of a key should only fill it once."""
+        locks = KeyedLocks()
+        cache = {}
+        calls = []
+
+        def _fill(key):
+            with locks(key):
+                if key not in cache:
+                    calls.append(key)
+                    time.sleep(0.01)
+                    cache[key] = key.upper()
+                return cache[key]
+
+        self.assertEquals(parallel_map(_fill, ['a', 'a', 'b', 'a'], workers=4),
+                          ['A', 'A', 'B', 'A'])
+        self.assertEquals(sorted(calls), ['a', 'b'])
+
+
+class TestBufferedLogs(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = ListHandler()
+        LOG.addHandler(self.handler)
+        self.level = LOG.level
+        LOG.setLevel(logging.INFO)
+
+    def tearDown(self):
+        LOG.removeHandler(self.handler)
+        LOG.setLevel(self.level)
+
+    def test_logs_are_grouped(self):
+        """Messages logged in parallel should be shown grouped per item."""
+        def _work(x):
+            for i in range(3):
+                LOG.info("%s-%d" % (x, i))
+                time.sleep(0.001)
+            return x
+
+        results = parallel_map(
+            lambda x: call_with_buffered_logs(_work, x), ['a', 'b', 'c'], workers=3)
+        self.assertEquals(self.handler.messages, [])
+
+        for _, records in results:
+            replay_logs(records)
+        self.assertEquals(
+            self.handler.messages,
+            ['a-0', 'a-1', 'a-2', 'b-0', 'b-1', 'b-2', 'c-0', 'c-1', 'c-2'])
+
+    def test_logs_are_shown_on_failure(self):
+        def _fail():
+            LOG.info("about to fail")
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            call_with_buffered_logs(_fail)
+        self.assertEquals(self.handler.messages, ["about to fail"])
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_spacing(self):
+        limiter = RateLimiter(max_per_second=50)
+        start = time.time()
+        for _ in range(4):
+            limiter.wait()
+        self.assertTrue(time.time() - start >= 0.06)
+
+    def test_no_limit(self):
+        limiter = RateLimiter()
+        start = time.time()
+        for _ in range(100):
+            limiter.wait()
+        self.assertTrue(time.time() - start < 0.05)
@@ -0,0 +1,64 @@
+"""This file contains tests for mozci/utils/polling.py."""
+import unittest
+
+from mock import patch
+
+from mozci.utils.polling import PollSchedule, poll_until_done
+
+
+class TestPollSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.schedule = PollSchedule(min_interval=10, max_interval=30)
+
+    def test_backoff_and_reset(self):
+        self.assertTrue(self.schedule.due('key', 0))
+        self.schedule.backoff('key', 0)
+        self.assertFalse(self.schedule.due('key', 5))
+        self.schedule.backoff('key', 10)
+        self.schedule.backoff('key', 30)
+        # The interval doubled up to max_interval
+        self.assertEquals(self.schedule.next_poll(), 60)
+        self.schedule.reset('key', 60)
+        self.assertEquals(self.schedule.next_poll(), 70)
+
+    def test_due_keys(self):
+        self.schedule.add('a')
+        self.schedule.add('b')
+        self.schedule.backoff('b', 0)
+        self.assertEquals(self.schedule.due_keys(5), ['a'])
+        self.schedule.remove('a')
+        self.assertEquals(len(self.schedule), 1)
+
+
+@patch('mozci.utils.polling.time')
+class TestPollUntilDone(unittest.TestCase):
+
+    def setUp(self):
+        self.schedule = PollSchedule(min_interval=10, max_interval=30)
+        self.now = [0]
+
+    def _clock(self, time):
+        time.time.side_effect = lambda: self.now[0]
+
+        def _sleep(seconds):
+            self.now[0] += seconds
+        time.sleep.side_effect = _sleep
+
+    def _poll(self, results):
+        def poll():
+            self.schedule.backoff('key', self.now[0])
+            return results.pop(0)
+        return poll
+
+    def test_until_done(self, time):
+        self._clock(time)
+        self.assertEquals(poll_until_done(self._poll([2, 1, 0]), self.schedule), 0)
+        # We slept until the key was due
+        self.assertEquals([c[0][0] for c in time.sleep.call_args_list], [10, 20])
+
+    def test_timeout(self, time):
+        self._clock(time)
+        self.assertEquals(
+            poll_until_done(self._poll([2, 2, 2, 2]), self.schedule, timeout=25), 2)
+        self.assertEquals(self.now[0], 25)
@@ -0,0 +1,62 @@
+"""This file contains tests for mozci/utils/profiler.py."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozci.utils import metrics, profiler
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.trace_path = os.path.join(self.tmp_dir, 'trace.json')
+
+    def tearDown(self):
+        profiler.TRACE = None
+        shutil.rmtree(self.tmp_dir)
+
+    def test_disabled(self):
+        with profiler.span('step'):
+            pass
+        self.assertIsNone(profiler.TRACE)
+
+    def test_spans(self):
+        profiler.TRACE = profiler.Trace()
+        with profiler.span('builder', builder='Builder A'):
+            with profiler.span('revision', builder='Builder A', revision='123456789012'):
+                with metrics.phase('matching_jobs'):
+                    pass
+        with profiler.span('builder', builder='Builder B'):
+            pass
+
+        names = [event[0] for event in profiler.TRACE.events]
+        self.assertEquals(names, ['matching_jobs', 'revision', 'builder', 'builder'])
+
+        summary = profiler.TRACE.summary()
+        self.assertTrue(summary[0].startswith('Wall time'))
+        self.assertIn('matching_jobs', summary[3])
+        self.assertEquals(len([line for line in summary if line.startswith('Builder ')]), 2)
+        self.assertTrue([line for line in summary if line.startswith('123456789012')])
+
+        events = profiler.TRACE.to_chrome_trace()['traceEvents']
+        self.assertEquals(events[-1]['name'], 'builder Builder B')
+        self.assertEquals(events[-1]['ph'], 'X')
+        self.assertEquals(events[1]['args'], {'builder': 'Builder A',
+                                              'revision': '123456789012'})
+        # The revision span is inside the builder span
+        self.assertLessEqual(events[2]['ts'], events[1]['ts'])
+        self.assertGreaterEqual(events[2]['dur'], events[1]['dur'])
+
+    def test_stop(self):
+        profiler.start(self.trace_path, cprofile=True)
+        with profiler.span('step'):
+            sum(range(1000))
+        profiler.stop(self.trace_path)
+
+        self.assertIsNone(profiler.TRACE)
+        with open(self.trace_path) as f:
+            self.assertEquals(json.load(f)['traceEvents'][0]['name'], 'step')
+        self.assertTrue(os.path.exists(self.trace_path + '.pstats'))
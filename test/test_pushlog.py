@@ -0,0 +1,97 @@
+"""This file contains tests for mozci/sources/pushlog.py."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+from mozci.errors import PushlogError
+from mozci.sources import pushlog
+
+REPO_URL = 'https://hg.mozilla.org/integration/repo'
+
+
+def _node(push_id, n=0):
+    return ('%02d%02d' % (push_id, n)) * 10
+
+
+def _pushlog(start_id, end_id):
+    """Return the json-pushes response for pushes start_id (excluded) to end_id."""
+    return {
+        'lastpushid': 10,
+        'pushes': dict(
+            (str(i), {'date': 1000 * i, 'user': 'user%d' % i,
+                      'changesets': [_node(i, 0), _node(i, 1)]})
+            for i in range(start_id + 1, min(end_id, 10) + 1))}
+
+
+def _fake_get(url, params, timeout):
+    if 'changeset' in params:
+        if not params['changeset'][:2].isdigit():
+            return Mock(status_code=404)
+        push_id = int(params['changeset'][:2])
+        data = _pushlog(push_id - 1, push_id)
+    elif 'startID' in params:
+        data = _pushlog(params['startID'], params.get('endID', 10))
+    else:
+        # The latest pushes
+        data = _pushlog(0, 10)
+    return Mock(status_code=200, json=Mock(return_value=data))
+
+
+@patch('mozci.sources.pushlog.requests.get', side_effect=_fake_get)
+class TestPushlog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        pushlog.PUSHLOG_STORE = pushlog.PushlogStore(
+            path=os.path.join(self.tmp_dir, 'pushlog.db'))
+
+    def tearDown(self):
+        pushlog.PUSHLOG_STORE = None
+        shutil.rmtree(self.tmp_dir)
+
+    def test_range_is_served_locally(self, get):
+        """Once stored, a range of pushes does not need the network."""
+        revisions = pushlog.query_pushes_by_specified_revision_range(
+            REPO_URL, _node(5, 1)[:12], before=2, after=1, return_revision_list=True)
+        # The last changeset of each push, newest first
+        self.assertEquals(revisions, [_node(6, 1), _node(5, 1), _node(4, 1), _node(3, 1)])
+        calls = get.call_count
+
+        pushes = pushlog.query_pushes_by_revision_range(REPO_URL, _node(3, 0), _node(5, 0))
+        self.assertEquals([p.id for p in pushes], [5, 4, 3])
+        self.assertEquals(pushes[0].user, 'user5')
+        self.assertEquals(pushes[0].date, 5000)
+        self.assertEquals(get.call_count, calls)
+
+    def test_only_missing_pushes_are_fetched(self, get):
+        pushlog.query_pushes_by_specified_revision_range(REPO_URL, _node(5), 1, 0)
+        pushlog.query_pushes_by_specified_revision_range(REPO_URL, _node(5), 3, 0)
+        params = get.call_args[1]['params']
+        self.assertEquals((params['startID'], params['endID']), (1, 3))
+
+    def test_valid_revision(self, get):
+        self.assertTrue(pushlog.valid_revision(REPO_URL, _node(7, 0)[:12]))
+        calls = get.call_count
+        self.assertEquals(pushlog.query_full_revision(REPO_URL, _node(7, 0)[:12]), _node(7, 0))
+        self.assertEquals(get.call_count, calls)
+        self.assertFalse(pushlog.valid_revision(REPO_URL, 'ffffffffffff'))
+
+    def test_unknown_revision_is_fetched_alone(self, get):
+        """Looking up a revision never syncs the repository."""
+        pushlog.query_repo_tip(REPO_URL)
+        get.reset_mock()
+        self.assertFalse(pushlog.valid_revision(REPO_URL, 'ffffffffffff'))
+        self.assertEquals(get.call_count, 1)
+        self.assertEquals(get.call_args[1]['params']['changeset'], 'ffffffffffff')
+
+    def test_repo_tip_syncs_newer_pushes(self, get):
+        self.assertEquals(pushlog.query_repo_tip(REPO_URL).id, 10)
+        pushlog.query_repo_tip(REPO_URL)
+        self.assertEquals(get.call_args[1]['params']['startID'], 10)
+
+    def test_unknown_revision(self, get):
+        with self.assertRaises(PushlogError):
+            pushlog.query_push_by_revision(REPO_URL, 'ffffffffffff')
@@ -0,0 +1,80 @@
+"""This file contains tests for mozci/request_coalescer.py."""
+import unittest
+
+from mock import Mock, patch
+
+from mozci.request_coalescer import RequestCoalescer
+
+BUILDER = 'Platform1 repo opt test mochitest-1'
+
+
+@patch('mozci.request_coalescer.get_credentials', return_value=('user', 'pw'))
+class TestRequestCoalescer(unittest.TestCase):
+
+    @patch('mozci.request_coalescer.make_retrigger_request')
+    def test_retriggers_are_merged(self, make_retrigger_request, get_credentials):
+        """Retriggers of a builder on a revision become one request with a count."""
+        coalescer = RequestCoalescer()
+        coalescer.retrigger('repo', 1, count=1, buildername=BUILDER, revision='rev1')
+        coalescer.retrigger('repo', 2, count=2, buildername=BUILDER, revision='rev1')
+        self.assertEquals(len(coalescer), 1)
+
+        coalescer.flush()
+        make_retrigger_request.assert_called_once_with(
+            repo_name='repo', request_id=1, auth=('user', 'pw'), count=3, dry_run=False)
+
+    @patch('mozci.request_coalescer.make_retrigger_request')
+    def test_retriggers_of_different_jobs(self, make_retrigger_request, get_credentials):
+        coalescer = RequestCoalescer()
+        coalescer.retrigger('repo', 1)
+        coalescer.retrigger('repo', 2)
+        coalescer.retrigger('repo', 1)
+        self.assertEquals(len(coalescer), 2)
+        self.assertEquals(len(coalescer.flush()), 2)
+
+    @patch('mozci.request_coalescer.trigger_arbitrary_job')
+    def test_arbitrary_jobs(self, trigger_arbitrary_job, get_credentials):
+        """Arbitrary jobs are counted together but need one request per job."""
+        response = trigger_arbitrary_job.return_value = Mock(status_code=202)
+        coalescer = RequestCoalescer()
+        coalescer.trigger('repo', BUILDER, 'rev1', count=2)
+        coalescer.trigger('repo', BUILDER, 'rev1')
+        coalescer.trigger('repo', BUILDER, 'rev2')
+        self.assertEquals(len(coalescer), 4)
+
+        self.assertEquals(coalescer.flush(), [response] * 4)
+        self.assertEquals(trigger_arbitrary_job.call_count, 4)
+        self.assertEquals(len(coalescer), 0)
+
+    @patch('mozci.request_coalescer.trigger_arbitrary_job')
+    def test_failures(self, trigger_arbitrary_job, get_credentials):
+        """on_failure is called once for a request with failed jobs."""
+        trigger_arbitrary_job.side_effect = lambda **kwargs: Mock(
+            status_code=202 if kwargs['revision'] == 'rev1' else 401)
+        on_failure = Mock()
+        coalescer = RequestCoalescer()
+        coalescer.trigger('repo', BUILDER, 'rev1', on_failure=on_failure)
+        coalescer.trigger('repo', BUILDER, 'rev2', count=2, on_failure=on_failure)
+
+        self.assertEquals(len(coalescer.flush()), 3)
+        self.assertEquals([r['revision'] for r in coalescer.failed], ['rev2', 'rev2'])
+        self.assertEquals(on_failure.call_count, 1)
+
+    @patch('mozci.request_coalescer.trigger_arbitrary_job')
+    def test_exceptions(self, trigger_arbitrary_job, get_credentials):
+        """Every request is sent even if one raises; the exception is raised afterwards."""
+        def _trigger(**kwargs):
+            if kwargs['revision'] == 'rev1':
+                raise ValueError()
+            return Mock(status_code=202)
+
+        trigger_arbitrary_job.side_effect = _trigger
+        on_failure = Mock()
+        coalescer = RequestCoalescer()
+        coalescer.trigger('repo', BUILDER, 'rev1', on_failure=on_failure)
+        coalescer.trigger('repo', BUILDER, 'rev2')
+
+        with self.assertRaises(ValueError):
+            coalescer.flush()
+        self.assertEquals(trigger_arbitrary_job.call_count, 2)
+        self.assertEquals(on_failure.call_count, 1)
@@ -0,0 +1,42 @@
+"""This file contains tests for mozci/utils/sqlite_store.py."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from mozci.utils.sqlite_store import SqliteStore
+
+
+class Store(SqliteStore):
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS items (name TEXT PRIMARY KEY)',)
+
+    def names(self):
+        conn = self._connect()
+        try:
+            return [row[0] for row in conn.execute('SELECT name FROM items ORDER BY name')]
+        finally:
+            conn.close()
+
+
+class TestSqliteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # The directory of the database is created
+        self.store = Store(os.path.join(self.tmp_dir, 'stores', 'items.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_transaction(self):
+        with self.store.transaction() as conn:
+            conn.execute('INSERT INTO items (name) VALUES (?)', ('a',))
+        self.assertEquals(self.store.names(), ['a'])
+
+    def test_rollback(self):
+        """Nothing written in a block which raises is kept."""
+        with self.assertRaises(ValueError):
+            with self.store.transaction() as conn:
+                conn.execute('INSERT INTO items (name) VALUES (?)', ('b',))
+                raise ValueError()
+        self.assertEquals(self.store.names(), [])
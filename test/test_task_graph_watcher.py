@@ -0,0 +1,49 @@
+"""This file contains tests for mozci/task_graph_watcher.py."""
+import unittest
+
+from mock import patch
+
+from mozci.task_graph_watcher import TaskGraphWatcher
+
+
+@patch('mozci.task_graph_watcher.get_task_graph_status')
+class TestTaskGraphWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.changes = []
+        self.watcher = TaskGraphWatcher(
+            callback=lambda *change: self.changes.append(change),
+            min_interval=10, max_interval=40, workers=2)
+        self.watcher.watch('graph1')
+        self.watcher.watch('graph2')
+
+    def test_callback_on_changes_only(self, get_task_graph_status):
+        get_task_graph_status.return_value = 'running'
+        self.assertEquals(self.watcher.poll(now=0), 2)
+        self.assertEquals(self.watcher.poll(now=10), 2)
+        get_task_graph_status.side_effect = \
+            lambda task_graph_id: 'finished' if task_graph_id == 'graph1' else 'running'
+        self.assertEquals(self.watcher.poll(now=30), 1)
+
+        self.assertEquals(sorted(self.changes), [
+            ('graph1', None, 'running'),
+            ('graph1', 'running', 'finished'),
+            ('graph2', None, 'running'),
+        ])
+
+    def test_backoff(self, get_task_graph_status):
+        get_task_graph_status.return_value = 'running'
+        polled = []
+        for now in range(0, 200, 5):
+            calls = get_task_graph_status.call_count
+            self.watcher.poll(now=now)
+            if get_task_graph_status.call_count > calls:
+                polled.append(now)
+
+        # The state never changes after the first poll: 10, 20, 40, 40...
+        self.assertEquals(polled, [0, 10, 30, 70, 110, 150, 190])
+
+    def test_run_until_done(self, get_task_graph_status):
+        get_task_graph_status.return_value = 'blocked'
+        self.assertEquals(self.watcher.run(timeout=60), 0)
+        self.assertEquals(len(self.changes), 2)
@@ -0,0 +1,147 @@
+"""This file contains tests for mozci/sources/tc.py."""
+import json
+import tempfile
+import unittest
+
+from StringIO import StringIO
+
+from mock import Mock, patch
+
+from mozci.sources import tc
+from mozci.sources.tc import write_task_graph
+
+
+class TestWriteTaskGraph(unittest.TestCase):
+
+    def test_valid_json(self):
+        task_graph = {
+            'scopes': ['scheduler:create-task-graph'],
+            'metadata': {'name': 'Mozci BBB graph'},
+            'tasks': [{'taskId': str(i), 'task': {'payload': {}}} for i in range(3)],
+        }
+        for indent in (None, 4):
+            output = StringIO()
+            write_task_graph(task_graph, output, indent=indent)
+            self.assertEquals(json.loads(output.getvalue()), task_graph)
+
+    def test_without_tasks(self):
+        output = StringIO()
+        write_task_graph({'metadata': {}}, output)
+        self.assertEquals(json.loads(output.getvalue()), {'metadata': {}, 'tasks': []})
+
+
+class TestGetClient(unittest.TestCase):
+
+    def setUp(self):
+        tc.configure_clients()
+
+    def tearDown(self):
+        tc.configure_clients()
+
+    @patch('mozci.sources.tc.taskcluster_client')
+    def test_clients_are_shared(self, taskcluster_client):
+        queue = tc.get_client('Queue')
+        self.assertIs(tc.get_client('Queue'), queue)
+        self.assertEquals(taskcluster_client.Queue.call_count, 1)
+
+        tc.get_client('Scheduler')
+        # Every client uses the same session
+        self.assertIs(taskcluster_client.Scheduler.call_args[1]['session'],
+                      taskcluster_client.Queue.call_args[1]['session'])
+
+    @patch('mozci.sources.tc.taskcluster_client')
+    def test_client_without_session(self, taskcluster_client):
+        """Older clients do not accept a session."""
+        queue = Mock()
+
+        def _queue(**kwargs):
+            if kwargs:
+                raise TypeError("__init__() got an unexpected keyword argument 'session'")
+            return queue
+
+        taskcluster_client.Queue.side_effect = _queue
+        self.assertIs(tc.get_client('Queue'), queue)
+
+    def test_default_timeout(self):
+        adapter = tc._TimeoutAdapter()
+        with patch('requests.adapters.HTTPAdapter.send') as send:
+            adapter.send(Mock())
+            self.assertEquals(send.call_args[1]['timeout'], tc.TC_TIMEOUT)
+            adapter.send(Mock(), timeout=5)
+            self.assertEquals(send.call_args[1]['timeout'], 5)
+
+
+def _task(task_id):
+    return {'taskId': task_id, 'metadata': {'name': task_id}, 'payload': {}}
+
+
+@patch('mozci.sources.tc.credentials_available', return_value=True)
+@patch('mozci.sources.tc._recreate_task', side_effect=lambda task_id: _task('new-' + task_id))
+class TestRetriggerTasks(unittest.TestCase):
+
+    @patch('mozci.sources.tc.schedule_graph', return_value={'status': 'ok'})
+    def test_chunked_graphs(self, schedule_graph, *args):
+        task_ids = ['task%d' % i for i in range(5)]
+        results = tc.retrigger_tasks(task_ids, workers=2, max_tasks=2)
+
+        self.assertEquals(results, dict((t, 'new-' + t) for t in task_ids))
+        self.assertEquals(
+            sorted(len(call[0][0]['tasks']) for call in schedule_graph.call_args_list),
+            [1, 2, 2])
+
+    @patch('mozci.sources.tc.schedule_graph', return_value=None)
+    def test_failed_graph(self, schedule_graph, *args):
+        self.assertEquals(tc.retrigger_tasks(['task0']), {'task0': None})
+
+    @patch('mozci.sources.tc.schedule_graph', return_value={'status': 'ok'})
+    def test_graph_per_task_group(self, schedule_graph, recreate_task, *args):
+        """Tasks of different task groups are not scheduled in the same graph."""
+        def _recreate(task_id):
+            return dict(_task('new-' + task_id), taskGroupId=task_id[:6])
+
+        recreate_task.side_effect = _recreate
+        tc.retrigger_tasks(['groupA-1', 'groupB-1', 'groupA-2'])
+        self.assertEquals(
+            sorted([t['taskId'] for t in call[0][0]['tasks']]
+                   for call in schedule_graph.call_args_list),
+            [['new-groupA-1', 'new-groupA-2'], ['new-groupB-1']])
+
+    @patch('mozci.sources.tc.handle_auth_failure')
+    @patch('mozci.sources.tc.schedule_graph')
+    def test_auth_failure(self, schedule_graph, handle_auth_failure, *args):
+        error = tc.taskcluster_client.exceptions.TaskclusterAuthFailure('Authorization Failed')
+        schedule_graph.side_effect = error
+        self.assertEquals(tc.retrigger_tasks(['task0']), {'task0': None})
+        handle_auth_failure.assert_called_once_with(error)
+
+
+class TestGraphOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.task_graph = {'metadata': {}, 'scopes': [], 'tasks': [{'taskId': 'a'}]}
+
+    def tearDown(self):
+        tc.set_graph_output()
+
+    @patch('mozci.sources.tc.write_task_graph')
+    def test_default(self, write_task_graph):
+        """Graphs are only printed in dry-run mode."""
+        tc._output_graph(self.task_graph, dry_run=False)
+        self.assertFalse(write_task_graph.called)
+        tc._output_graph(self.task_graph, dry_run=True)
+        self.assertEquals(write_task_graph.call_args[1], {'indent': 4})
+
+    @patch('mozci.sources.tc.write_task_graph')
+    def test_none(self, write_task_graph):
+        tc.set_graph_output('none')
+        tc._output_graph(self.task_graph, dry_run=True)
+        self.assertFalse(write_task_graph.called)
+
+    def test_file(self):
+        with tempfile.NamedTemporaryFile() as f:
+            tc.set_graph_output(f.name)
+            tc._output_graph(self.task_graph, dry_run=False)
+            tc._output_graph(self.task_graph, dry_run=False)
+            lines = f.read().splitlines()
+
+        self.assertEquals([json.loads(line) for line in lines], [self.task_graph] * 2)
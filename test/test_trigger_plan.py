@@ -0,0 +1,72 @@
+"""This file contains tests for mozci/trigger_plan.py."""
+import unittest
+
+from mozci.trigger_plan import (
+    ArbitraryJob,
+    BuildThenTest,
+    Retrigger,
+    Skip,
+    TriggerPlan,
+)
+
+BUILD = 'Platform1 repo build'
+
+
+def _build_then_test(test, revision='rev1', times=1):
+    return BuildThenTest('repo', revision, BUILD, test, times)
+
+
+class TestTriggerPlan(unittest.TestCase):
+
+    def test_entries_are_classified(self):
+        plan = TriggerPlan([
+            Retrigger('repo', 'rev1', 'Platform1 repo opt test mochitest-1', 1234, 2),
+            ArbitraryJob('repo', 'rev1', BUILD, [None, None], 1),
+            _build_then_test('Platform1 repo opt test mochitest-1', revision='rev2'),
+            Skip('rev3', BUILD, 'enough jobs'),
+        ])
+        self.assertEquals(len(plan.retriggers), 1)
+        self.assertEquals(len(plan.arbitrary_jobs), 1)
+        self.assertEquals(len(plan.build_then_test), 1)
+        self.assertEquals(len(plan.skips), 1)
+        self.assertEquals(len(plan.entries()), 4)
+
+    def test_invalid_entry(self):
+        with self.assertRaises(TypeError):
+            TriggerPlan().add(('not', 'an', 'entry'))
+
+    def test_build_requested_once(self):
+        """Many test jobs needing the same build only request it once per revision."""
+        plan = TriggerPlan([
+            _build_then_test('Platform1 repo opt test mochitest-1'),
+            _build_then_test('Platform1 repo opt test mochitest-2'),
+            _build_then_test('Platform1 repo opt test mochitest-1', revision='rev2'),
+        ])
+        self.assertEquals(
+            plan.requests(),
+            [ArbitraryJob('repo', 'rev1', BUILD, [None, None], 1),
+             ArbitraryJob('repo', 'rev2', BUILD, [None, None], 1)])
+        self.assertEquals(plan.summary()['build_jobs'], 2)
+        self.assertEquals(plan.summary()['waiting_for_build'], 3)
+
+    def test_build_already_requested(self):
+        """A build job requested on its own satisfies the test jobs needing it."""
+        plan = TriggerPlan([
+            _build_then_test('Platform1 repo opt test mochitest-1'),
+            ArbitraryJob('repo', 'rev1', BUILD, [None, None], 1),
+        ])
+        self.assertEquals(plan.requests(), [ArbitraryJob('repo', 'rev1', BUILD, [None, None], 1)])
+
+    def test_requests_keep_order(self):
+        retrigger = Retrigger('repo', 'rev2', 'Platform1 repo opt test mochitest-1', 1234, 1)
+        plan = TriggerPlan([
+            _build_then_test('Platform1 repo opt test mochitest-1'),
+            retrigger,
+        ])
+        self.assertEquals(plan.requests()[1], retrigger)
+
+    def test_extend(self):
+        plan = TriggerPlan([Skip('rev1', BUILD, 'enough jobs')])
+        plan.extend(TriggerPlan([Skip('rev2', BUILD, 'enough jobs')]))
+        self.assertEquals([s.revision for s in plan.skips], ['rev1', 'rev2'])
+        self.assertTrue(plan.is_empty())